@@ -1,2 +1,2 @@
-__all__ = ["models", "schemas", "crud", "database", "auth_utils", "routers"]
+__all__ = ["models", "schemas", "crud", "database", "auth_utils", "pagination", "ingest", "background", "matviews", "notifications", "cache", "pool_metrics", "autocomplete", "genres", "serialization", "export", "ratings", "progress", "leaderboard", "recommendations", "routers"]
 __version__ = "1.0.0"
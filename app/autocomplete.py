@@ -0,0 +1,128 @@
+import heapq
+import os
+from bisect import bisect_left, insort
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import select
+
+from app import models
+from app.background import SnapshotIndex
+from app.database import SessionLocal
+
+AUTOCOMPLETE_ENABLED = os.getenv("AUTOCOMPLETE_ENABLED", "true").lower() == "true"
+# Полная перестройка подхватывает изменения vote_count и правки из других процессов
+AUTOCOMPLETE_REFRESH_INTERVAL = float(os.getenv("AUTOCOMPLETE_REFRESH_INTERVAL", "300"))
+AUTOCOMPLETE_MAX_LIMIT = 20
+# Для коротких префиксов совпадений тысячи — их топ запоминается до изменения подходящего тайтла
+SHORT_PREFIX_LENGTH = 3
+
+
+class TitleEntry(NamedTuple):
+    id: int
+    type: str
+    canonical_title: str
+    russian_title: Optional[str]
+    vote_count: int
+
+
+def normalize(text: str) -> str:
+    return " ".join(text.casefold().replace("ё", "е").split())
+
+
+def _keys(entry: TitleEntry) -> List[str]:
+    """Ключи индекса: каждое название целиком и с начала каждого следующего слова"""
+    keys = set()
+    for name in (entry.canonical_title, entry.russian_title):
+        if not name:
+            continue
+        words = normalize(name).split(" ")
+        for i in range(len(words)):
+            keys.add(" ".join(words[i:]))
+    return list(keys)
+
+
+class TitleAutocompleteIndex(SnapshotIndex):
+    """
+    Префиксный индекс названий тайтлов в памяти процесса: отсортированный список
+    (ключ, id) и bisect. Подсказки упорядочены по vote_count.
+    Строится при старте, обновляется из crud при создании/изменении/удалении тайтла
+    и периодически перестраивается целиком.
+    """
+
+    name = "title-autocomplete"
+    rebuild_error = "Ошибка перестройки индекса автодополнения"
+    build_error = "Индекс автодополнения не построен, повтор через %s с"
+
+    def __init__(self, session_factory, refresh_interval: float = AUTOCOMPLETE_REFRESH_INTERVAL):
+        super().__init__(session_factory, refresh_interval)
+        self._keys: List[Tuple[str, int]] = []
+        self._titles: Dict[int, TitleEntry] = {}
+        self._short: Dict[Tuple[str, Optional[str]], List[TitleEntry]] = {}
+
+    def _load(self, db):
+        rows = db.execute(select(
+            models.Title.id, models.Title.type, models.Title.canonical_title,
+            models.Title.russian_title, models.Title.vote_count,
+        )).all()
+        titles = {r.id: TitleEntry(r.id, r.type, r.canonical_title, r.russian_title, r.vote_count or 0) for r in rows}
+        keys = sorted((key, entry.id) for entry in titles.values() for key in _keys(entry))
+        return titles, keys
+
+    def _install_locked(self, snapshot) -> None:
+        self._titles, self._keys = snapshot
+        self._short = {}
+
+    def _apply_locked(self, title_id: int, entry: Optional[TitleEntry]) -> None:
+        old = self._titles.pop(title_id, None)
+        if old is not None:
+            for key in _keys(old):
+                i = bisect_left(self._keys, (key, title_id))
+                if i < len(self._keys) and self._keys[i] == (key, title_id):
+                    del self._keys[i]
+        if entry is not None:
+            self._titles[title_id] = entry
+            for key in _keys(entry):
+                insort(self._keys, (key, title_id))
+        self._forget_short_locked(old)
+        self._forget_short_locked(entry)
+
+    def _forget_short_locked(self, entry: Optional[TitleEntry]) -> None:
+        if entry is None or not self._short:
+            return
+        prefixes = {key[:n] for key in _keys(entry) for n in range(1, SHORT_PREFIX_LENGTH + 1)}
+        for prefix in prefixes:
+            for title_type in (None, entry.type):
+                self._short.pop((prefix, title_type), None)
+
+    def upsert(self, title: models.Title) -> None:
+        entry = TitleEntry(title.id, title.type, title.canonical_title, title.russian_title, title.vote_count or 0)
+        with self._lock:
+            self._change_locked(entry.id, entry)
+
+    def remove(self, title_id: int) -> None:
+        with self._lock:
+            self._change_locked(title_id, None)
+
+    def _match_locked(self, prefix: str, title_type: Optional[str], limit: int) -> List[TitleEntry]:
+        lo = bisect_left(self._keys, (prefix,))
+        hi = bisect_left(self._keys, (prefix + "\U0010ffff",), lo)
+        candidates = (self._titles[t] for t in {title_id for _, title_id in self._keys[lo:hi]})
+        if title_type:
+            candidates = (e for e in candidates if e.type == title_type)
+        return heapq.nsmallest(limit, candidates, key=lambda e: (-e.vote_count, e.id))
+
+    def suggest(self, query: str, limit: int = 10, title_type: Optional[str] = None) -> List[TitleEntry]:
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        with self._lock:
+            if len(prefix) > SHORT_PREFIX_LENGTH:
+                return self._match_locked(prefix, title_type, limit)
+            cached = self._short.get((prefix, title_type))
+            if cached is None:
+                cached = self._match_locked(prefix, title_type, AUTOCOMPLETE_MAX_LIMIT)
+                self._short[(prefix, title_type)] = cached
+            return cached[:limit]
+
+
+index = TitleAutocompleteIndex(SessionLocal)
@@ -0,0 +1,140 @@
+import logging
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple, Type
+
+from sqlalchemy.exc import SQLAlchemyError
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicWorker:
+    """
+    Фоновый поток, вызывающий task() раз в interval секунд до stop().
+    wake() запускает следующий вызов не дожидаясь периода. Ошибки errors
+    пишутся в лог с error_message, поток продолжает работу.
+    """
+
+    def __init__(self, name: str, task: Callable[[], object], interval: float, error_message: str,
+                 wait_first: bool = False, errors: Tuple[Type[BaseException], ...] = (SQLAlchemyError,)):
+        self.name = name
+        self.task = task
+        self.interval = interval
+        self.error_message = error_message
+        # Первый вызов через interval, а не сразу после start()
+        self.wait_first = wait_first
+        self.errors = errors
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    @property
+    def stopping(self) -> bool:
+        return self._stop.is_set()
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    def _sleep(self) -> None:
+        self._wake.wait(self.interval)
+        self._wake.clear()
+
+    def _run(self) -> None:
+        if self.wait_first:
+            self._sleep()
+        while not self._stop.is_set():
+            try:
+                self.task()
+            except self.errors:
+                logger.exception(self.error_message)
+            self._sleep()
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._wake.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+class SnapshotIndex:
+    """
+    Структура в памяти процесса, которая строится из БД целиком, между перестройками
+    обновляется точечно (_change_locked) и периодически перестраивается.
+    Изменения, пришедшие во время чтения БД, применяются поверх нового снимка.
+
+    Подкласс задаёт _load (чтение БД, без блокировки), _install_locked (замена снимка)
+    и _apply_locked (одно изменение: ключ -> новое значение или None — удаление),
+    а также name, rebuild_error и build_error для потока и лога.
+    """
+
+    name = "snapshot-index"
+    rebuild_error = "Ошибка перестройки снимка"
+    build_error = "Снимок не построен, повтор через %s с"
+
+    def __init__(self, session_factory, refresh_interval: float):
+        self.session_factory = session_factory
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._changes: Optional[Dict[Hashable, Any]] = None
+        self._ready = False
+        self._worker = PeriodicWorker(self.name, self.rebuild, refresh_interval, self.rebuild_error, wait_first=True)
+
+    @property
+    def ready(self) -> bool:
+        return self._ready
+
+    def _load(self, db):
+        raise NotImplementedError
+
+    def _install_locked(self, snapshot) -> None:
+        raise NotImplementedError
+
+    def _apply_locked(self, key: Hashable, value: Any) -> None:
+        raise NotImplementedError
+
+    def _change_locked(self, key: Hashable, value: Any) -> None:
+        self._apply_locked(key, value)
+        if self._changes is not None:
+            self._changes[key] = value
+
+    def rebuild(self) -> None:
+        """Перечитать данные из БД и заменить снимок"""
+        with self._lock:
+            self._changes = {}
+        try:
+            with self.session_factory() as db:
+                snapshot = self._load(db)
+            with self._lock:
+                changes, self._changes = self._changes, None
+                self._install_locked(snapshot)
+                for key, value in changes.items():
+                    self._apply_locked(key, value)
+                self._ready = True
+        finally:
+            with self._lock:
+                self._changes = None
+
+    def start(self) -> None:
+        """Построить снимок и запустить периодическую перестройку"""
+        if self._worker.running:
+            return
+        try:
+            self.rebuild()
+        except SQLAlchemyError:
+            logger.exception(self.build_error, self.refresh_interval)
+        self._worker.start()
+
+    def stop(self) -> None:
+        self._worker.stop()
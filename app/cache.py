@@ -0,0 +1,156 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from app.notifications import TitleChangeListener, listener
+
+RANKING_CACHE_ENABLED = os.getenv("RANKING_CACHE_ENABLED", "true").lower() == "true"
+RANKING_CACHE_SIZE = int(os.getenv("RANKING_CACHE_SIZE", "1024"))
+TITLE_CACHE_ENABLED = os.getenv("TITLE_CACHE_ENABLED", "true").lower() == "true"
+TITLE_CACHE_SIZE = int(os.getenv("TITLE_CACHE_SIZE", "1000"))
+FACET_CACHE_TTL = float(os.getenv("FACET_CACHE_TTL", "60"))
+FACET_CACHE_SIZE = int(os.getenv("FACET_CACHE_SIZE", "512"))
+
+
+class RankingCache:
+    """
+    Кэш рейтинговых списков (топ аниме, популярные тайтлы) в памяти процесса.
+    Ключ — (вид списка, тип тайтлов, параметры). Запись сбрасывается по уведомлению
+    об изменении любого тайтла того же типа. Пока слушатель не подключён,
+    кэш не используется вовсе, чтобы не отдавать устаревшие списки.
+    """
+
+    def __init__(self, source: TitleChangeListener, max_entries: int = RANKING_CACHE_SIZE):
+        self.source = source
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple, Any]" = OrderedDict()
+        # Поколение на тип: результат запроса, начатого до сброса, не сохраняется
+        self._generations: Dict[str, int] = {}
+        self._epoch = 0
+        source.subscribe(lambda title_type, _title_id: self.invalidate(title_type))
+        source.on_reset(self.clear)
+
+    def invalidate(self, title_type: str) -> None:
+        with self._lock:
+            self._generations[title_type] = self._generations.get(title_type, 0) + 1
+            for key in [k for k in self._entries if k[1] == title_type]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+
+    def _generation(self, title_type: str) -> Tuple[int, int]:
+        return self._epoch, self._generations.get(title_type, 0)
+
+    async def get_or_load(self, key: Tuple[str, str, Hashable], loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Вернуть значение из кэша или дождаться loader() и запомнить результат"""
+        if not self.source.connected:
+            return await loader()
+        title_type = key[1]
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            generation = self._generation(title_type)
+        value = await loader()
+        with self._lock:
+            if self.source.connected and self._generation(title_type) == generation:
+                self._entries[key] = value
+                if len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return value
+
+
+class TitleDetailCache:
+    """
+    LRU сериализованных карточек тайтлов: id -> (ETag, JSON). Запись удаляется при
+    изменении тайтла через API и по уведомлению title_changes (правка строки, связи
+    с жанрами, пересчёт рейтинга). Без подключённого слушателя кэш не используется.
+    """
+
+    def __init__(self, source: TitleChangeListener, max_entries: int = TITLE_CACHE_SIZE,
+                 enabled: bool = TITLE_CACHE_ENABLED):
+        self.source = source
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, Tuple[str, bytes]]" = OrderedDict()
+        # Счётчик сбросов по id: загрузка, начатая до сброса, не сохраняется
+        self._versions: Dict[int, int] = {}
+        self._epoch = 0
+        source.subscribe(lambda _title_type, title_id: self.invalidate(title_id))
+        source.on_reset(self.clear)
+
+    def invalidate(self, title_id: int) -> None:
+        with self._lock:
+            self._versions[title_id] = self._versions.get(title_id, 0) + 1
+            self._entries.pop(title_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+
+    async def get_or_load(self, title_id: int,
+                          loader: Callable[[], Awaitable[Optional[Tuple[str, bytes]]]]) -> Optional[Tuple[str, bytes]]:
+        """(ETag, JSON) из кэша или от loader(); None — тайтла нет"""
+        if not (self.enabled and self.source.connected):
+            return await loader()
+        with self._lock:
+            entry = self._entries.get(title_id)
+            if entry is not None:
+                self._entries.move_to_end(title_id)
+                return entry
+            version = (self._epoch, self._versions.get(title_id, 0))
+        entry = await loader()
+        if entry is None:
+            return None
+        with self._lock:
+            if self.source.connected and (self._epoch, self._versions.get(title_id, 0)) == version:
+                self._entries[title_id] = entry
+                if len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return entry
+
+
+class TTLCache:
+    """
+    LRU-кэш с ограниченным временем жизни записи. Для данных, которым допустимо
+    отставать на ttl секунд, — например, счётчиков фасетов поиска: их меняет
+    любая оценка, и сбрасывать их по каждому уведомлению бессмысленно.
+    """
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None and cached[0] > now:
+                self._entries.move_to_end(key)
+                return cached[1]
+        value = await loader()
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+
+rankings = RankingCache(listener)
+title_details = TitleDetailCache(listener)
+facets = TTLCache(FACET_CACHE_TTL, FACET_CACHE_SIZE)
@@ -1,244 +1,830 @@
-from typing import List, Optional
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func, or_, and_
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import (
+    select, func, or_, tuple_, literal, literal_column, cast, extract, null, union_all, update, values, column,
+    Float, Integer, BigInteger, String, Numeric, case
+)
 from sqlalchemy.exc import SQLAlchemyError
-from app import models, schemas
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from app import models, schemas, autocomplete, cache, leaderboard, recommendations
+from app.database import RATING_AGGREGATION
 
 
-def get_titles(db: Session, skip: int = 0, limit: int = 100) -> List[models.Title]:
-    """Получить список тайтлов"""
+def _title_sort_key(order: str) -> tuple:
+    """Колонки ключа сортировки; по рейтингу NULL считаем -1 (литералом — под индекс idx_titles_rating_keyset)"""
+    if order == "rating":
+        return (
+            func.coalesce(models.Title.average_rating, literal_column("-1")),
+            models.Title.vote_count,
+            models.Title.id,
+        )
+    return (models.Title.id,)
+
+
+def title_keyset(title: models.Title, order: str = "id") -> list:
+    """Значения ключа сортировки для тайтла (содержимое курсора)"""
+    if order == "rating":
+        rating = title.average_rating if title.average_rating is not None else -1
+        return [str(rating), title.vote_count, title.id]
+    return [title.id]
+
+
+def parse_title_keyset(values: list, order: str = "id") -> list:
+    """Привести значения из курсора к типам колонок ключа"""
+    if len(values) != len(_title_sort_key(order)):
+        raise ValueError("Курсор не соответствует сортировке")
     try:
-        return db.query(models.Title)\
-                 .options(joinedload(models.Title.genres))\
-                 .order_by(models.Title.id)\
-                 .offset(skip)\
-                 .limit(limit)\
-                 .all()
+        if order == "rating":
+            return [Decimal(str(values[0])), int(values[1]), int(values[2])]
+        return [int(values[0])]
+    except (ArithmeticError, TypeError, ValueError) as e:
+        raise ValueError("Некорректный курсор") from e
+
+
+# Поля TitleResponse, доступные в fields=; genres собираются подзапросом
+TITLE_FIELDS = (
+    "id", "type", "canonical_title", "russian_title", "synopsis", "poster_url", "status",
+    "start_date", "end_date", "episodes_count", "volumes_count", "chapters_count",
+    "average_rating", "vote_count", "genres",
+)
+
+
+def parse_title_fields(fields: str) -> List[str]:
+    """Список полей из fields=id,canonical_title,...; ValueError на неизвестное поле"""
+    names = list(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+    unknown = [name for name in names if name not in TITLE_FIELDS]
+    if unknown:
+        raise ValueError(f"Неизвестные поля: {', '.join(unknown)}. Допустимые: {', '.join(TITLE_FIELDS)}")
+    if not names:
+        raise ValueError("Не указано ни одного поля")
+    return names
+
+
+def select_title_fields(fields: List[str], order: str = "id"):
+    """SELECT только нужных колонок тайтла (и колонок ключа сортировки) без загрузки ORM-объектов"""
+    key_fields = ["id", "average_rating", "vote_count"] if order == "rating" else ["id"]
+    columns = []
+    for name in dict.fromkeys(fields + key_fields):
+        if name == "genres":
+            names = select(models.Genre.name)\
+                      .join(models.title_genres, models.title_genres.c.genre_id == models.Genre.id)\
+                      .where(models.title_genres.c.title_id == models.Title.id)\
+                      .order_by(models.Genre.name)\
+                      .scalar_subquery()
+            columns.append(func.array(names).label("genres"))
+        else:
+            columns.append(getattr(models.Title, name))
+    return select(*columns)
+
+
+def title_row_to_dict(row, fields: List[str]) -> dict:
+    """Строка выборки select_title_fields -> словарь в форме TitleResponse"""
+    item = {}
+    for name in fields:
+        value = getattr(row, name)
+        if name == "genres":
+            value = [{"name": genre} for genre in value or ()]
+        item[name] = value
+    return item
+
+
+async def get_titles(db: AsyncSession, skip: int = 0, limit: int = 100,
+                     after: Optional[list] = None, order: str = "id",
+                     fields: Optional[List[str]] = None) -> list:
+    """
+    Получить список тайтлов: по курсору after (keyset) или через OFFSET.
+    С fields — строки только с этими колонками вместо объектов Title.
+    """
+    try:
+        key = _title_sort_key(order)
+        descending = order == "rating"
+        if fields:
+            q = select_title_fields(fields, order)
+        else:
+            q = select(models.Title)\
+                  .options(selectinload(models.Title.genres))
+        
+        if after is not None:
+            if descending:
+                q = q.where(tuple_(*key) < tuple_(*after))
+            else:
+                q = q.where(tuple_(*key) > tuple_(*after))
+        else:
+            q = q.offset(skip)
+        
+        q = q.order_by(*[c.desc() if descending else c for c in key])\
+             .limit(limit)
+        if fields:
+            return list((await db.execute(q)).all())
+        return list((await db.scalars(q)).all())
     except SQLAlchemyError as e:
-        db.rollback()
+        await db.rollback()
         raise e
 
 
-def get_title(db: Session, title_id: int) -> Optional[models.Title]:
+async def get_title(db: AsyncSession, title_id: int) -> Optional[models.Title]:
     """Получить тайтл по ID"""
     try:
-        return db.query(models.Title)\
-                 .options(joinedload(models.Title.genres))\
-                 .filter(models.Title.id == title_id)\
-                 .first()
+        q = select(models.Title)\
+              .options(selectinload(models.Title.genres))\
+              .where(models.Title.id == title_id)\
+              .execution_options(populate_existing=True)
+        return (await db.scalars(q)).first()
+    except SQLAlchemyError as e:
+        await db.rollback()
+        raise e
+
+
+async def get_title_with_version(db: AsyncSession, title_id: int) -> Optional[Tuple[models.Title, str]]:
+    """Тайтл и версия его строки (xmin) — меняется при любом UPDATE, в т.ч. genre_ids и рейтинга"""
+    try:
+        q = select(models.Title, cast(literal_column("titles.xmin"), String).label("row_version"))\
+              .options(selectinload(models.Title.genres))\
+              .where(models.Title.id == title_id)\
+              .execution_options(populate_existing=True)
+        row = (await db.execute(q)).first()
+        return (row[0], row[1]) if row else None
     except SQLAlchemyError as e:
-        db.rollback()
+        await db.rollback()
         raise e
 
 
-def create_title(db: Session, title_data: schemas.TitleCreate) -> models.Title:
+async def create_title(db: AsyncSession, title_data: schemas.TitleCreate) -> models.Title:
     """Создать новый тайтл"""
     try:
         db_title = models.Title(**title_data.model_dump())
         db.add(db_title)
-        db.commit()
-        db.refresh(db_title)
-        return db_title
+        await db.commit()
+        created = await get_title(db, db_title.id)
+        autocomplete.index.upsert(created)
+        return created
     except SQLAlchemyError as e:
-        db.rollback()
+        await db.rollback()
         raise e
 
 
-def update_title_partial(db: Session, title: models.Title, update_data: dict) -> models.Title:
+async def update_title_partial(db: AsyncSession, title: models.Title, update_data: dict) -> models.Title:
     """Частичное обновление тайтла"""
     try:
         for key, value in update_data.items():
             if hasattr(title, key) and value is not None:
                 setattr(title, key, value)
         db.add(title)
-        db.commit()
-        db.refresh(title)
-        return title
+        await db.commit()
+        cache.title_details.invalidate(title.id)
+        updated = await get_title(db, title.id)
+        autocomplete.index.upsert(updated)
+        return updated
     except SQLAlchemyError as e:
-        db.rollback()
+        await db.rollback()
         raise e
 
 
-def delete_title(db: Session, title: models.Title) -> None:
+async def delete_title(db: AsyncSession, title: models.Title) -> None:
     """Удалить тайтл"""
     try:
-        db.delete(title)
-        db.commit()
+        title_id = title.id
+        await db.delete(title)
+        await db.commit()
+        cache.title_details.invalidate(title_id)
+        autocomplete.index.remove(title_id)
     except SQLAlchemyError as e:
-        db.rollback()
+        await db.rollback()
         raise e
 
 
-def add_to_library(db: Session, lib: schemas.LibraryCreate) -> models.UserLibrary:
+# Колонки краткой карточки тайтла в выдаче библиотеки
+LIBRARY_TITLE_FIELDS = (
+    "id", "type", "canonical_title", "russian_title", "poster_url",
+    "episodes_count", "chapters_count", "volumes_count",
+)
+
+
+def _library_sort_key(order: str) -> tuple:
+    """Колонки ключа сортировки библиотеки; id записи — для однозначности"""
+    if order == "score":
+        return (func.coalesce(models.UserLibrary.user_score, literal_column("0")), models.UserLibrary.id)
+    if order == "title":
+        return (models.Title.canonical_title, models.UserLibrary.id)
+    return (models.UserLibrary.last_updated, models.UserLibrary.id)
+
+
+def library_keyset(row, order: str = "updated") -> list:
+    """Значения ключа сортировки для строки выдачи библиотеки (содержимое курсора)"""
+    entry = row.UserLibrary
+    if order == "score":
+        return [entry.user_score or 0, entry.id]
+    if order == "title":
+        return [row.canonical_title, entry.id]
+    return [entry.last_updated.isoformat(), entry.id]
+
+
+def parse_library_keyset(values: list, order: str = "updated") -> list:
+    """Привести значения из курсора к типам колонок ключа"""
+    if len(values) != 2:
+        raise ValueError("Курсор не соответствует сортировке")
+    try:
+        if order == "score":
+            return [int(values[0]), int(values[1])]
+        if order == "title":
+            return [str(values[0]), int(values[1])]
+        return [datetime.fromisoformat(values[0]), int(values[1])]
+    except (TypeError, ValueError) as e:
+        raise ValueError("Некорректный курсор") from e
+
+
+async def get_user_library(db: AsyncSession, user_id: int, status: Optional[str] = None,
+                           min_score: Optional[int] = None, max_score: Optional[int] = None,
+                           order: str = "updated", after: Optional[list] = None,
+                           limit: int = 50) -> list:
+    """
+    Записи библиотеки пользователя вместе с краткой карточкой тайтла одним запросом.
+    Сортировка по last_updated и оценке — по убыванию, по названию — по возрастанию.
+    """
+    try:
+        key = _library_sort_key(order)
+        descending = order != "title"
+        q = select(models.UserLibrary, *[getattr(models.Title, name).label(name) for name in LIBRARY_TITLE_FIELDS])\
+              .join(models.Title, models.Title.id == models.UserLibrary.title_id)\
+              .where(models.UserLibrary.user_id == user_id)
+        if status:
+            q = q.where(models.UserLibrary.status == status)
+        if min_score is not None:
+            q = q.where(models.UserLibrary.user_score >= min_score)
+        if max_score is not None:
+            q = q.where(models.UserLibrary.user_score <= max_score)
+        if after is not None:
+            if descending:
+                q = q.where(tuple_(*key) < tuple_(*after))
+            else:
+                q = q.where(tuple_(*key) > tuple_(*after))
+        q = q.order_by(*[c.desc() if descending else c for c in key])\
+             .limit(limit)
+        return list((await db.execute(q)).all())
+    except SQLAlchemyError as e:
+        await db.rollback()
+        raise e
+
+
+async def _completed_count(db: AsyncSession, user_id: int) -> Optional[int]:
+    """completed_count из user_stats в текущей транзакции (триггеры уже отработали при flush)"""
+    if not leaderboard.LEADERBOARD_ENABLED:
+        return None
+    await db.flush()
+    return await db.scalar(
+        select(models.UserStats.completed_count).where(models.UserStats.user_id == user_id)
+    ) or 0
+
+
+async def add_to_library(db: AsyncSession, lib: schemas.LibraryCreate) -> models.UserLibrary:
     """Добавить тайтл в библиотеку пользователя"""
     try:
-        existing = db.query(models.UserLibrary).filter(
+        existing = (await db.scalars(select(models.UserLibrary).where(
             models.UserLibrary.user_id == lib.user_id,
             models.UserLibrary.title_id == lib.title_id
-        ).first()
+        ))).first()
         
         if existing:
             raise ValueError("Тайтл уже в библиотеке пользователя")
         
         new_entry = models.UserLibrary(**lib.model_dump())
         db.add(new_entry)
-        db.commit()
-        db.refresh(new_entry)
+        completed = await _completed_count(db, lib.user_id) if lib.status == "completed" else None
+        await db.commit()
+        if completed is not None:
+            leaderboard.board.update(lib.user_id, completed)
+        await db.refresh(new_entry)
         return new_entry
     except SQLAlchemyError as e:
-        db.rollback()
+        await db.rollback()
         raise e
 
 
-def update_library_entry(db: Session, entry: models.UserLibrary, data: dict) -> models.UserLibrary:
+async def update_library_entry(db: AsyncSession, entry: models.UserLibrary, data: dict) -> models.UserLibrary:
     """Обновить запись в библиотеке"""
     try:
+        was_completed = entry.status == "completed"
         for key, value in data.items():
             if hasattr(entry, key) and value is not None:
                 setattr(entry, key, value)
         db.add(entry)
-        db.commit()
-        db.refresh(entry)
+        completed = None
+        if was_completed != (entry.status == "completed"):
+            completed = await _completed_count(db, entry.user_id)
+        await db.commit()
+        if completed is not None:
+            leaderboard.board.update(entry.user_id, completed)
+        await db.refresh(entry)
         return entry
     except SQLAlchemyError as e:
-        db.rollback()
+        await db.rollback()
+        raise e
+
+
+async def apply_rating_deltas(db: AsyncSession, deltas: Dict[int, Tuple[int, int]]) -> None:
+    """
+    Применить изменения (сумма оценок, число оценок) к рейтингам тайтлов одним UPDATE
+    (в режиме deferred — записать их в title_rating_deltas). То же, что делает
+    trg_calculate_rating построчно; коммит за вызывающим кодом.
+    """
+    deltas = {title_id: d for title_id, d in deltas.items() if d != (0, 0)}
+    if not deltas:
+        return
+    if RATING_AGGREGATION == "deferred":
+        db.add_all([
+            models.TitleRatingDelta(title_id=title_id, score_delta=ds, vote_delta=dc)
+            for title_id, (ds, dc) in sorted(deltas.items())
+        ])
+        await db.flush()
+        return
+    # Строки titles блокируются в порядке id — параллельные вызовы не взаимоблокируются
+    v = values(
+        column("title_id", BigInteger), column("score_delta", BigInteger), column("vote_delta", Integer),
+        name="v",
+    ).data([(title_id, ds, dc) for title_id, (ds, dc) in sorted(deltas.items())])
+    new_total = models.Title.total_score + v.c.score_delta
+    new_votes = models.Title.vote_count + v.c.vote_delta
+    await db.execute(
+        update(models.Title)
+        .where(models.Title.id == v.c.title_id)
+        .values(
+            total_score=new_total,
+            vote_count=new_votes,
+            average_rating=case(
+                (new_votes > 0, func.round(cast(new_total, Numeric) / new_votes, 2)),
+                else_=None,
+            ),
+        )
+    )
+
+
+# Попыток bulk_upsert_library при параллельной вставке тех же записей
+BULK_UPSERT_ATTEMPTS = 3
+
+
+async def _upsert_library_once(db: AsyncSession, user_id: int, by_title: Dict[int, dict]) -> Optional[Dict[int, bool]]:
+    """
+    Один проход bulk_upsert_library без коммита: {title_id: вставлена ли запись}
+    или None, если старая оценка записи неизвестна и транзакцию нужно повторить.
+    """
+    lib = models.UserLibrary
+    # Триггер trg_calculate_rating пропускает строки до конца транзакции
+    await db.execute(select(func.set_config("app.defer_rating", "on", True)))
+    # Существующие записи заблокированы до коммита — их оценки не изменятся до upsert
+    old_scores = dict((await db.execute(
+        select(lib.title_id, lib.user_score)
+        .where(lib.user_id == user_id, lib.title_id.in_(sorted(by_title)))
+        .order_by(lib.title_id)
+        .with_for_update()
+    )).all())
+
+    stmt = pg_insert(lib).values([
+        {"user_id": user_id, "title_id": title_id, "status": item["status"],
+         "progress": item["progress"], "user_score": item["user_score"]}
+        for title_id, item in sorted(by_title.items())
+    ])
+    excluded = stmt.excluded
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[lib.user_id, lib.title_id],
+        set_={"status": excluded.status, "progress": excluded.progress, "user_score": excluded.user_score},
+        where=tuple_(lib.status, lib.progress, lib.user_score).is_distinct_from(
+            tuple_(excluded.status, excluded.progress, excluded.user_score)
+        ),
+    ).returning(lib.title_id, literal_column("(xmax = 0)").label("inserted"))
+    written = dict((await db.execute(stmt)).all())
+    # Обновлённая запись, которой не было при чтении, вставлена параллельной транзакцией
+    if any(not inserted and title_id not in old_scores for title_id, inserted in written.items()):
+        return None
+
+    deltas = {}
+    for title_id, inserted in written.items():
+        new_score = by_title[title_id]["user_score"]
+        old_score = None if inserted else old_scores[title_id]
+        deltas[title_id] = (
+            (new_score or 0) - (old_score or 0),
+            (new_score is not None) - (old_score is not None),
+        )
+    await apply_rating_deltas(db, deltas)
+    return written
+
+
+async def bulk_upsert_library(db: AsyncSession, user_id: int, items: List[dict]) -> Dict[int, str]:
+    """
+    Добавить или обновить записи библиотеки пользователя одним INSERT ... ON CONFLICT.
+    Рейтинги затронутых тайтлов пересчитываются одним UPDATE вместо триггера на каждую строку.
+    Возвращает {title_id: inserted | updated | unchanged}.
+    """
+    if not items:
+        return {}
+    by_title = {item["title_id"]: item for item in items}
+    try:
+        for _ in range(BULK_UPSERT_ATTEMPTS):
+            written = await _upsert_library_once(db, user_id, by_title)
+            if written is not None:
+                break
+            # Запись вставлена параллельно между чтением старых оценок и upsert — повторяем
+            await db.rollback()
+        else:
+            raise ValueError("Библиотека пользователя изменяется параллельно, повторите запрос")
+        completed = await _completed_count(db, user_id) if written else None
+        await db.commit()
+        if completed is not None:
+            leaderboard.board.update(user_id, completed)
+    except (SQLAlchemyError, ValueError) as e:
+        await db.rollback()
         raise e
+    
+    return {
+        title_id: ("inserted" if written[title_id] else "updated") if title_id in written else "unchanged"
+        for title_id in by_title
+    }
 
 
-def get_reviews(db: Session, title_id: Optional[int] = None, 
-                skip: int = 0, limit: int = 50) -> List[models.Review]:
+async def get_reviews(db: AsyncSession, title_id: Optional[int] = None, 
+                      skip: int = 0, limit: int = 50) -> List[models.Review]:
     """Получить отзывы (с фильтром по тайтлу)"""
     try:
-        q = db.query(models.Review)\
+        q = select(models.Review)\
               .options(joinedload(models.Review.user), joinedload(models.Review.title))
         
         if title_id:
-            q = q.filter(models.Review.title_id == title_id)
+            q = q.where(models.Review.title_id == title_id)
             
-        return q.order_by(models.Review.created_at.desc())\
-                .offset(skip)\
-                .limit(limit)\
-                .all()
+        q = q.order_by(models.Review.created_at.desc())\
+             .offset(skip)\
+             .limit(limit)
+        return list((await db.scalars(q)).all())
     except SQLAlchemyError as e:
-        db.rollback()
+        await db.rollback()
         raise e
 
 
-def create_review(db: Session, review: schemas.ReviewCreate) -> models.Review:
+async def create_review(db: AsyncSession, review: schemas.ReviewCreate) -> models.Review:
     """Создать отзыв"""
     try:
-        existing = db.query(models.Review).filter(
+        existing = (await db.scalars(select(models.Review).where(
             models.Review.user_id == review.user_id,
             models.Review.title_id == review.title_id
-        ).first()
+        ))).first()
         
         if existing:
             raise ValueError("Отзыв на этот тайтл уже существует")
         
         r = models.Review(**review.model_dump())
         db.add(r)
-        db.commit()
-        db.refresh(r)
+        await db.commit()
+        await db.refresh(r)
         return r
     except SQLAlchemyError as e:
-        db.rollback()
+        await db.rollback()
         raise e
 
 
-def delete_review(db: Session, review_id: int) -> bool:
+async def delete_review(db: AsyncSession, review_id: int) -> bool:
     """Удалить отзыв по ID"""
     try:
-        review = db.query(models.Review).filter(models.Review.id == review_id).first()
+        review = await db.get(models.Review, review_id)
         if not review:
             return False
             
-        db.delete(review)
-        db.commit()
+        await db.delete(review)
+        await db.commit()
         return True
     except SQLAlchemyError as e:
-        db.rollback()
+        await db.rollback()
+        raise e
+
+
+def _title_names_document():
+    """Оба названия одной строкой — выражение индекса idx_titles_names_trgm_gist"""
+    # Скобки обязательны: у || и <<-> одинаковый приоритет
+    return (
+        models.Title.canonical_title
+        + literal_column("' '")
+        + func.coalesce(models.Title.russian_title, literal_column("''"))
+    ).self_group()
+
+
+async def search_titles_ranked(db: AsyncSession, query: str, min_score: float = 0.3,
+                               skip: int = 0, limit: int = 100) -> List[Tuple[models.Title, float]]:
+    """Поиск по названию с ранжированием по триграммной близости (KNN по GiST-индексу)"""
+    try:
+        document = _title_names_document()
+        distance = literal(query).op("<<->", return_type=Float)(document)
+        # Порог оператора <% задаётся настройкой; SET LOCAL действует до конца транзакции
+        await db.execute(select(func.set_config("pg_trgm.word_similarity_threshold", str(min_score), True)))
+        q = select(models.Title, (1 - distance).label("score"))\
+              .options(selectinload(models.Title.genres))\
+              .where(literal(query).op("<%", is_comparison=True)(document))\
+              .order_by(
+                  distance,
+                  func.greatest(
+                      func.similarity(models.Title.canonical_title, query),
+                      func.similarity(func.coalesce(models.Title.russian_title, ""), query),
+                  ).desc(),
+                  models.Title.id,
+              )\
+              .offset(skip)\
+              .limit(limit)
+        return [(title, float(score)) for title, score in (await db.execute(q)).all()]
+    except SQLAlchemyError as e:
+        await db.rollback()
+        raise e
+
+
+def title_filter_clauses(genres_all: Optional[List[int]] = None, genres_any: Optional[List[int]] = None,
+                         genres_exclude: Optional[List[int]] = None, year_start: Optional[int] = None,
+                         year_end: Optional[int] = None, status: Optional[str] = None,
+                         min_rating: Optional[float] = None) -> list:
+    """Условия WHERE расширенного поиска; жанры — через titles.genre_ids (GIN)"""
+    clauses = []
+    if genres_all:
+        clauses.append(models.Title.genre_ids.contains(genres_all))
+    if genres_any:
+        clauses.append(models.Title.genre_ids.overlap(genres_any))
+    if genres_exclude:
+        clauses.append(~models.Title.genre_ids.overlap(genres_exclude))
+    if year_start:
+        clauses.append(models.Title.start_date >= date(year_start, 1, 1))
+    if year_end:
+        clauses.append(models.Title.start_date <= date(year_end, 12, 31))
+    if status:
+        clauses.append(models.Title.status == status)
+    if min_rating and min_rating > 0:
+        clauses.append(models.Title.average_rating >= min_rating)
+    return clauses
+
+
+async def get_title_facets(db: AsyncSession, clauses: list) -> dict:
+    """
+    Счётчики по типу, статусу, году начала и жанрам для отфильтрованных тайтлов —
+    одним запросом: GROUPING SETS по колонкам тайтла и UNION ALL по развёрнутому genre_ids.
+    """
+    try:
+        filtered = select(
+                       models.Title.type,
+                       models.Title.status,
+                       cast(extract("year", models.Title.start_date), Integer).label("year"),
+                       models.Title.genre_ids,
+                   )\
+                   .where(*clauses)\
+                   .cte("filtered")
+        by_columns = select(
+                         filtered.c.type,
+                         filtered.c.status,
+                         filtered.c.year,
+                         cast(null(), BigInteger).label("genre_id"),
+                         func.grouping(filtered.c.type, filtered.c.status, filtered.c.year).label("grouping_mask"),
+                         func.count().label("cnt"),
+                     )\
+                     .group_by(func.grouping_sets(filtered.c.type, filtered.c.status, filtered.c.year, tuple_()))
+        genre_rows = select(func.unnest(filtered.c.genre_ids).label("genre_id")).subquery()
+        by_genre = select(
+                       cast(null(), String),
+                       cast(null(), String),
+                       cast(null(), Integer),
+                       genre_rows.c.genre_id,
+                       literal_column("8"),
+                       func.count(),
+                   )\
+                   .group_by(genre_rows.c.genre_id)
+        rows = (await db.execute(union_all(by_columns, by_genre))).all()
+    except SQLAlchemyError as e:
+        await db.rollback()
+        raise e
+    
+    # grouping(): бит выставлен у колонки, по которой набор НЕ группирует
+    facets = {"total": 0, "type": {}, "status": {}, "year": {}, "genre_ids": {}}
+    for type_, status, year, genre_id, grouping_mask, cnt in rows:
+        if grouping_mask == 3:
+            facets["type"][type_] = cnt
+        elif grouping_mask == 5:
+            facets["status"][status] = cnt
+        elif grouping_mask == 6 and year is not None:
+            facets["year"][year] = cnt
+        elif grouping_mask == 7:
+            facets["total"] = cnt
+        elif grouping_mask == 8:
+            facets["genre_ids"][genre_id] = cnt
+    return facets
+
+
+FULLTEXT_HEADLINE_OPTIONS = "MaxWords=35, MinWords=15, MaxFragments=2, StartSel=<b>, StopSel=</b>"
+
+
+def _fulltext_query(query: str):
+    """Запрос в синтаксисе веб-поиска: русская морфология ИЛИ слова как есть (имена, латиница)"""
+    return func.websearch_to_tsquery(literal_column("'russian'::regconfig"), query).op("||")(
+        func.websearch_to_tsquery(literal_column("'simple'::regconfig"), query)
+    )
+
+
+async def search_titles_fulltext(db: AsyncSession, query: str, highlight: bool = False,
+                                 skip: int = 0, limit: int = 20) -> List[Tuple[models.Title, float, Optional[str]]]:
+    """Полнотекстовый поиск по названиям и описанию, ранжированный ts_rank_cd"""
+    try:
+        tsquery = _fulltext_query(query)
+        # Сначала страница id по рангу, тяжёлые ts_headline — только для неё
+        page = select(
+                   models.Title.id,
+                   func.ts_rank_cd(models.Title.search_vector, tsquery, 32).label("rank"),
+               )\
+               .where(models.Title.search_vector.bool_op("@@")(tsquery))\
+               .order_by(literal_column("rank").desc(), models.Title.id)\
+               .offset(skip)\
+               .limit(limit)\
+               .subquery()
+        columns = [models.Title, page.c.rank]
+        if highlight:
+            columns.append(func.ts_headline(
+                literal_column("'russian'::regconfig"),
+                func.coalesce(models.Title.synopsis, ""),
+                tsquery,
+                FULLTEXT_HEADLINE_OPTIONS,
+            ).label("snippet"))
+        q = select(*columns)\
+              .join(page, page.c.id == models.Title.id)\
+              .options(selectinload(models.Title.genres))\
+              .order_by(page.c.rank.desc(), models.Title.id)
+        rows = (await db.execute(q)).all()
+        return [(row[0], float(row[1]), row[2] if highlight else None) for row in rows]
+    except SQLAlchemyError as e:
+        await db.rollback()
         raise e
 
 
-def get_titles_by_name(db: Session, query: str, exact: bool = False, 
-                       skip: int = 0, limit: int = 100) -> List[models.Title]:
+async def get_titles_by_name(db: AsyncSession, query: str, exact: bool = False, 
+                             skip: int = 0, limit: int = 100) -> List[models.Title]:
     """Поиск тайтлов по названию"""
     try:
-        q = db.query(models.Title)\
-              .options(joinedload(models.Title.genres))
+        q = select(models.Title)\
+              .options(selectinload(models.Title.genres))
         
         if exact:
-            q = q.filter(func.lower(models.Title.canonical_title) == query.lower())
+            q = q.where(func.lower(models.Title.canonical_title) == query.lower())
         else:
             like_pattern = f"%{query}%"
-            q = q.filter(
+            q = q.where(
                 or_(
                     models.Title.canonical_title.ilike(like_pattern),
                     models.Title.russian_title.ilike(like_pattern)
                 )
             )
             
-        return q.order_by(models.Title.id.desc())\
-                .offset(skip)\
-                .limit(limit)\
-                .all()
+        q = q.order_by(models.Title.id.desc())\
+             .offset(skip)\
+             .limit(limit)
+        return list((await db.scalars(q)).all())
     except SQLAlchemyError as e:
-        db.rollback()
+        await db.rollback()
         raise e
 
 
-def get_user_stats(db: Session, user_id: int) -> dict:
-    """Получить статистику пользователя"""
+LIBRARY_STATUSES = ("planned", "watching", "completed", "dropped", "on_hold")
+
+
+async def get_user_stats(db: AsyncSession, user_id: int) -> Optional[dict]:
+    """Получить статистику пользователя (строка user_stats); None, если пользователя нет"""
     try:
-        stats = db.query(
-            models.UserLibrary.status,
-            func.count(models.UserLibrary.id).label('count')
-        ).filter(
-            models.UserLibrary.user_id == user_id
-        ).group_by(
-            models.UserLibrary.status
-        ).all()
-        
-        avg_score = db.query(
-            func.avg(models.UserLibrary.user_score).label('avg_score')
-        ).filter(
-            models.UserLibrary.user_id == user_id,
-            models.UserLibrary.user_score.isnot(None)
-        ).scalar()
-        
-        last_active = db.query(
-            func.max(models.UserLibrary.last_updated)
-        ).filter(
-            models.UserLibrary.user_id == user_id
-        ).scalar()
-        
+        row = (await db.execute(
+            select(models.User.id, models.UserStats)
+            .outerjoin(models.UserStats, models.UserStats.user_id == models.User.id)
+            .where(models.User.id == user_id)
+        )).first()
+        if row is None:
+            return None
+        stats = row.UserStats
+        if stats is None:
+            return {'user_id': user_id, 'total_titles': 0, 'stats_by_status': {}, 'score_count': 0, 'avg_score': None, 'last_active': None}
         return {
-            'stats_by_status': {status: count for status, count in stats},
-            'avg_score': float(avg_score) if avg_score else None,
-            'last_active': last_active
+            'user_id': user_id,
+            'total_titles': stats.total_titles,
+            'stats_by_status': {
+                status: getattr(stats, f"{status}_count")
+                for status in LIBRARY_STATUSES if getattr(stats, f"{status}_count")
+            },
+            'score_count': stats.score_count,
+            'avg_score': round(stats.score_sum / stats.score_count, 2) if stats.score_count else None,
+            'last_active': stats.last_active
         }
     except SQLAlchemyError as e:
-        db.rollback()
+        await db.rollback()
         raise e
 
 
-def get_popular_titles(db: Session, title_type: str = 'anime', 
-                       limit: int = 20) -> List[models.Title]:
+async def get_similar_titles(db: AsyncSession, title_id: int, limit: int = 10) -> List[Tuple[models.Title, float]]:
+    """Похожие тайтлы из предрасчитанной title_similarities: [(Title, score)] по убыванию score"""
+    try:
+        sim = models.TitleSimilarity
+        q = select(models.Title, sim.score)\
+              .join(sim, sim.similar_title_id == models.Title.id)\
+              .options(selectinload(models.Title.genres))\
+              .where(sim.title_id == title_id)\
+              .order_by(sim.rank)\
+              .limit(limit)
+        return [(title, score) for title, score in (await db.execute(q)).all()]
+    except SQLAlchemyError as e:
+        await db.rollback()
+        raise e
+
+
+async def get_recommendations(db: AsyncSession, user_id: int, limit: int = 20) -> List[Tuple[models.Title, float]]:
+    """
+    Рекомендации пользователю: соседи из title_similarities для последних понравившихся
+    тайтлов его библиотеки, взвешенные по оценке, без уже добавленных тайтлов.
+    Читается не больше RECOMMENDATION_SEEDS x RECOMMENDATION_TOP_K строк.
+    """
+    try:
+        lib = models.UserLibrary
+        sim = models.TitleSimilarity
+        weight = recommendations.seed_weight()
+        seeds = select(lib.title_id, weight.label("weight"))\
+                  .where(lib.user_id == user_id, weight > 0)\
+                  .order_by(lib.last_updated.desc())\
+                  .limit(recommendations.RECOMMENDATION_SEEDS)\
+                  .cte("seeds")
+        in_library = select(lib.id).where(lib.user_id == user_id, lib.title_id == sim.similar_title_id)
+        score = func.sum(sim.score * seeds.c.weight).label("score")
+        candidates = select(sim.similar_title_id.label("title_id"), score)\
+                       .join(seeds, seeds.c.title_id == sim.title_id)\
+                       .where(~in_library.exists())\
+                       .group_by(sim.similar_title_id)\
+                       .order_by(score.desc(), sim.similar_title_id)\
+                       .limit(limit)\
+                       .subquery()
+        q = select(models.Title, candidates.c.score)\
+              .join(candidates, candidates.c.title_id == models.Title.id)\
+              .options(selectinload(models.Title.genres))\
+              .order_by(candidates.c.score.desc(), models.Title.id)
+        return [(title, float(score)) for title, score in (await db.execute(q)).all()]
+    except SQLAlchemyError as e:
+        await db.rollback()
+        raise e
+
+
+async def get_popular_titles(db: AsyncSession, title_type: str = 'anime', 
+                             limit: int = 20) -> List[models.Title]:
     """Получить популярные тайтлы по рейтингу"""
     try:
-        return db.query(models.Title)\
-                 .options(joinedload(models.Title.genres))\
-                 .filter(
-                     models.Title.type == title_type,
-                     models.Title.average_rating.isnot(None),
-                     models.Title.vote_count > 10  
-                 )\
-                 .order_by(
-                     models.Title.average_rating.desc(),
-                     models.Title.vote_count.desc()
-                 )\
-                 .limit(limit)\
-                 .all()
-    except SQLAlchemyError as e:
-        db.rollback()
-        raise e
\ No newline at end of file
+        q = select(models.Title)\
+              .options(selectinload(models.Title.genres))\
+              .where(
+                  models.Title.type == title_type,
+                  models.Title.average_rating.isnot(None),
+                  models.Title.vote_count > 10  
+              )\
+              .order_by(
+                  models.Title.average_rating.desc(),
+                  models.Title.vote_count.desc()
+              )\
+              .limit(limit)
+        return list((await db.scalars(q)).all())
+    except SQLAlchemyError as e:
+        await db.rollback()
+        raise e
+
+
+async def upsert_titles_chunk(db: AsyncSession, rows: List[dict], on_conflict: str = "skip") -> dict:
+    """
+    Вставить пачку тайтлов одним INSERT ... ON CONFLICT (canonical_title, type).
+    on_conflict: skip — пропустить существующие, update — обновить их поля.
+    Коммит остаётся за вызывающим кодом.
+    """
+    if not rows:
+        return {"inserted": 0, "updated": 0, "skipped": 0}
+    
+    # Один и тот же ключ дважды в одном INSERT ... ON CONFLICT DO UPDATE недопустим
+    unique = {}
+    for row in rows:
+        key = (row["canonical_title"], row["type"])
+        if on_conflict == "update" or key not in unique:
+            unique[key] = row
+    
+    stmt = pg_insert(models.Title).values(list(unique.values()))
+    if on_conflict == "update":
+        update_cols = {
+            c: stmt.excluded[c] for c in next(iter(unique.values()))
+            if c not in ("canonical_title", "type")
+        }
+        stmt = stmt.on_conflict_do_update(constraint="unique_title_type", set_=update_cols)
+    else:
+        stmt = stmt.on_conflict_do_nothing(constraint="unique_title_type")
+    # xmax = 0 только у только что вставленной версии строки
+    stmt = stmt.returning(literal_column("(xmax = 0)").label("inserted"))
+    
+    try:
+        flags = (await db.execute(stmt)).scalars().all()
+    except SQLAlchemyError as e:
+        await db.rollback()
+        raise e
+    
+    inserted = sum(1 for f in flags if f)
+    updated = len(flags) - inserted
+    return {
+        "inserted": inserted,
+        "updated": updated,
+        "skipped": len(rows) - inserted - updated,
+    }
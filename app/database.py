@@ -2,6 +2,9 @@ import os
 from dotenv import load_dotenv
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from app.pool_metrics import instrumented_pool, async_pool_metrics, sync_pool_metrics
 
 load_dotenv()
 
@@ -14,12 +17,60 @@ DB_NAME = os.getenv("DB_NAME")
 if not all([DB_USER, DB_PASSWORD, DB_HOST, DB_PORT, DB_NAME]):
     raise RuntimeError("DB configuration missing — set DB_USER/DB_PASSWORD/DB_HOST/DB_PORT/DB_NAME in environment")
 
+# Пул соединений асинхронного движка (обработчики запросов)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+
+# Пул синхронного движка (фоновые потоки, скрипты) — ему много не нужно
+DB_SYNC_POOL_SIZE = int(os.getenv("DB_SYNC_POOL_SIZE", "2"))
+DB_SYNC_MAX_OVERFLOW = int(os.getenv("DB_SYNC_MAX_OVERFLOW", "3"))
+
+# Учёт оценок в рейтинге: immediate — триггер сразу правит titles,
+# deferred — дельты в title_rating_deltas, свёртка в фоне (app/ratings.py)
+RATING_AGGREGATION = os.getenv("RATING_AGGREGATION", "immediate")
+if RATING_AGGREGATION not in ("immediate", "deferred"):
+    raise RuntimeError("RATING_AGGREGATION must be 'immediate' or 'deferred'")
+
 DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+ASYNC_DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
-engine = create_engine(DATABASE_URL, future=True)
+# Синхронный движок — для скриптов и фоновых потоков
+engine = create_engine(
+    DATABASE_URL,
+    future=True,
+    poolclass=instrumented_pool(QueuePool, sync_pool_metrics),
+    pool_size=DB_SYNC_POOL_SIZE,
+    max_overflow=DB_SYNC_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+    connect_args={"options": f"-c app.rating_aggregation={RATING_AGGREGATION}"},
+)
+sync_pool_metrics.attach(engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, future=True)
 
-def get_db():
+# Асинхронный движок — для обработчиков запросов
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    poolclass=instrumented_pool(AsyncAdaptedQueuePool, async_pool_metrics),
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+    connect_args={"server_settings": {"app.rating_aggregation": RATING_AGGREGATION}},
+)
+async_pool_metrics.attach(async_engine.sync_engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def get_sync_db():
     db = SessionLocal()
     try:
         yield db
@@ -0,0 +1,62 @@
+import csv
+import io
+import os
+import zlib
+from typing import AsyncIterator, List, Sequence
+
+from sqlalchemy import Select
+
+from app.database import AsyncSessionLocal
+from app.serialization import dump_json
+
+# Строк на одну выборку серверного курсора
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "2000"))
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, (list, tuple)):
+        return "|".join(str(v) for v in value)
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return value
+
+
+def _encode_ndjson(columns: Sequence[str], rows) -> bytes:
+    return b"".join(dump_json(dict(zip(columns, row))) + b"\n" for row in rows)
+
+
+def _encode_csv(rows) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerows([_csv_value(v) for v in row] for row in rows)
+    return buffer.getvalue().encode("utf-8")
+
+
+async def stream_export(query: Select, columns: List[str], fmt: str = "ndjson",
+                        compress: bool = False) -> AsyncIterator[bytes]:
+    """
+    Выгрузка результата запроса через серверный курсор: в памяти не больше одной
+    пачки EXPORT_BATCH_SIZE строк. Своя сессия — поток живёт дольше обработчика запроса.
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+
+    def emit(chunk: bytes) -> bytes:
+        return compressor.compress(chunk) if compressor else chunk
+
+    if fmt == "csv":
+        yield emit(_encode_csv([columns]))
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        async for rows in result.partitions():
+            chunk = emit(_encode_csv(rows) if fmt == "csv" else _encode_ndjson(columns, rows))
+            if chunk:
+                yield chunk
+    if compressor:
+        yield compressor.flush()
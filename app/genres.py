@@ -0,0 +1,72 @@
+import asyncio
+import os
+import time
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+
+# Не чаще раза в столько секунд перечитываем справочник из-за неизвестного названия
+GENRE_RELOAD_INTERVAL = float(os.getenv("GENRE_RELOAD_INTERVAL", "60"))
+
+
+def normalize(name: str) -> str:
+    return " ".join(name.casefold().replace("ё", "е").split())
+
+
+class GenreDirectory:
+    """
+    Справочник жанров в памяти процесса: нормализованное название -> id.
+    Жанров десятки и меняются они редко, поэтому таблица читается целиком
+    при первом обращении и повторно — только если встретилось незнакомое название.
+    """
+
+    def __init__(self, reload_interval: float = GENRE_RELOAD_INTERVAL):
+        self.reload_interval = reload_interval
+        self._ids: Dict[str, int] = {}
+        self._names: Dict[int, str] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    async def _load(self, db: AsyncSession) -> None:
+        rows = (await db.execute(select(models.Genre.id, models.Genre.name))).all()
+        self._ids = {normalize(r.name): r.id for r in rows}
+        self._names = {r.id: r.name for r in rows}
+        self._loaded_at = time.monotonic()
+
+    async def _ensure(self, db: AsyncSession, names: Iterable[str]) -> None:
+        if self._loaded_at is not None:
+            if all(n in self._ids for n in names):
+                return
+            if time.monotonic() - self._loaded_at < self.reload_interval:
+                return
+        async with self._lock:
+            if self._loaded_at is None or time.monotonic() - self._loaded_at >= self.reload_interval:
+                await self._load(db)
+
+    async def resolve(self, db: AsyncSession, names: Iterable[str]) -> List[int]:
+        """id жанров по точным (без учёта регистра) названиям; ValueError на неизвестное"""
+        wanted = [normalize(n) for n in names if n.strip()]
+        await self._ensure(db, wanted)
+        unknown = [n for n in wanted if n not in self._ids]
+        if unknown:
+            raise ValueError(f"Неизвестный жанр: {', '.join(unknown)}")
+        return sorted({self._ids[n] for n in wanted})
+
+    async def match(self, db: AsyncSession, fragment: str) -> List[int]:
+        """id жанров, в названии которых встречается fragment (прежний фильтр genre_name)"""
+        fragment = normalize(fragment)
+        await self._ensure(db, ())
+        return sorted(genre_id for name, genre_id in self._ids.items() if fragment in name)
+
+    def name(self, genre_id: int) -> str:
+        """Название жанра по id из последней загрузки справочника"""
+        return self._names.get(genre_id, str(genre_id))
+
+    def clear(self) -> None:
+        self._loaded_at = None
+
+
+directory = GenreDirectory()
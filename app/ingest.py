@@ -0,0 +1,187 @@
+import codecs
+import csv
+import io
+import json
+from typing import AsyncIterator, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import schemas
+
+STAGING_TABLE = "titles_staging"
+TITLE_COLUMNS = list(schemas.TitleCreate.model_fields)
+MAX_REPORTED_ERRORS = 100
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Разбить поток байтов на строки, не держа в памяти больше одной строки"""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    tail = ""
+    async for chunk in chunks:
+        tail += decoder.decode(chunk)
+        *lines, tail = tail.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    tail += decoder.decode(b"", final=True)
+    if tail:
+        yield tail.rstrip("\r")
+
+
+async def iter_ndjson_records(lines: AsyncIterator[str]) -> AsyncIterator[Tuple[int, object]]:
+    """(номер строки, объект) для NDJSON; ошибка разбора отдаётся вместо объекта"""
+    line_no = 0
+    async for line in lines:
+        line_no += 1
+        if not line.strip():
+            continue
+        try:
+            yield line_no, json.loads(line)
+        except ValueError:
+            yield line_no, ValueError("Некорректный JSON")
+
+
+async def iter_csv_records(lines: AsyncIterator[str]) -> AsyncIterator[Tuple[int, object]]:
+    """(номер строки, словарь) для CSV с заголовком; поля в кавычках могут содержать переводы строк"""
+    header = None
+    pending = []
+    start = line_no = 0
+    async for line in lines:
+        line_no += 1
+        if not pending:
+            start = line_no
+        pending.append(line)
+        record = "\n".join(pending)
+        # Нечётное число кавычек — запись продолжается на следующей строке
+        if record.count('"') % 2:
+            continue
+        pending = []
+        if not record.strip():
+            continue
+        values = next(csv.reader([record]))
+        if header is None:
+            header = [h.strip() for h in values]
+            continue
+        if len(values) != len(header):
+            yield start, ValueError("Число полей не совпадает с заголовком")
+            continue
+        yield start, {k: (v if v != "" else None) for k, v in zip(header, values)}
+    if pending:
+        yield start, ValueError("Незакрытая кавычка в конце файла")
+
+
+class TitleStreamLoader:
+    """
+    Потоковая загрузка тайтлов: строки проверяются по TitleCreate,
+    пачками уходят через COPY во временную таблицу, в конце сливаются в titles.
+    """
+
+    def __init__(self, db: AsyncSession, on_conflict: str = "skip", batch_size: int = 5000):
+        self.db = db
+        self.on_conflict = on_conflict
+        self.batch_size = batch_size
+        self.accepted = 0
+        self.rejected = 0
+        self.errors = []
+        self._ord = 0
+        self._buffered = 0
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer, lineterminator="\n")
+
+    async def begin(self) -> None:
+        """Создать временную таблицу (удаляется при COMMIT/ROLLBACK)"""
+        cols = ", ".join(TITLE_COLUMNS)
+        await self.db.execute(text(
+            f"CREATE TEMP TABLE {STAGING_TABLE} ON COMMIT DROP AS "
+            f"SELECT 0::bigint AS ord, {cols} FROM titles WITH NO DATA"
+        ))
+
+    def reject(self, line_no: int, message: str) -> None:
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line_no, "error": message})
+
+    def add(self, line_no: int, raw: object) -> bool:
+        """Проверить строку и положить в буфер; True — пора вызвать flush()"""
+        if isinstance(raw, Exception):
+            self.reject(line_no, str(raw))
+            return False
+        try:
+            title = schemas.TitleCreate.model_validate(raw)
+        except ValidationError as e:
+            self.reject(line_no, "; ".join(err["msg"] for err in e.errors()))
+            return False
+        # Иначе chk_title_type_consistency уронит слияние целиком
+        if title.type == "anime" and (title.volumes_count is not None or title.chapters_count is not None):
+            self.reject(line_no, "У аниме не может быть томов и глав")
+            return False
+        if title.type == "manga" and title.episodes_count is not None:
+            self.reject(line_no, "У манги не может быть эпизодов")
+            return False
+
+        self._ord += 1
+        self._writer.writerow([self._ord] + [getattr(title, c) for c in TITLE_COLUMNS])
+        self._buffered += 1
+        self.accepted += 1
+        return self._buffered >= self.batch_size
+
+    async def flush(self) -> None:
+        """Отправить накопленный буфер через COPY и очистить его"""
+        if not self._buffered:
+            return
+        # COPY идёт по тому же соединению, что и транзакция сессии, иначе временной таблицы не видно
+        conn = await self.db.connection()
+        raw = (await conn.get_raw_connection()).driver_connection
+        await raw.copy_to_table(
+            STAGING_TABLE,
+            source=io.BytesIO(self._buffer.getvalue().encode()),
+            columns=["ord"] + TITLE_COLUMNS,
+            format="csv",
+        )
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        self._buffered = 0
+
+    async def merge(self) -> dict:
+        """Слить временную таблицу в titles по unique_title_type, вернуть счётчики"""
+        cols = ", ".join(TITLE_COLUMNS)
+        # skip — побеждает первая строка с ключом, update — последняя
+        direction = "DESC" if self.on_conflict == "update" else "ASC"
+        if self.on_conflict == "update":
+            assignments = ", ".join(
+                f"{c} = EXCLUDED.{c}" for c in TITLE_COLUMNS if c not in ("canonical_title", "type")
+            )
+            conflict = f"DO UPDATE SET {assignments}"
+        else:
+            conflict = "DO NOTHING"
+        row = (await self.db.execute(text(f"""
+            WITH src AS (
+                SELECT DISTINCT ON (canonical_title, type) {cols}
+                FROM {STAGING_TABLE}
+                ORDER BY canonical_title, type, ord {direction}
+            ), ins AS (
+                INSERT INTO titles ({cols})
+                SELECT {cols} FROM src
+                ON CONFLICT ON CONSTRAINT unique_title_type {conflict}
+                RETURNING (xmax = 0) AS inserted
+            )
+            SELECT COUNT(*) FILTER (WHERE inserted) AS inserted,
+                   COUNT(*) FILTER (WHERE NOT inserted) AS updated
+            FROM ins
+        """))).one()
+        return {"inserted": row.inserted, "updated": row.updated}
+
+    async def finish(self) -> dict:
+        """Дослать остаток, слить и закоммитить"""
+        await self.flush()
+        counts = await self.merge()
+        await self.db.commit()
+        return {
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "inserted": counts["inserted"],
+            "updated": counts["updated"],
+            "skipped": self.accepted - counts["inserted"] - counts["updated"],
+            "errors": self.errors,
+        }
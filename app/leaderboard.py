@@ -0,0 +1,165 @@
+import os
+from bisect import bisect_left, insort
+from typing import Dict, List, NamedTuple, Optional
+
+from sqlalchemy import select, func
+
+from app import models
+from app.background import SnapshotIndex
+from app.database import SessionLocal
+
+LEADERBOARD_ENABLED = os.getenv("LEADERBOARD_ENABLED", "true").lower() == "true"
+# Полная перестройка подхватывает изменения из других процессов
+LEADERBOARD_REFRESH_INTERVAL = float(os.getenv("LEADERBOARD_REFRESH_INTERVAL", "300"))
+LEADERBOARD_MAX_WINDOW = 50
+
+
+class Position(NamedTuple):
+    user_id: int
+    completed_count: int
+    # Место с учётом равенства: 1 + число пользователей с большим completed_count
+    rank: int
+    total: int
+
+
+class FenwickTree:
+    """Дерево Фенвика: число пользователей в каждой корзине completed_count"""
+
+    def __init__(self, counts: List[int]):
+        self.size = len(counts)
+        self._tree = [0] + list(counts)
+        for i in range(1, self.size + 1):
+            parent = i + (i & -i)
+            if parent <= self.size:
+                self._tree[parent] += self._tree[i]
+
+    def add(self, index: int, delta: int) -> None:
+        i = index + 1
+        while i <= self.size:
+            self._tree[i] += delta
+            i += i & -i
+
+    def prefix(self, index: int) -> int:
+        """Сумма корзин 0..index включительно"""
+        i = min(index, self.size - 1) + 1
+        total = 0
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def find(self, k: int) -> int:
+        """Наименьшая корзина, в которой prefix() достигает k (k от 1)"""
+        pos = 0
+        step = 1 << self.size.bit_length()
+        while step:
+            nxt = pos + step
+            if nxt <= self.size and self._tree[nxt] < k:
+                pos = nxt
+                k -= self._tree[nxt]
+            step >>= 1
+        return pos
+
+
+class Leaderboard(SnapshotIndex):
+    """
+    Рейтинг пользователей по числу завершённых тайтлов в памяти процесса.
+    Порядок — completed_count по убыванию, затем user_id. Число пользователей
+    в каждой корзине completed_count хранится в дереве Фенвика, поэтому место
+    и перцентиль — O(log n) без COUNT(*) по user_stats. Строится при старте,
+    обновляется из crud после изменения библиотеки и периодически перестраивается целиком.
+    """
+
+    name = "user-leaderboard"
+    rebuild_error = "Ошибка перестройки рейтинга пользователей"
+    build_error = "Рейтинг пользователей не построен, повтор через %s с"
+
+    def __init__(self, session_factory, refresh_interval: float = LEADERBOARD_REFRESH_INTERVAL):
+        super().__init__(session_factory, refresh_interval)
+        self._counts: Dict[int, int] = {}
+        # Корзина completed_count -> user_id по возрастанию
+        self._buckets: Dict[int, List[int]] = {}
+        self._tree = FenwickTree([0])
+
+    def _load(self, db):
+        rows = db.execute(
+            select(models.User.id, func.coalesce(models.UserStats.completed_count, 0))
+            .outerjoin(models.UserStats, models.UserStats.user_id == models.User.id)
+            .order_by(models.User.id)
+        ).all()
+        counts = {user_id: completed for user_id, completed in rows}
+        buckets: Dict[int, List[int]] = {}
+        for user_id, completed in rows:
+            buckets.setdefault(completed, []).append(user_id)
+        sizes = [0] * (max(buckets, default=0) + 1)
+        for completed, users in buckets.items():
+            sizes[completed] = len(users)
+        return counts, buckets, FenwickTree(sizes)
+
+    def _install_locked(self, snapshot) -> None:
+        self._counts, self._buckets, self._tree = snapshot
+
+    def _apply_locked(self, user_id: int, completed: Optional[int]) -> None:
+        old = self._counts.pop(user_id, None)
+        if old is not None:
+            bucket = self._buckets[old]
+            del bucket[bisect_left(bucket, user_id)]
+            if not bucket:
+                del self._buckets[old]
+            self._tree.add(old, -1)
+        if completed is not None:
+            if completed >= self._tree.size:
+                self._grow_locked(completed)
+            self._counts[user_id] = completed
+            insort(self._buckets.setdefault(completed, []), user_id)
+            self._tree.add(completed, 1)
+
+    def _grow_locked(self, completed: int) -> None:
+        sizes = [0] * max(completed + 1, self._tree.size * 2)
+        for count, users in self._buckets.items():
+            sizes[count] = len(users)
+        self._tree = FenwickTree(sizes)
+
+    def update(self, user_id: int, completed: int) -> None:
+        with self._lock:
+            if self._counts.get(user_id) != completed:
+                self._change_locked(user_id, completed)
+
+    def remove(self, user_id: int) -> None:
+        with self._lock:
+            self._change_locked(user_id, None)
+
+    def _position_locked(self, user_id: int) -> Optional[Position]:
+        completed = self._counts.get(user_id)
+        if completed is None:
+            return None
+        total = len(self._counts)
+        return Position(user_id, completed, total - self._tree.prefix(completed) + 1, total)
+
+    def position(self, user_id: int) -> Optional[Position]:
+        """Место пользователя; None, если его нет в рейтинге"""
+        with self._lock:
+            return self._position_locked(user_id)
+
+    def _at_locked(self, index: int) -> int:
+        """user_id на позиции index (с 0) в порядке рейтинга"""
+        # Дерево упорядочено по возрастанию completed_count, рейтинг — по убыванию
+        k = len(self._counts) - index
+        completed = self._tree.find(k)
+        offset = k - (self._tree.prefix(completed - 1) if completed else 0)
+        bucket = self._buckets[completed]
+        return bucket[len(bucket) - offset]
+
+    def around(self, user_id: int, window: int) -> Optional[List[Position]]:
+        """Пользователь и до window соседей выше и ниже по рейтингу"""
+        with self._lock:
+            me = self._position_locked(user_id)
+            if me is None:
+                return None
+            completed = me.completed_count
+            index = len(self._counts) - self._tree.prefix(completed) + bisect_left(self._buckets[completed], user_id)
+            start, end = max(0, index - window), min(len(self._counts), index + window + 1)
+            return [self._position_locked(self._at_locked(i)) for i in range(start, end)]
+
+
+board = Leaderboard(SessionLocal)
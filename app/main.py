@@ -1,10 +1,42 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from app.routers import titles, users, library, analytics, batch, reviews
+from app.routers import titles, users, library, analytics, batch, reviews, metrics, export
+from app import matviews, notifications, cache, auth_utils, autocomplete, ratings, progress, leaderboard
+from app.database import async_engine
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if matviews.MATVIEW_REFRESH_ENABLED:
+        matviews.refresher.start()
+    if cache.RANKING_CACHE_ENABLED or cache.TITLE_CACHE_ENABLED:
+        notifications.listener.start()
+    if autocomplete.AUTOCOMPLETE_ENABLED:
+        autocomplete.index.start()
+    if ratings.DEFERRED:
+        ratings.compactor.start()
+    if progress.LIBRARY_PROGRESS_COALESCE:
+        progress.buffer.start()
+    if leaderboard.LEADERBOARD_ENABLED:
+        leaderboard.board.start()
+    yield
+    leaderboard.board.stop()
+    if progress.LIBRARY_PROGRESS_COALESCE:
+        progress.buffer.stop()
+    if ratings.DEFERRED:
+        ratings.compactor.stop()
+    autocomplete.index.stop()
+    notifications.listener.stop()
+    matviews.refresher.stop()
+    auth_utils.hasher.shutdown()
+    await async_engine.dispose()
+
 
 app = FastAPI(
     title="Anime Library API",
     description="",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 @app.get("/")
@@ -19,7 +51,9 @@ def read_root():
             "library": "/library",
             "analytics": "/analytics",
             "batch_import": "/api/batch-import/titles",
-            "reviews": "/reviews"
+            "reviews": "/reviews",
+            "metrics": "/metrics/pool",
+            "export": "/export/titles"
         }
     }
 
@@ -29,3 +63,5 @@ app.include_router(library.router)
 app.include_router(analytics.router)
 app.include_router(batch.router)
 app.include_router(reviews.router)
+app.include_router(metrics.router)
+app.include_router(export.router)
@@ -0,0 +1,117 @@
+import os
+import time
+from typing import Dict, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.background import PeriodicWorker
+from app.database import SessionLocal
+
+MATERIALIZED_VIEWS = ("view_genre_popularity",)
+
+# Допустимый возраст снимка, секунды
+MATVIEW_MAX_STALENESS = float(os.getenv("MATVIEW_MAX_STALENESS", "60"))
+MATVIEW_REFRESH_ENABLED = os.getenv("MATVIEW_REFRESH_ENABLED", "true").lower() == "true"
+# Сколько секунд известный возраст снимка считается актуальным без повторного чтения matview_refresh_log
+MATVIEW_AGE_CACHE_TTL = float(os.getenv("MATVIEW_AGE_CACHE_TTL", "5"))
+
+
+class MatviewRefresher:
+    """
+    Фоновое обновление материализованных представлений.
+    Представление обновляется через REFRESH ... CONCURRENTLY, как только его снимок
+    старше max_staleness. Время обновления хранится в matview_refresh_log, поэтому
+    несколько процессов приложения не обновляют одно представление дважды.
+    """
+
+    def __init__(self, session_factory, views=MATERIALIZED_VIEWS, max_staleness: float = MATVIEW_MAX_STALENESS):
+        self.session_factory = session_factory
+        self.views = views
+        self.max_staleness = max_staleness
+        self.check_interval = max(1.0, max_staleness / 4)
+        # Момент обновления по time.monotonic() — не зависит от расхождения часов с БД
+        self._refreshed: Dict[str, float] = {}
+        # Когда _refreshed представления последний раз сверялось с БД
+        self._checked: Dict[str, float] = {}
+        self._worker = PeriodicWorker("matview-refresher", self.refresh_stale, self.check_interval,
+                                      "Ошибка обновления материализованных представлений")
+
+    def snapshot_age(self, view: str) -> Optional[float]:
+        """Возраст снимка в секундах или None, если он ещё неизвестен"""
+        refreshed = self._refreshed.get(view)
+        if refreshed is None:
+            return None
+        return time.monotonic() - refreshed
+
+    def _remember(self, view: str, age: float) -> None:
+        now = time.monotonic()
+        self._refreshed[view] = now - age
+        self._checked[view] = now
+
+    async def current_age(self, db: AsyncSession, view: str) -> Optional[float]:
+        """
+        Возраст снимка для ответа. Без фонового обновления (или до его первого прохода)
+        известного значения нет или оно устарело — читаем matview_refresh_log и кэшируем ненадолго.
+        """
+        checked = self._checked.get(view)
+        if checked is not None and time.monotonic() - checked < MATVIEW_AGE_CACHE_TTL:
+            return self.snapshot_age(view)
+        age = (await db.execute(text("""
+            SELECT EXTRACT(EPOCH FROM clock_timestamp() - refreshed_at)
+            FROM matview_refresh_log
+            WHERE view_name = :view
+        """), {"view": view})).scalar()
+        if age is None:
+            return None
+        self._remember(view, float(age))
+        return float(age)
+
+    def _load_ages(self, db) -> Dict[str, float]:
+        rows = db.execute(text("""
+            SELECT view_name, EXTRACT(EPOCH FROM clock_timestamp() - refreshed_at) AS age
+            FROM matview_refresh_log
+        """)).all()
+        ages = {r.view_name: float(r.age) for r in rows}
+        for view, age in ages.items():
+            self._remember(view, age)
+        return ages
+
+    def refresh(self, view: str) -> bool:
+        """Обновить представление, если никто другой не делает это прямо сейчас"""
+        with self.session_factory() as db:
+            locked = db.execute(
+                text("SELECT pg_try_advisory_xact_lock(hashtext(:view))"), {"view": view}
+            ).scalar()
+            if not locked:
+                return False
+            # Пока ждали блокировку, снимок мог обновить другой процесс
+            age = self._load_ages(db).get(view)
+            if age is not None and age < self.max_staleness:
+                return False
+            db.execute(text(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {view}"))
+            db.execute(text("""
+                INSERT INTO matview_refresh_log (view_name, refreshed_at)
+                VALUES (:view, clock_timestamp())
+                ON CONFLICT (view_name) DO UPDATE SET refreshed_at = EXCLUDED.refreshed_at
+            """), {"view": view})
+            db.commit()
+            self._remember(view, 0.0)
+            return True
+
+    def refresh_stale(self) -> None:
+        with self.session_factory() as db:
+            ages = self._load_ages(db)
+        for view in self.views:
+            age = ages.get(view)
+            if age is None or age >= self.max_staleness:
+                self.refresh(view)
+
+    def start(self) -> None:
+        self._worker.start()
+
+    def stop(self) -> None:
+        self._worker.stop()
+
+
+refresher = MatviewRefresher(SessionLocal)
@@ -1,10 +1,11 @@
 from sqlalchemy import (
     Column, String, Date, Text, Numeric, Boolean, ForeignKey, Table,
-    DateTime, func, UniqueConstraint, BigInteger, Integer, CheckConstraint
+    DateTime, func, UniqueConstraint, BigInteger, Integer, CheckConstraint, Computed,
+    SmallInteger, REAL
 )
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, deferred
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR, ARRAY
 
 Base = declarative_base()
 metadata = Base.metadata
@@ -68,13 +69,24 @@ class Title(Base):
     total_score = Column(BigInteger, nullable=False, default=0, server_default="0")
     vote_count = Column(Integer, nullable=False, default=0, server_default="0")
     average_rating = Column(Numeric(4, 2), nullable=True)
+    # id жанров из title_genres, ведётся триггером в БД — только для фильтрации
+    genre_ids = deferred(Column(ARRAY(BigInteger), nullable=False, server_default="{}"))
+    updated_at = Column(DateTime, server_default=func.now())
+    # Генерируется БД (см. init.sql), в обычных выборках не загружается
+    search_vector = deferred(Column(TSVECTOR, Computed(
+        "setweight(to_tsvector('russian'::regconfig, COALESCE(russian_title, '')), 'A') || "
+        "setweight(to_tsvector('simple'::regconfig, canonical_title || ' ' || COALESCE(russian_title, '')), 'A') || "
+        "setweight(to_tsvector('russian'::regconfig, COALESCE(synopsis, '')), 'B') || "
+        "setweight(to_tsvector('simple'::regconfig, COALESCE(synopsis, '')), 'B')",
+        persisted=True,
+    )))
     
-    # Отношения
-    genres = relationship("Genre", secondary=title_genres, back_populates="titles")
-    studios = relationship("Studio", secondary=title_studios, back_populates="titles")
-    authors = relationship("Author", secondary=title_authors, back_populates="titles")
-    reviews = relationship("Review", back_populates="title", cascade="all, delete-orphan")
-    library_entries = relationship("UserLibrary", back_populates="title", cascade="all, delete-orphan")
+    # Отношения; каскадное удаление выполняет БД (ON DELETE), поэтому passive_deletes
+    genres = relationship("Genre", secondary=title_genres, back_populates="titles", passive_deletes=True)
+    studios = relationship("Studio", secondary=title_studios, back_populates="titles", passive_deletes=True)
+    authors = relationship("Author", secondary=title_authors, back_populates="titles", passive_deletes=True)
+    reviews = relationship("Review", back_populates="title", cascade="all, delete-orphan", passive_deletes=True)
+    library_entries = relationship("UserLibrary", back_populates="title", cascade="all, delete-orphan", passive_deletes=True)
 
 class User(Base):
     __tablename__ = "users"
@@ -90,13 +102,28 @@ class User(Base):
     created_at = Column(DateTime, server_default=func.now(), nullable=False)
     is_active = Column(Boolean, nullable=False, default=True, server_default="true")
     
-    reviews = relationship("Review", back_populates="user", cascade="all, delete-orphan")
-    library = relationship("UserLibrary", back_populates="user", cascade="all, delete-orphan")
-    profile = relationship("UserProfile", back_populates="user", uselist=False, cascade="all, delete-orphan")
-    audit_logs = relationship("AuditLog", back_populates="user")
-    reports_filed = relationship("Report", foreign_keys="Report.reporter_user_id", back_populates="reporter")
-    reports_received = relationship("Report", foreign_keys="Report.reported_user_id", back_populates="reported")
-    reports_resolved = relationship("Report", foreign_keys="Report.resolved_by", back_populates="resolver")
+    reviews = relationship("Review", back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
+    library = relationship("UserLibrary", back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
+    profile = relationship("UserProfile", back_populates="user", uselist=False, cascade="all, delete-orphan", passive_deletes=True)
+    audit_logs = relationship("AuditLog", back_populates="user", passive_deletes=True)
+    reports_filed = relationship("Report", foreign_keys="Report.reporter_user_id", back_populates="reporter", passive_deletes=True)
+    reports_received = relationship("Report", foreign_keys="Report.reported_user_id", back_populates="reported", passive_deletes=True)
+    reports_resolved = relationship("Report", foreign_keys="Report.resolved_by", back_populates="resolver", passive_deletes=True)
+
+# Сводка по библиотеке пользователя; ведётся триггерами trg_sync_user_stats_* (init.sql)
+class UserStats(Base):
+    __tablename__ = "user_stats"
+    
+    user_id = Column(BigInteger, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    total_titles = Column(Integer, nullable=False, default=0, server_default="0")
+    planned_count = Column(Integer, nullable=False, default=0, server_default="0")
+    watching_count = Column(Integer, nullable=False, default=0, server_default="0")
+    completed_count = Column(Integer, nullable=False, default=0, server_default="0")
+    dropped_count = Column(Integer, nullable=False, default=0, server_default="0")
+    on_hold_count = Column(Integer, nullable=False, default=0, server_default="0")
+    score_sum = Column(BigInteger, nullable=False, default=0, server_default="0")
+    score_count = Column(Integer, nullable=False, default=0, server_default="0")
+    last_active = Column(DateTime, nullable=True)
 
 class UserProfile(Base):
     __tablename__ = "user_profiles"
@@ -145,6 +172,25 @@ class UserLibrary(Base):
     user = relationship("User", back_populates="library")
     title = relationship("Title", back_populates="library_entries")
 
+# Несвёрнутые изменения оценок тайтла (RATING_AGGREGATION=deferred), см. app/ratings.py
+class TitleRatingDelta(Base):
+    __tablename__ = "title_rating_deltas"
+    
+    id = Column(BigInteger, primary_key=True)
+    title_id = Column(BigInteger, ForeignKey("titles.id", ondelete="CASCADE"), nullable=False, index=True)
+    score_delta = Column(BigInteger, nullable=False)
+    vote_delta = Column(Integer, nullable=False)
+    created_at = Column(DateTime, server_default=func.now())
+
+# Предрасчитанные похожие тайтлы, см. build_recommendations.py
+class TitleSimilarity(Base):
+    __tablename__ = "title_similarities"
+    
+    title_id = Column(BigInteger, ForeignKey("titles.id", ondelete="CASCADE"), primary_key=True)
+    rank = Column(SmallInteger, primary_key=True)
+    similar_title_id = Column(BigInteger, ForeignKey("titles.id", ondelete="CASCADE"), nullable=False, index=True)
+    score = Column(REAL, nullable=False)
+
 class Studio(Base):
     __tablename__ = "studios"
     __table_args__ = (
@@ -0,0 +1,87 @@
+import logging
+import select
+from typing import Callable, List
+
+import psycopg2
+
+from app.background import PeriodicWorker
+from app.database import DATABASE_URL
+
+logger = logging.getLogger(__name__)
+
+# Канал, в который триггер trg_notify_title_changes пишет "<type>:<id>"
+TITLE_CHANNEL = "title_changes"
+
+
+class TitleChangeListener:
+    """
+    Слушает LISTEN title_changes на отдельном соединении и раздаёт события подписчикам.
+    Пока соединения нет, события могут теряться — поэтому при разрыве вызываются
+    обработчики on_reset, а кэши по свойству connected понимают, можно ли себе доверять.
+    """
+
+    def __init__(self, dsn: str = DATABASE_URL, channel: str = TITLE_CHANNEL, retry_delay: float = 2.0):
+        self.dsn = dsn
+        self.channel = channel
+        self.retry_delay = retry_delay
+        self._subscribers: List[Callable[[str, int], None]] = []
+        self._reset_handlers: List[Callable[[], None]] = []
+        self._connected = False
+        # Переподключение через retry_delay после разрыва
+        self._worker = PeriodicWorker("title-change-listener", self._listen, retry_delay,
+                                      f"Соединение LISTEN {channel} потеряно", errors=(psycopg2.Error,))
+
+    @property
+    def connected(self) -> bool:
+        return self._connected
+
+    def subscribe(self, callback: Callable[[str, int], None]) -> None:
+        """callback(title_type, title_id) на каждое изменение тайтла"""
+        self._subscribers.append(callback)
+
+    def on_reset(self, callback: Callable[[], None]) -> None:
+        """callback() при потере или восстановлении соединения"""
+        self._reset_handlers.append(callback)
+
+    def _reset(self) -> None:
+        for handler in self._reset_handlers:
+            handler()
+
+    def _dispatch(self, payload: str) -> None:
+        title_type, _, title_id = payload.partition(":")
+        try:
+            title_id = int(title_id)
+        except ValueError:
+            logger.warning("Неожиданное уведомление %r", payload)
+            return
+        for callback in self._subscribers:
+            callback(title_type, title_id)
+
+    def _listen(self) -> None:
+        conn = psycopg2.connect(self.dsn)
+        try:
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {self.channel}")
+            # Всё, что изменилось до LISTEN, могло пройти мимо
+            self._reset()
+            self._connected = True
+            while not self._worker.stopping:
+                if select.select([conn], [], [], 1.0) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    self._dispatch(conn.notifies.pop(0).payload)
+        finally:
+            self._connected = False
+            self._reset()
+            conn.close()
+
+    def start(self) -> None:
+        self._worker.start()
+
+    def stop(self) -> None:
+        self._worker.stop()
+
+
+listener = TitleChangeListener()
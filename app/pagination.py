@@ -0,0 +1,21 @@
+import base64
+import json
+from typing import Any, List
+
+
+def encode_cursor(values: List[Any]) -> str:
+    """Упаковать ключ последней записи страницы в непрозрачный курсор"""
+    raw = json.dumps(values, separators=(",", ":"), default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> List[Any]:
+    """Распаковать курсор; ValueError, если курсор повреждён"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError) as e:
+        raise ValueError("Некорректный курсор") from e
+    if not isinstance(values, list):
+        raise ValueError("Некорректный курсор")
+    return values
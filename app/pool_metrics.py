@@ -0,0 +1,146 @@
+import threading
+import time
+from typing import Dict, Sequence, Type
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import Pool
+
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+HOLD_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+LIFETIME_BUCKETS = (1, 10, 60, 300, 900, 1800, 3600, 7200, 86400)
+
+
+class Histogram:
+    """Накопительная гистограмма с фиксированными границами (как в Prometheus)"""
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self) -> dict:
+        buckets = {}
+        cumulative = 0
+        for bound, n in zip(self.bounds, self.counts):
+            cumulative += n
+            buckets[str(bound)] = cumulative
+        buckets["+Inf"] = self.count
+        return {"count": self.count, "sum": round(self.sum, 6), "buckets": buckets}
+
+
+class PoolMetrics:
+    """
+    Метрики пула соединений, собираемые событиями пула SQLAlchemy:
+    время ожидания и удержания соединения, время жизни соединений, таймауты.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self.checkout_wait = Histogram(WAIT_BUCKETS)
+        self.checkout_hold = Histogram(HOLD_BUCKETS)
+        self.connection_lifetime = Histogram(LIFETIME_BUCKETS)
+        self.timeouts = 0
+        self.connections_opened = 0
+        self.connections_closed = 0
+        self.invalidated = 0
+        # id записи пула -> момент открытия, для возраста живых соединений
+        self._open: Dict[int, float] = {}
+
+    def observe_wait(self, seconds: float, timed_out: bool = False) -> None:
+        with self._lock:
+            self.checkout_wait.observe(seconds)
+            if timed_out:
+                self.timeouts += 1
+
+    def _on_connect(self, dbapi_connection, record) -> None:
+        now = time.monotonic()
+        record.info["opened_at"] = now
+        with self._lock:
+            self.connections_opened += 1
+            self._open[id(record)] = now
+
+    def _on_close(self, dbapi_connection, record) -> None:
+        with self._lock:
+            opened_at = self._open.pop(id(record), None)
+            self.connections_closed += 1
+            if opened_at is not None:
+                self.connection_lifetime.observe(time.monotonic() - opened_at)
+
+    def _on_invalidate(self, dbapi_connection, record, exception) -> None:
+        with self._lock:
+            self.invalidated += 1
+
+    def _on_checkout(self, dbapi_connection, record, proxy) -> None:
+        record.info["checked_out_at"] = time.monotonic()
+
+    def _on_checkin(self, dbapi_connection, record) -> None:
+        checked_out_at = record.info.pop("checked_out_at", None)
+        if checked_out_at is not None:
+            with self._lock:
+                self.checkout_hold.observe(time.monotonic() - checked_out_at)
+
+    def attach(self, engine: Engine) -> None:
+        """Подписаться на события пула движка (переживают engine.dispose())"""
+        event.listen(engine, "connect", self._on_connect)
+        event.listen(engine, "close", self._on_close)
+        event.listen(engine, "invalidate", self._on_invalidate)
+        event.listen(engine, "checkout", self._on_checkout)
+        event.listen(engine, "checkin", self._on_checkin)
+
+    def snapshot(self, pool: Pool) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            ages = [now - t for t in self._open.values()]
+            return {
+                "pool_class": type(pool).__bases__[0].__name__,
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "idle": pool.checkedin(),
+                "overflow": max(0, pool.overflow()),
+                "max_overflow": getattr(pool, "_max_overflow", None),
+                "timeouts": self.timeouts,
+                "connections_opened": self.connections_opened,
+                "connections_closed": self.connections_closed,
+                "invalidated": self.invalidated,
+                "open_connections": len(ages),
+                "oldest_connection_age_seconds": round(max(ages), 3) if ages else None,
+                "checkout_wait_seconds": self.checkout_wait.snapshot(),
+                "checkout_hold_seconds": self.checkout_hold.snapshot(),
+                "connection_lifetime_seconds": self.connection_lifetime.snapshot(),
+            }
+
+
+def instrumented_pool(pool_cls: Type[Pool], metrics: PoolMetrics) -> Type[Pool]:
+    """
+    Подкласс пула, замеряющий ожидание свободного соединения.
+    Событие checkout срабатывает уже после ожидания, поэтому время меряется вокруг _do_get.
+    """
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = pool_cls._do_get(self)
+        except PoolTimeoutError:
+            metrics.observe_wait(time.perf_counter() - started, timed_out=True)
+            raise
+        metrics.observe_wait(time.perf_counter() - started)
+        return connection
+
+    return type(f"Instrumented{pool_cls.__name__}", (pool_cls,), {"_do_get": _do_get})
+
+
+async_pool_metrics = PoolMetrics("async")
+sync_pool_metrics = PoolMetrics("sync")
@@ -0,0 +1,123 @@
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import BigInteger, DateTime, Integer, cast, column, func, or_, select, update, values
+from sqlalchemy.exc import SQLAlchemyError
+
+from app import models
+from app.background import PeriodicWorker
+from app.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+LIBRARY_PROGRESS_COALESCE = os.getenv("LIBRARY_PROGRESS_COALESCE", "false").lower() == "true"
+# Период сброса буфера прогресса, миллисекунды
+LIBRARY_PROGRESS_FLUSH_MS = int(os.getenv("LIBRARY_PROGRESS_FLUSH_MS", "1000"))
+# Строк в одном UPDATE и число записей, после которого сброс начинается не дожидаясь периода
+LIBRARY_PROGRESS_BATCH = int(os.getenv("LIBRARY_PROGRESS_BATCH", "1000"))
+LIBRARY_PROGRESS_MAX_PENDING = int(os.getenv("LIBRARY_PROGRESS_MAX_PENDING", "10000"))
+
+Key = Tuple[int, int]
+
+
+class ProgressBuffer:
+    """
+    Буфер изменений progress в user_library: по каждой паре (user_id, title_id)
+    хранится последнее значение, буфер периодически сбрасывается пачками
+    UPDATE ... FROM (VALUES ...). Промежуточные значения в БД не попадают.
+    """
+
+    def __init__(self, session_factory, flush_ms: int = LIBRARY_PROGRESS_FLUSH_MS,
+                 batch: int = LIBRARY_PROGRESS_BATCH, max_pending: int = LIBRARY_PROGRESS_MAX_PENDING):
+        self.session_factory = session_factory
+        self.interval = flush_ms / 1000
+        self.batch = batch
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        # Ключ -> (прогресс, отметка времени забора из буфера для значений, возвращённых после ошибки)
+        self._pending: Dict[Key, Tuple[int, Optional[datetime]]] = {}
+        self._worker = PeriodicWorker("library-progress", self.flush, self.interval,
+                                      "Ошибка сброса буфера прогресса", wait_first=True)
+
+    def put(self, user_id: int, title_id: int, progress: int) -> None:
+        with self._lock:
+            self._pending[(user_id, title_id)] = (progress, None)
+            overflow = len(self._pending) >= self.max_pending
+        if overflow:
+            self._worker.wake()
+
+    def get(self, user_id: int, title_id: int) -> Optional[int]:
+        with self._lock:
+            entry = self._pending.get((user_id, title_id))
+        return entry[0] if entry else None
+
+    def pop(self, user_id: int, title_id: int) -> Optional[int]:
+        """Забрать несохранённый прогресс записи — его запишет обычное обновление"""
+        with self._lock:
+            entry = self._pending.pop((user_id, title_id), None)
+        return entry[0] if entry else None
+
+    def _write(self, rows) -> int:
+        v = values(
+            column("user_id", BigInteger), column("title_id", BigInteger), column("progress", Integer),
+            column("taken_at", DateTime),
+            name="v",
+        ).data(rows)
+        with self.session_factory() as db:
+            result = db.execute(
+                update(models.UserLibrary)
+                .where(
+                    models.UserLibrary.user_id == v.c.user_id,
+                    models.UserLibrary.title_id == v.c.title_id,
+                    models.UserLibrary.progress.is_distinct_from(v.c.progress),
+                    # Запись, обновлённая после того как значение забрано из буфера, новее его
+                    or_(models.UserLibrary.last_updated.is_(None), models.UserLibrary.last_updated <= v.c.taken_at),
+                )
+                .values(progress=v.c.progress)
+            )
+            db.commit()
+            return result.rowcount
+
+    def flush(self) -> int:
+        """Записать накопленный прогресс; вернуть число обновлённых строк"""
+        if not self._pending:
+            return 0
+        # Время БД до того, как буфер забран: обычное обновление, не нашедшее значения
+        # в буфере, получит last_updated (clock_timestamp() в триггере) позже этой отметки
+        with self.session_factory() as db:
+            taken_at = db.scalar(select(cast(func.clock_timestamp(), DateTime)))
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        # Порядок по ключу — параллельные сбросы из разных процессов блокируют строки одинаково
+        rows = sorted(
+            (user_id, title_id, progress, since or taken_at)
+            for (user_id, title_id), (progress, since) in pending.items()
+        )
+        written = 0
+        for i in range(0, len(rows), self.batch):
+            chunk = rows[i:i + self.batch]
+            try:
+                written += self._write(chunk)
+            except SQLAlchemyError:
+                # Несохранённое возвращаем в буфер с прежней отметкой, если поверх не пришло более новое значение
+                with self._lock:
+                    for user_id, title_id, progress, since in rows[i:]:
+                        self._pending.setdefault((user_id, title_id), (progress, since))
+                raise
+        return written
+
+    def start(self) -> None:
+        self._worker.start()
+
+    def stop(self) -> None:
+        self._worker.stop()
+        try:
+            self.flush()
+        except SQLAlchemyError:
+            logger.exception("Ошибка сброса буфера прогресса при остановке")
+
+
+buffer = ProgressBuffer(SessionLocal)
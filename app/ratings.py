@@ -0,0 +1,123 @@
+import logging
+import os
+from typing import Optional, Tuple
+
+from sqlalchemy import select, func, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from app import models
+from app.background import PeriodicWorker
+from app.database import SessionLocal, RATING_AGGREGATION
+
+logger = logging.getLogger(__name__)
+
+DEFERRED = RATING_AGGREGATION == "deferred"
+# Период свёртки дельт, миллисекунды, и сколько дельт сворачивать за раз
+RATING_COMPACT_INTERVAL_MS = int(os.getenv("RATING_COMPACT_INTERVAL_MS", "500"))
+RATING_COMPACT_BATCH = int(os.getenv("RATING_COMPACT_BATCH", "50000"))
+
+COMPACT_SQL = text("""
+    WITH folded AS (
+        DELETE FROM title_rating_deltas
+        WHERE id IN (SELECT id FROM title_rating_deltas ORDER BY id LIMIT :batch)
+        RETURNING title_id, score_delta, vote_delta
+    ), agg AS (
+        SELECT title_id, SUM(score_delta) AS score_delta, SUM(vote_delta) AS vote_delta
+        FROM folded
+        GROUP BY title_id
+    ), updated AS (
+        UPDATE titles t
+        SET total_score = t.total_score + agg.score_delta,
+            vote_count = t.vote_count + agg.vote_delta,
+            average_rating = CASE
+                WHEN t.vote_count + agg.vote_delta > 0
+                THEN ROUND((t.total_score + agg.score_delta)::DECIMAL / (t.vote_count + agg.vote_delta), 2)
+                ELSE NULL
+            END
+        FROM agg
+        WHERE t.id = agg.title_id
+          AND (agg.score_delta <> 0 OR agg.vote_delta <> 0)
+        RETURNING 1
+    )
+    SELECT (SELECT COUNT(*) FROM folded) AS folded, (SELECT COUNT(*) FROM updated) AS updated
+""")
+
+
+class RatingCompactor:
+    """
+    Свёртка title_rating_deltas в titles.total_score/vote_count/average_rating.
+    Оценки пишутся в таблицу дельт без блокировки строки тайтла; здесь каждая горячая
+    строка обновляется один раз за период, сколько бы оценок ни пришло.
+    Advisory-блокировка не даёт нескольким процессам сворачивать одновременно.
+    """
+
+    def __init__(self, session_factory, interval_ms: int = RATING_COMPACT_INTERVAL_MS,
+                 batch: int = RATING_COMPACT_BATCH):
+        self.session_factory = session_factory
+        self.interval = interval_ms / 1000
+        self.batch = batch
+        self._worker = PeriodicWorker("rating-compactor", self._compact_all, self.interval,
+                                      "Ошибка свёртки дельт рейтинга")
+
+    def compact(self) -> int:
+        """Свернуть одну пачку дельт; вернуть число свёрнутых дельт (0 — нечего или занято другим процессом)"""
+        with self.session_factory() as db:
+            locked = db.execute(
+                text("SELECT pg_try_advisory_xact_lock(hashtext('title_rating_deltas'))")
+            ).scalar()
+            if not locked:
+                return 0
+            folded = db.execute(COMPACT_SQL, {"batch": self.batch}).one().folded
+            db.commit()
+            return folded
+
+    def _compact_all(self) -> None:
+        # Полная пачка — за ней, вероятно, есть ещё: сворачиваем без паузы
+        while self.compact() >= self.batch and not self._worker.stopping:
+            pass
+
+    def start(self) -> None:
+        self._worker.start()
+
+    def stop(self) -> None:
+        self._worker.stop()
+        # Остаток дельт при остановке — чтобы рейтинги не ждали следующего запуска
+        try:
+            self.compact()
+        except SQLAlchemyError:
+            logger.exception("Ошибка свёртки дельт рейтинга при остановке")
+
+
+async def get_title_exact(db: AsyncSession, title_id: int) -> Optional[Tuple[models.Title, int, int]]:
+    """
+    Тайтл и его ещё не свёрнутые (сумма, число) оценок — для точного чтения.
+    Одним запросом: свёртка, закоммиченная между двумя отдельными чтениями, дала бы
+    в сумме недосчёт или двойной учёт дельт.
+    """
+    delta = models.TitleRatingDelta
+    pending = (
+        select(
+            delta.title_id,
+            func.sum(delta.score_delta).label("score_delta"),
+            func.sum(delta.vote_delta).label("vote_delta"),
+        )
+        .where(delta.title_id == title_id)
+        .group_by(delta.title_id)
+        .subquery()
+    )
+    row = (await db.execute(
+        select(models.Title, pending.c.score_delta, pending.c.vote_delta)
+        .outerjoin(pending, pending.c.title_id == models.Title.id)
+        .options(selectinload(models.Title.genres))
+        .where(models.Title.id == title_id)
+        .execution_options(populate_existing=True)
+    )).first()
+    if row is None:
+        return None
+    title, ds, dc = row
+    return title, int(ds or 0), int(dc or 0)
+
+
+compactor = RatingCompactor(SessionLocal)
@@ -0,0 +1,48 @@
+import os
+
+from sqlalchemy import case, literal_column
+
+from app import models
+
+# Похожих тайтлов на тайтл в title_similarities
+RECOMMENDATION_TOP_K = int(os.getenv("RECOMMENDATION_TOP_K", "50"))
+# Сколько последних записей библиотеки пользователя берётся основой рекомендаций
+RECOMMENDATION_SEEDS = int(os.getenv("RECOMMENDATION_SEEDS", "50"))
+
+# Вес записи без оценки по статусу; с оценкой вес — user_score / 10
+STATUS_WEIGHTS = {
+    "completed": 0.7,
+    "watching": 0.6,
+    "on_hold": 0.4,
+    "planned": 0.2,
+    "dropped": 0.1,
+}
+
+# Оценки не выше этой и брошенные тайтлы не служат основой рекомендаций
+NEUTRAL_SCORE = 5
+
+
+def _status_weight(column):
+    return case(
+        *[(column == status, literal_column(repr(weight))) for status, weight in STATUS_WEIGHTS.items()],
+        else_=literal_column("0.0"),
+    )
+
+
+def interaction_weight():
+    """Вес записи user_library в матрице пользователь x тайтл (для офлайн-сборки)"""
+    lib = models.UserLibrary
+    return case(
+        (lib.user_score.isnot(None), lib.user_score / literal_column("10.0")),
+        else_=_status_weight(lib.status),
+    )
+
+
+def seed_weight():
+    """Вес тайтла из библиотеки как основы рекомендаций: положительный — тайтл понравился"""
+    lib = models.UserLibrary
+    return case(
+        (lib.status == "dropped", literal_column("0.0")),
+        (lib.user_score.isnot(None), (lib.user_score - NEUTRAL_SCORE) / literal_column(f"{10 - NEUTRAL_SCORE}.0")),
+        else_=_status_weight(lib.status),
+    )
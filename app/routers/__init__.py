@@ -4,5 +4,7 @@ from . import library
 from . import analytics
 from . import batch
 from . import reviews
+from . import metrics
+from . import export
 
-__all__ = ["titles", "users", "library", "analytics", "batch", "reviews"]
+__all__ = ["titles", "users", "library", "analytics", "batch", "reviews", "metrics", "export"]
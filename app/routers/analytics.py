@@ -1,20 +1,37 @@
-from fastapi import APIRouter, Depends, Query, HTTPException
-from typing import List
-from sqlalchemy.orm import Session
-from sqlalchemy import text
-from app import schemas, models 
+from fastapi import APIRouter, Depends, Query, HTTPException, Response
+from typing import List, Optional
+from datetime import datetime, timezone
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, text, tuple_
+from app import schemas, models, pagination, matviews, cache, leaderboard
 from app.database import get_db
 
 router = APIRouter(prefix="/analytics", tags=["analytics"])
 
+async def _set_snapshot_age(response: Response, db: AsyncSession, view: str) -> None:
+    age = await matviews.refresher.current_age(db, view)
+    if age is not None:
+        response.headers["X-Snapshot-Age"] = str(int(age))
+
+def _top_percent(position: leaderboard.Position) -> float:
+    """Доля пользователей не ниже этого места, в процентах ("входит в топ N%")"""
+    return round(position.rank / position.total * 100, 2)
+
+def _naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """audit_log.event_timestamp без часового пояса (UTC), asyncpg не сравнивает его с aware-датой"""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
 @router.get("/top-anime", response_model=List[schemas.TopAnimeView])
-def get_top_anime(
+async def get_top_anime(
     skip: int = Query(0, ge=0, description="Количество записей для пропуска"),
     limit: int = Query(10, ge=1, le=100, description="Количество записей для возврата"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Получить топ аниме.
+    Результат кэшируется в памяти до изменения любого аниме (LISTEN title_changes).
     """
     try:
         q = text("""
@@ -22,41 +39,50 @@ def get_top_anime(
             FROM view_top_anime 
             LIMIT :lim OFFSET :off
         """)
-        rows = db.execute(q, {"lim": limit, "off": skip}).mappings().all()
-        return [dict(r) for r in rows]
+        async def load():
+            rows = (await db.execute(q, {"lim": limit, "off": skip})).mappings().all()
+            return [dict(r) for r in rows]
+        
+        return await cache.rankings.get_or_load(("top_anime", "anime", skip, limit), load)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"DB error: {str(e)}")
 
 @router.get("/user-stats", response_model=List[schemas.UserStatsResponse])
-def get_user_stats(
+async def get_user_stats(
     skip: int = Query(0, ge=0, description="Количество записей для пропуска"),
     limit: int = Query(100, ge=1, le=500, description="Количество записей для возврата"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Сортировка по количеству завершенных тайтлов.
+    Данные из user_stats (ведётся триггерами), порядок — по индексу idx_user_stats_completed.
     """
     try:
         q = text("""
-            SELECT id, username, total_titles, completed_count, avg_score, last_active 
-            FROM view_user_stats 
-            ORDER BY completed_count DESC 
+            SELECT s.user_id AS id, u.username, s.total_titles, s.completed_count,
+                   COALESCE(ROUND(s.score_sum::DECIMAL / NULLIF(s.score_count, 0), 2), 0) AS avg_score,
+                   s.last_active
+            FROM user_stats s
+            JOIN users u ON u.id = s.user_id
+            ORDER BY s.completed_count DESC, s.user_id
             LIMIT :lim OFFSET :off
         """)
-        rows = db.execute(q, {"lim": limit, "off": skip}).mappings().all()
+        rows = (await db.execute(q, {"lim": limit, "off": skip})).mappings().all()
         return [dict(r) for r in rows]
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"DB error: {str(e)}")
 
 @router.get("/genre-popularity", response_model=List[schemas.GenrePopularityResponse])
-def get_genre_popularity(
+async def get_genre_popularity(
+    response: Response,
     min_titles: int = Query(10, ge=1, description="Минимальное количество тайтлов в жанре"),
     skip: int = Query(0, ge=0, description="Количество записей для пропуска"),
     limit: int = Query(100, ge=1, le=500, description="Количество записей для возврата"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Получить популярность жанров.
+    Данные из материализованного представления; возраст снимка — в заголовке X-Snapshot-Age.
     """
     try:
         q = text("""
@@ -66,62 +92,142 @@ def get_genre_popularity(
             ORDER BY titles_count DESC
             LIMIT :lim OFFSET :off
         """)
-        rows = db.execute(q, {"min_titles": min_titles, "lim": limit, "off": skip}).mappings().all()
+        rows = (await db.execute(q, {"min_titles": min_titles, "lim": limit, "off": skip})).mappings().all()
+        await _set_snapshot_age(response, db, "view_genre_popularity")
         return [dict(r) for r in rows]
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"DB error: {str(e)}")
 
 @router.get("/audit-log", response_model=List[schemas.AuditLogResponse])
-def get_audit_log(
-    skip: int = Query(0, ge=0, description="Количество записей для пропуска"),
+async def get_audit_log(
+    response: Response,
+    skip: int = Query(0, ge=0, description="Количество записей для пропуска (устаревший режим, игнорируется при before)"),
     limit: int = Query(100, ge=1, le=500, description="Количество записей для возврата"),
-    db: Session = Depends(get_db)
+    before: Optional[str] = Query(None, description="Курсор (event_timestamp, id) из заголовка X-Next-Cursor"),
+    date_from: Optional[datetime] = Query(None, alias="from", description="События не раньше этого момента"),
+    date_to: Optional[datetime] = Query(None, alias="to", description="События раньше этого момента"),
+    entity_type: Optional[str] = Query(None, description="Тип сущности"),
+    action_type: Optional[str] = Query(None, description="Тип действия"),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Получить журнал аудита.
     Сортировка по времени события (новые сначала).
+    Если страница заполнена, курсор следующей возвращается в заголовке X-Next-Cursor.
     """
+    date_from, date_to = _naive_utc(date_from), _naive_utc(date_to)
+    if date_from and date_to and date_from >= date_to:
+        raise HTTPException(status_code=400, detail="Начало интервала должно быть раньше конца")
+    
     try:
-        return db.query(models.AuditLog) \
-                 .order_by(models.AuditLog.event_timestamp.desc()) \
-                 .offset(skip) \
-                 .limit(limit) \
-                 .all()
+        key = (models.AuditLog.event_timestamp, models.AuditLog.id)
+        q = select(models.AuditLog)
+        
+        if entity_type:
+            q = q.where(models.AuditLog.entity_type == entity_type)
+        if action_type:
+            q = q.where(models.AuditLog.action_type == action_type)
+        if date_from:
+            q = q.where(models.AuditLog.event_timestamp >= date_from)
+        if date_to:
+            q = q.where(models.AuditLog.event_timestamp < date_to)
+        
+        if before:
+            values = pagination.decode_cursor(before)
+            try:
+                ts, last_id = datetime.fromisoformat(values[0]), int(values[1])
+            except (IndexError, TypeError, ValueError) as e:
+                raise ValueError("Некорректный курсор") from e
+            q = q.where(tuple_(*key) < tuple_(ts, last_id))
+        else:
+            q = q.offset(skip)
+        
+        entries = (await db.scalars(q.order_by(*[c.desc() for c in key]).limit(limit))).all()
+        if len(entries) == limit:
+            last = entries[-1]
+            response.headers["X-Next-Cursor"] = pagination.encode_cursor(
+                [last.event_timestamp.isoformat(), last.id]
+            )
+        return entries
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"DB error: {str(e)}")
     
 @router.get("/user/{user_id}/rank", response_model=schemas.UserRankResponse)
-def get_user_rank(
+async def get_user_rank(
     user_id: int,
     include_stats: bool = Query(False, description="Включить количество завершённых тайтлов"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Получить ранг пользователя по количеству завершённых тайтлов.
+    Место среди всех пользователей и доля лучших (top_percent) — из рейтинга в памяти.
     """
     try:
-        q = text("SELECT get_user_rank(:user_id)")
-        rank = db.execute(q, {"user_id": user_id}).scalar()
+        q = text("""
+            SELECT get_user_rank(:user_id) AS rank,
+                   (SELECT completed_count FROM user_stats WHERE user_id = :user_id) AS completed_count
+        """)
+        row = (await db.execute(q, {"user_id": user_id})).one()
         
-        if rank == "Пользователь не найден":
+        if row.rank == "Пользователь не найден":
             raise HTTPException(status_code=404, detail="Пользователь не найден")
         
         response_data = {
             "user_id": user_id,
-            "rank": rank
+            "rank": row.rank
         }
         
         if include_stats:
-            stats_q = text("""
-                SELECT COUNT(*) 
-                FROM user_library 
-                WHERE user_id = :user_id AND status = 'completed'
-            """)
-            completed_count = db.execute(stats_q, {"user_id": user_id}).scalar()
-            response_data["completed_count"] = completed_count
+            response_data["completed_count"] = row.completed_count or 0
+        
+        position = leaderboard.board.position(user_id) if leaderboard.board.ready else None
+        if position is not None:
+            response_data["position"] = position.rank
+            response_data["total_users"] = position.total
+            response_data["top_percent"] = _top_percent(position)
         
         return response_data
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Ошибка базы данных: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Ошибка базы данных: {str(e)}")
+
+@router.get("/leaderboard/around/{user_id}", response_model=schemas.LeaderboardAround)
+async def get_leaderboard_around(
+    user_id: int,
+    window: int = Query(5, ge=0, le=leaderboard.LEADERBOARD_MAX_WINDOW, description="Соседей выше и ниже"),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Место пользователя в рейтинге по завершённым тайтлам и его соседи.
+    Равные completed_count делят одно место; порядок внутри — по id пользователя.
+    """
+    if not leaderboard.board.ready:
+        raise HTTPException(status_code=503, detail="Рейтинг пользователей ещё не построен", headers={"Retry-After": "5"})
+    entries = leaderboard.board.around(user_id, window)
+    if entries is None:
+        raise HTTPException(status_code=404, detail="Пользователь не найден")
+    try:
+        usernames = dict((await db.execute(
+            select(models.User.id, models.User.username).where(models.User.id.in_([e.user_id for e in entries]))
+        )).all())
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ошибка базы данных: {str(e)}")
+    
+    items = [
+        schemas.LeaderboardEntry(
+            user_id=e.user_id,
+            username=usernames.get(e.user_id),
+            completed_count=e.completed_count,
+            position=e.rank,
+            top_percent=_top_percent(e),
+        )
+        for e in entries
+    ]
+    return schemas.LeaderboardAround(
+        total_users=entries[0].total,
+        user=next(item for item in items if item.user_id == user_id),
+        entries=items,
+    )
@@ -1,43 +1,83 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.exc import SQLAlchemyError
 from typing import List
 
-from app import schemas, models
+from app import schemas, crud, ingest
 from app.database import get_db
 
 router = APIRouter(prefix="/batch", tags=["batch"])
 
 @router.post("/titles")
-def batch_insert_titles(titles: List[schemas.TitleCreate], db: Session = Depends(get_db)):
+async def batch_insert_titles(
+    titles: List[schemas.TitleCreate],
+    on_conflict: str = Query("skip", pattern="^(skip|update)$", description="Дубликаты: skip — пропустить, update — обновить"),
+    chunk_size: int = Query(1000, ge=1, le=5000, description="Размер пачки для одного INSERT"),
+    db: AsyncSession = Depends(get_db)
+):
     """
     Батчевая загрузка тайтлов
-    Пропуск дубликатов по (canonical_title, type)
+    Дубликаты по (canonical_title, type) разрешаются в БД через ON CONFLICT
     """
     inserted = 0
+    updated = 0
     skipped = 0
+    chunks = []
     
-    for title_data in titles:
-        existing = db.query(models.Title).filter(
-            models.Title.canonical_title == title_data.canonical_title,
-            models.Title.type == title_data.type
-        ).first()
-        
-        if existing:
-            skipped += 1
-            continue  
-        
-        try:
-            db_title = models.Title(**title_data.model_dump())
-            db.add(db_title)
-            inserted += 1
-        except Exception as e:
-            skipped += 1
-    
-    db.commit()
+    try:
+        for start in range(0, len(titles), chunk_size):
+            rows = [t.model_dump() for t in titles[start:start + chunk_size]]
+            result = await crud.upsert_titles_chunk(db, rows, on_conflict)
+            chunks.append({"offset": start, "size": len(rows), **result})
+            inserted += result["inserted"]
+            updated += result["updated"]
+            skipped += result["skipped"]
+        await db.commit()
+    except SQLAlchemyError as e:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail=f"Ошибка базы данных: {str(e)}")
     
     return {
         "status": "success",
-        "message": f"Добавлено {inserted} тайтлов, пропущено {skipped} (дубликаты/ошибки)",
+        "message": f"Добавлено {inserted} тайтлов, обновлено {updated}, пропущено {skipped} (дубликаты)",
         "inserted": inserted,
-        "skipped": skipped
-    }
\ No newline at end of file
+        "updated": updated,
+        "skipped": skipped,
+        "chunks": chunks
+    }
+
+
+@router.post("/titles/stream")
+async def stream_insert_titles(
+    request: Request,
+    fmt: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$", description="Формат тела: ndjson или csv с заголовком"),
+    on_conflict: str = Query("skip", pattern="^(skip|update)$", description="Дубликаты: skip — пропустить, update — обновить"),
+    batch_size: int = Query(5000, ge=100, le=50000, description="Строк в одной порции COPY"),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Потоковая загрузка каталога произвольного размера.
+    Тело читается по частям, строки проверяются по TitleCreate и через COPY
+    попадают во временную таблицу, которая в конце сливается в titles.
+    Некорректные строки пропускаются и попадают в отчёт.
+    """
+    loader = ingest.TitleStreamLoader(db, on_conflict, batch_size)
+    lines = ingest.iter_lines(request.stream())
+    records = ingest.iter_csv_records(lines) if fmt == "csv" else ingest.iter_ndjson_records(lines)
+    
+    try:
+        await loader.begin()
+        async for line_no, raw in records:
+            if loader.add(line_no, raw):
+                await loader.flush()
+        result = await loader.finish()
+    except SQLAlchemyError as e:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail=f"Ошибка базы данных: {str(e)}")
+    
+    return {
+        "status": "success",
+        "message": f"Добавлено {result['inserted']} тайтлов, обновлено {result['updated']}, "
+                   f"пропущено {result['skipped']} (дубликаты), отклонено {result['rejected']}",
+        **result
+    }
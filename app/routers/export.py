@@ -0,0 +1,63 @@
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+
+from app import models, crud
+from app.export import MEDIA_TYPES, stream_export
+
+router = APIRouter(prefix="/export", tags=["export"])
+
+TITLE_EXPORT_FIELDS = list(crud.TITLE_FIELDS) + ["updated_at"]
+LIBRARY_EXPORT_FIELDS = ["id", "user_id", "title_id", "status", "progress", "user_score", "last_updated"]
+
+def _export_response(request: Request, query, columns, fmt: str, name: str) -> StreamingResponse:
+    compress = "gzip" in request.headers.get("accept-encoding", "").lower()
+    headers = {
+        "Content-Disposition": f'attachment; filename="{name}.{fmt}"',
+        "Vary": "Accept-Encoding",
+    }
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        stream_export(query, columns, fmt=fmt, compress=compress),
+        media_type=MEDIA_TYPES[fmt],
+        headers=headers,
+    )
+
+@router.get("/titles")
+async def export_titles(
+    request: Request,
+    fmt: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$", description="Формат: ndjson или csv"),
+    updated_since: Optional[datetime] = Query(None, description="Только тайтлы, изменённые с этого момента"),
+    title_type: Optional[str] = Query(None, alias="type", pattern="^(anime|manga)$", description="Тип тайтлов"),
+):
+    """
+    Выгрузка всего каталога одним потоком (NDJSON или CSV, жанры в CSV через |).
+    Строки читаются серверным курсором по id; при Accept-Encoding: gzip поток сжимается.
+    """
+    query = crud.select_title_fields(TITLE_EXPORT_FIELDS)
+    if updated_since:
+        query = query.where(models.Title.updated_at >= updated_since)
+    if title_type:
+        query = query.where(models.Title.type == title_type)
+    return _export_response(request, query.order_by(models.Title.id), TITLE_EXPORT_FIELDS, fmt, "titles")
+
+@router.get("/library")
+async def export_library(
+    request: Request,
+    fmt: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$", description="Формат: ndjson или csv"),
+    updated_since: Optional[datetime] = Query(None, description="Только записи, изменённые с этого момента"),
+    user_id: Optional[int] = Query(None, description="Только библиотека этого пользователя"),
+):
+    """
+    Выгрузка записей user_library одним потоком (NDJSON или CSV).
+    """
+    query = select(*[getattr(models.UserLibrary, name) for name in LIBRARY_EXPORT_FIELDS])
+    if updated_since:
+        query = query.where(models.UserLibrary.last_updated >= updated_since)
+    if user_id is not None:
+        query = query.where(models.UserLibrary.user_id == user_id)
+    return _export_response(request, query.order_by(models.UserLibrary.id), LIBRARY_EXPORT_FIELDS, fmt, "user_library")
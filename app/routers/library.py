@@ -1,15 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from sqlalchemy.exc import IntegrityError
-from app import schemas, models, crud
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from app import schemas, models, crud, pagination, progress
 from app.database import get_db
 
 router = APIRouter(prefix="/library", tags=["library"])
 
 @router.post("/", response_model=schemas.LibraryResponse)
-def add_to_library(item: schemas.LibraryCreate, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.id == item.user_id).first()
-    title = db.query(models.Title).filter(models.Title.id == item.title_id).first()
+async def add_to_library(item: schemas.LibraryCreate, db: AsyncSession = Depends(get_db)):
+    user = await db.get(models.User, item.user_id)
+    title = await db.get(models.Title, item.title_id)
     
     if not user:
         raise HTTPException(404, "Пользователь не найден")
@@ -17,28 +19,123 @@ def add_to_library(item: schemas.LibraryCreate, db: Session = Depends(get_db)):
         raise HTTPException(404, "Тайтл не найден")
     
     try:
-        return crud.add_to_library(db, item)
+        return await crud.add_to_library(db, item)
     except IntegrityError as e:
-        db.rollback()
+        await db.rollback()
         if "unique constraint" in str(e).lower() or "duplicate key" in str(e).lower():
             raise HTTPException(409, "Этот тайтл уже есть в библиотеке пользователя")
         else:
             raise HTTPException(400, "Ошибка сохранения в БД")
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(500, "Внутренняя ошибка сервера")
 
+@router.post("/bulk", response_model=schemas.LibraryBulkResponse)
+async def bulk_upsert_library(payload: schemas.LibraryBulkRequest, db: AsyncSession = Depends(get_db)):
+    """
+    Массовое добавление/обновление библиотеки пользователя (например, импорт списка).
+    Каждая строка задаёт запись целиком: существующая запись перезаписывается,
+    отсутствующая user_score снимает оценку. Результат — по каждой строке.
+    """
+    if not await db.get(models.User, payload.user_id):
+        raise HTTPException(404, "Пользователь не найден")
+    
+    # Повторы одного тайтла: применяется последняя строка
+    last_index = {item.title_id: i for i, item in enumerate(payload.items)}
+    existing = set((await db.scalars(
+        select(models.Title.id).where(models.Title.id.in_(list(last_index)))
+    )).all())
+    items = [payload.items[i].model_dump() for title_id, i in last_index.items() if title_id in existing]
+    
+    try:
+        outcomes = await crud.bulk_upsert_library(db, payload.user_id, items)
+    except SQLAlchemyError:
+        raise HTTPException(400, "Ошибка сохранения в БД")
+    except ValueError as e:
+        raise HTTPException(409, str(e))
+    
+    ordered = []
+    for i, item in enumerate(payload.items):
+        if last_index[item.title_id] != i:
+            result = schemas.LibraryBulkResult(title_id=item.title_id, result="error", detail="Тайтл повторяется в запросе, применена последняя строка")
+        elif item.title_id not in existing:
+            result = schemas.LibraryBulkResult(title_id=item.title_id, result="error", detail="Тайтл не найден")
+        else:
+            result = schemas.LibraryBulkResult(title_id=item.title_id, result=outcomes[item.title_id])
+        ordered.append(result)
+    counts = {key: sum(1 for r in ordered if r.result == key) for key in ("inserted", "updated", "unchanged", "error")}
+    return schemas.LibraryBulkResponse(
+        inserted=counts["inserted"],
+        updated=counts["updated"],
+        unchanged=counts["unchanged"],
+        failed=counts["error"],
+        results=ordered,
+    )
+
+@router.get("/{user_id}", response_model=List[schemas.LibraryEntryWithTitle])
+async def read_user_library(
+    user_id: int,
+    response: Response,
+    status: Optional[str] = Query(None, pattern="^(planned|watching|completed|dropped|on_hold)$", description="Статус записи"),
+    min_score: Optional[int] = Query(None, ge=1, le=10, description="Минимальная оценка пользователя"),
+    max_score: Optional[int] = Query(None, ge=1, le=10, description="Максимальная оценка пользователя"),
+    order: str = Query("updated", pattern="^(updated|score|title)$", description="Сортировка: updated, score или title"),
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы из заголовка X-Next-Cursor"),
+    limit: int = Query(50, ge=1, le=500, description="Лимит записей"),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Библиотека пользователя с краткой карточкой каждого тайтла (без отдельных запросов к /titles).
+    Если страница заполнена, курсор следующей возвращается в заголовке X-Next-Cursor.
+    """
+    try:
+        after = crud.parse_library_keyset(pagination.decode_cursor(cursor), order) if cursor else None
+        rows = await crud.get_user_library(db, user_id, status, min_score, max_score, order, after, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500, detail=f"Ошибка базы данных: {str(e)}")
+    if not rows and cursor is None and not await db.get(models.User, user_id):
+        raise HTTPException(status_code=404, detail="Пользователь не найден")
+    
+    if len(rows) == limit:
+        response.headers["X-Next-Cursor"] = pagination.encode_cursor(crud.library_keyset(rows[-1], order))
+    result = []
+    for row in rows:
+        item = schemas.LibraryEntryWithTitle(
+            **schemas.LibraryResponse.model_validate(row.UserLibrary).model_dump(),
+            title=schemas.LibraryTitle(**{name: getattr(row, name) for name in crud.LIBRARY_TITLE_FIELDS}),
+        )
+        if progress.LIBRARY_PROGRESS_COALESCE:
+            pending = progress.buffer.get(user_id, item.title_id)
+            if pending is not None:
+                item.progress = pending
+        result.append(item)
+    return result
+
 @router.patch("/{user_id}/{title_id}", response_model=schemas.LibraryResponse)
-def update_library_entry(user_id: int, title_id: int, update_data: schemas.LibraryUpdate, db: Session = Depends(get_db)):
-    entry = db.query(models.UserLibrary).filter(models.UserLibrary.user_id == user_id, models.UserLibrary.title_id == title_id).first()
+async def update_library_entry(user_id: int, title_id: int, update_data: schemas.LibraryUpdate, db: AsyncSession = Depends(get_db)):
+    """
+    Обновление записи библиотеки. При LIBRARY_PROGRESS_COALESCE=true изменение
+    только progress подтверждается сразу и записывается в БД фоновым сбросом буфера.
+    """
+    entry = (await db.scalars(select(models.UserLibrary).where(models.UserLibrary.user_id == user_id, models.UserLibrary.title_id == title_id))).first()
     if not entry:
         raise HTTPException(status_code=404, detail="Запись в библиотеке не найдена")
     update_payload = update_data.model_dump(exclude_unset=True)
+    if progress.LIBRARY_PROGRESS_COALESCE:
+        if update_payload.keys() == {"progress"} and update_payload["progress"] is not None:
+            progress.buffer.put(user_id, title_id, update_payload["progress"])
+            return schemas.LibraryResponse.model_validate(entry).model_copy(update=update_payload)
+        # Обычное обновление забирает из буфера ещё не записанный прогресс этой записи
+        pending = progress.buffer.pop(user_id, title_id)
+        if pending is not None and update_payload.get("progress") is None:
+            update_payload["progress"] = pending
     try:
-        return crud.update_library_entry(db, entry, update_payload)
+        return await crud.update_library_entry(db, entry, update_payload)
     except IntegrityError:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=400, detail="Ошибка валидации данных БД")
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
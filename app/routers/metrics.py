@@ -0,0 +1,17 @@
+from fastapi import APIRouter
+
+from app.database import engine, async_engine
+from app.pool_metrics import async_pool_metrics, sync_pool_metrics
+
+router = APIRouter(prefix="/metrics", tags=["metrics"])
+
+@router.get("/pool")
+def get_pool_metrics():
+    """
+    Состояние пулов соединений: занятые, свободные и overflow-соединения,
+    гистограммы ожидания и удержания соединения, время жизни соединений.
+    """
+    return {
+        "async": async_pool_metrics.snapshot(async_engine.sync_engine.pool),
+        "sync": sync_pool_metrics.snapshot(engine.pool),
+    }
@@ -1,54 +1,188 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from typing import List, Optional
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func, or_
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from decimal import Decimal
+from typing import List, Optional, Union
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from sqlalchemy import select
 from sqlalchemy.exc import SQLAlchemyError
-from app import schemas, models, crud
+from app import schemas, models, crud, pagination, cache, autocomplete, ratings, recommendations
+from app.genres import directory as genre_directory
+from app.serialization import dump_json, orjson_response
 from app.database import get_db
-from datetime import date
 
 router = APIRouter(prefix="/titles", tags=["titles"])
 
-def get_title_or_404(title_id: int, db: Session = Depends(get_db)) -> models.Title:
-    title = crud.get_title(db, title_id)
+async def get_title_or_404(title_id: int, db: AsyncSession = Depends(get_db)) -> models.Title:
+    title = await crud.get_title(db, title_id)
     if not title:
         raise HTTPException(status_code=404, detail="Тайтл не найден")
     return title
 
 @router.get("/", response_model=List[schemas.TitleResponse])
-def read_titles(
-    skip: int = Query(0, ge=0, description="Пропустить N записей"),
+async def read_titles(
+    response: Response,
+    skip: int = Query(0, ge=0, description="Пропустить N записей (устаревший режим, игнорируется при cursor)"),
     limit: int = Query(100, ge=1, le=1000, description="Лимит записей"),
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы из заголовка X-Next-Cursor"),
+    order: str = Query("id", pattern="^(id|rating)$", description="Сортировка: id или rating"),
+    fields: Optional[str] = Query(None, description="Только эти поля через запятую, например id,canonical_title,poster_url"),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Список тайтлов.
+    Если страница заполнена, курсор следующей возвращается в заголовке X-Next-Cursor.
+    С fields из БД читаются только нужные колонки, а ответ сериализуется сразу в JSON.
+    """
+    try:
+        after = None
+        if cursor:
+            after = crud.parse_title_keyset(pagination.decode_cursor(cursor), order)
+        if fields:
+            field_names = crud.parse_title_fields(fields)
+            rows = await crud.get_titles(db, skip, limit, after=after, order=order, fields=field_names)
+            headers = {}
+            if len(rows) == limit:
+                headers["X-Next-Cursor"] = pagination.encode_cursor(crud.title_keyset(rows[-1], order))
+            return orjson_response([crud.title_row_to_dict(row, field_names) for row in rows], headers=headers)
+        
+        titles = await crud.get_titles(db, skip, limit, after=after, order=order)
+        if len(titles) == limit:
+            response.headers["X-Next-Cursor"] = pagination.encode_cursor(
+                crud.title_keyset(titles[-1], order)
+            )
+        return titles
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500, detail=f"Ошибка базы данных: {str(e)}")
+
+@router.get("/popular", response_model=List[schemas.TitleResponse])
+async def read_popular_titles(
+    title_type: str = Query("anime", alias="type", pattern="^(anime|manga)$", description="Тип тайтлов"),
+    limit: int = Query(20, ge=1, le=100, description="Лимит записей"),
+    db: AsyncSession = Depends(get_db)
 ):
+    """
+    Популярные тайтлы по рейтингу.
+    Результат кэшируется в памяти до изменения любого тайтла этого типа (LISTEN title_changes).
+    """
     try:
-        return crud.get_titles(db, skip, limit)
+        async def load():
+            titles = await crud.get_popular_titles(db, title_type, limit)
+            return [schemas.TitleResponse.model_validate(t).model_dump() for t in titles]
+        
+        return await cache.rankings.get_or_load(("popular", title_type, limit), load)
     except SQLAlchemyError as e:
         raise HTTPException(status_code=500, detail=f"Ошибка базы данных: {str(e)}")
 
+@router.get("/autocomplete", response_model=List[schemas.TitleSuggestion])
+async def autocomplete_titles(
+    q: str = Query(..., min_length=1, max_length=100, description="Начало названия или любого его слова"),
+    title_type: Optional[str] = Query(None, alias="type", pattern="^(anime|manga)$", description="Тип тайтлов"),
+    limit: int = Query(10, ge=1, le=autocomplete.AUTOCOMPLETE_MAX_LIMIT, description="Лимит подсказок"),
+):
+    """
+    Подсказки названий для поля ввода, по убыванию числа оценок.
+    Отвечает из индекса в памяти, без запроса к БД.
+    """
+    if not autocomplete.index.ready:
+        raise HTTPException(status_code=503, detail="Индекс автодополнения ещё не построен")
+    return [entry._asdict() for entry in autocomplete.index.suggest(q, limit=limit, title_type=title_type)]
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    # Для If-None-Match сравнение слабое: W/"x" совпадает с "x"
+    return "*" in tags or any(tag.removeprefix("W/") == etag for tag in tags)
+
 @router.get("/{title_id}", response_model=schemas.TitleResponse)
-def read_title(title: models.Title = Depends(get_title_or_404)):
-    return title
+async def read_title(
+    title_id: int,
+    request: Request,
+    exact: bool = Query(False, description="Учесть ещё не свёрнутые оценки (режим отложенного рейтинга)"),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Карточка тайтла. Ответ содержит ETag версии строки; при совпадении If-None-Match
+    возвращается 304. Горячие карточки отдаются из кэша без обращения к БД.
+    exact=true — рейтинг с учётом оценок, ещё не свёрнутых в titles (без кэша и ETag).
+    """
+    if exact and ratings.DEFERRED:
+        try:
+            found = await ratings.get_title_exact(db, title_id)
+        except SQLAlchemyError as e:
+            raise HTTPException(status_code=500, detail=f"Ошибка базы данных: {str(e)}")
+        if found is None:
+            raise HTTPException(status_code=404, detail="Тайтл не найден")
+        title, ds, dc = found
+        result = schemas.TitleResponse.model_validate(title)
+        if dc or ds:
+            votes = result.vote_count + dc
+            result.vote_count = votes
+            result.average_rating = round(Decimal(title.total_score + ds) / votes, 2) if votes > 0 else None
+        return result
+    
+    async def load():
+        found = await crud.get_title_with_version(db, title_id)
+        if found is None:
+            return None
+        title, version = found
+        payload = dump_json(schemas.TitleResponse.model_validate(title).model_dump(mode="json"))
+        return f'"{title_id}-{version}"', payload
+    
+    try:
+        entry = await cache.title_details.get_or_load(title_id, load)
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500, detail=f"Ошибка базы данных: {str(e)}")
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Тайтл не найден")
+    etag, payload = entry
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=payload, media_type="application/json", headers=headers)
+
+@router.get("/{title_id}/similar", response_model=List[schemas.ScoredTitle])
+async def read_similar_titles(
+    title_id: int,
+    limit: int = Query(10, ge=1, le=recommendations.RECOMMENDATION_TOP_K, description="Лимит записей"),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Похожие тайтлы: их чаще всего добавляют в библиотеку вместе с этим.
+    Список предрасчитан офлайн (build_recommendations.py), запрос читает не больше limit строк.
+    """
+    try:
+        similar = await crud.get_similar_titles(db, title_id, limit)
+        if not similar:
+            await get_title_or_404(title_id, db)
+        return [
+            {**schemas.TitleResponse.model_validate(title).model_dump(), "score": round(score, 4)}
+            for title, score in similar
+        ]
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500, detail=f"Ошибка базы данных: {str(e)}")
 
 @router.post("/", response_model=schemas.TitleResponse, status_code=201)
-def create_title(title: schemas.TitleCreate, db: Session = Depends(get_db)):
+async def create_title(title: schemas.TitleCreate, db: AsyncSession = Depends(get_db)):
     try:
-        return crud.create_title(db, title)
+        return await crud.create_title(db, title)
     except SQLAlchemyError as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=400, detail=f"Ошибка базы данных: {str(e)}")
     except ValueError as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Внутренняя ошибка: {str(e)}")
 
 @router.patch("/{title_id}", response_model=schemas.TitleResponse)
-def patch_title(
+async def patch_title(
     title: models.Title = Depends(get_title_or_404),
     title_update: schemas.TitleUpdate = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     if not title_update:
         return title
@@ -58,36 +192,51 @@ def patch_title(
         raise HTTPException(status_code=400, detail="Нет данных для обновления")
     
     try:
-        return crud.update_title_partial(db, title, update_data)
+        return await crud.update_title_partial(db, title, update_data)
     except SQLAlchemyError as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=400, detail=f"Ошибка базы данных: {str(e)}")
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.delete("/{title_id}", status_code=204)
-def delete_title(
+async def delete_title(
     title: models.Title = Depends(get_title_or_404),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     try:
-        crud.delete_title(db, title)
+        await crud.delete_title(db, title)
     except SQLAlchemyError as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Ошибка удаления: {str(e)}")
 
-@router.get("/search/advanced", response_model=List[schemas.TitleResponse])
-def search_titles_advanced(
-    genre_name: Optional[str] = Query(None, description="Название жанра"),
+def _split_names(value: Optional[str]) -> List[str]:
+    return [name.strip() for name in value.split(",") if name.strip()] if value else []
+
+@router.get("/search/advanced", response_model=Union[List[schemas.TitleResponse], schemas.TitleSearchPage])
+async def search_titles_advanced(
+    genres: Optional[str] = Query(None, description="Жанры через запятую"),
+    genre_mode: str = Query("all", pattern="^(all|any)$", description="all — все жанры сразу, any — хотя бы один"),
+    exclude_genres: Optional[str] = Query(None, description="Исключить тайтлы с этими жанрами (через запятую)"),
+    genre_name: Optional[str] = Query(None, description="Часть названия жанра (устаревший фильтр)"),
     year_start: Optional[int] = Query(None, ge=1900, le=2100, description="Год начала"),
     year_end: Optional[int] = Query(None, ge=1900, le=2100, description="Год окончания"),
     status: Optional[str] = Query(None, description="Статус тайтла"),
     min_rating: float = Query(0.0, ge=0, le=10, description="Минимальный рейтинг"),
+    facets: bool = Query(False, description="Вернуть {items, total, facets} со счётчиками по фильтрам"),
+    fields: Optional[str] = Query(None, description="Только эти поля через запятую"),
     skip: int = Query(0, ge=0, description="Пропустить N записей"),
     limit: int = Query(50, le=100, description="Лимит записей"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
+    """
+    Поиск с фильтрами по жанрам, годам, статусу и рейтингу.
+    Названия жанров сопоставляются со справочником без учёта регистра;
+    фильтр выполняется по массиву titles.genre_ids без JOIN с title_genres.
+    facets=true — вместе со страницей вернуть общее число результатов и счётчики
+    по типу, статусу, году и жанрам (кэшируются на FACET_CACHE_TTL секунд).
+    """
     try:
         if year_start and year_end and year_start > year_end:
             raise HTTPException(status_code=400, detail="Год начала не может быть больше года окончания")
@@ -97,20 +246,32 @@ def search_titles_advanced(
             if status not in valid_statuses:
                 raise HTTPException(status_code=400, detail=f"Некорректный статус. Допустимые: {valid_statuses}")
         
-        query = db.query(models.Title).options(joinedload(models.Title.genres))
-        
-        if genre_name:
-            query = query.join(models.Title.genres)
-            query = query.filter(models.Genre.name.ilike(f"%{genre_name.strip()}%"))
+        include_ids = await genre_directory.resolve(db, _split_names(genres))
+        exclude_ids = await genre_directory.resolve(db, _split_names(exclude_genres))
+        genres_all = include_ids if genre_mode == "all" else None
+        genres_any = include_ids if genre_mode == "any" else None
+        if genre_name and genre_name.strip():
+            legacy_ids = await genre_directory.match(db, genre_name)
+            if not legacy_ids:
+                return schemas.TitleSearchPage(items=[], total=0, facets=schemas.TitleFacets()) if facets else []
+            genres_any = sorted(set(genres_any or []) | set(legacy_ids)) if genres_any else legacy_ids
         
-        if year_start:
-            query = query.filter(models.Title.start_date >= date(year_start, 1, 1))
-        if year_end:
-            query = query.filter(models.Title.start_date <= date(year_end, 12, 31))
-        if status:
-            query = query.filter(models.Title.status == status)
-        if min_rating and min_rating > 0:
-            query = query.filter(models.Title.average_rating >= min_rating)
+        filters = dict(
+            genres_all=genres_all,
+            genres_any=genres_any,
+            genres_exclude=exclude_ids,
+            year_start=year_start,
+            year_end=year_end,
+            status=status,
+            min_rating=min_rating if min_rating > 0 else None,
+        )
+        clauses = crud.title_filter_clauses(**filters)
+        field_names = crud.parse_title_fields(fields) if fields else None
+        if field_names:
+            query = crud.select_title_fields(field_names)
+        else:
+            query = select(models.Title).options(selectinload(models.Title.genres))
+        query = query.where(*clauses)
         
         query = query.order_by(
             models.Title.average_rating.desc().nullslast(),
@@ -118,25 +279,85 @@ def search_titles_advanced(
             models.Title.start_date.desc()
         )
         
-        return query.offset(skip).limit(limit).all()
+        if field_names:
+            rows = (await db.execute(query.offset(skip).limit(limit))).all()
+            items = [crud.title_row_to_dict(row, field_names) for row in rows]
+        else:
+            items = list((await db.scalars(query.offset(skip).limit(limit))).all())
+        if field_names and not facets:
+            return orjson_response(items)
+        if not facets:
+            return items
+        
+        # Ключ не зависит от порядка жанров, написания и страницы
+        key = tuple((name, tuple(value) if isinstance(value, list) else value) for name, value in sorted(filters.items()))
+        counts = await cache.facets.get_or_load(key, lambda: crud.get_title_facets(db, clauses))
+        facet_counts = schemas.TitleFacets(
+            type=counts["type"],
+            status=counts["status"],
+            year=counts["year"],
+            genre={genre_directory.name(gid): cnt for gid, cnt in counts["genre_ids"].items()},
+        )
+        if field_names:
+            return orjson_response({"items": items, "total": counts["total"], "facets": facet_counts.model_dump(mode="json")})
+        return schemas.TitleSearchPage(items=items, total=counts["total"], facets=facet_counts)
         
     except HTTPException:
         raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка поиска: {str(e)}")
 
-@router.get("/search/title", response_model=List[schemas.TitleResponse])
-def search_titles_by_name(
+@router.get("/search/fulltext", response_model=List[schemas.TitleFulltextResult])
+async def search_titles_fulltext(
+    q: str = Query(..., min_length=1, max_length=200, description="Запрос: слова, \"фраза\", or, -исключение"),
+    highlight: bool = Query(False, description="Вернуть фрагменты описания с подсветкой совпадений"),
+    skip: int = Query(0, ge=0, description="Пропустить N записей"),
+    limit: int = Query(20, ge=1, le=100, description="Лимит записей"),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Полнотекстовый поиск по названиям и описанию.
+    Результаты упорядочены по релевантности (ts_rank_cd, поле rank);
+    при highlight=true в поле snippet — фрагменты описания, совпадения в <b>...</b>.
+    """
+    try:
+        found = await crud.search_titles_fulltext(db, q.strip(), highlight=highlight, skip=skip, limit=limit)
+        return [
+            schemas.TitleFulltextResult.model_validate(
+                {**schemas.TitleResponse.model_validate(title).model_dump(), "rank": round(rank, 6), "snippet": snippet}
+            )
+            for title, rank, snippet in found
+        ]
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500, detail=f"Ошибка поиска: {str(e)}")
+
+@router.get("/search/title", response_model=List[schemas.TitleSearchResult])
+async def search_titles_by_name(
     q: str = Query(..., min_length=1, description="Поисковый запрос по названию"),
     exact: bool = Query(False, description="Точный поиск (регистронезависимый)"),
+    ranked: bool = Query(False, description="Нечёткий поиск с ранжированием по близости названия"),
+    min_score: float = Query(0.3, ge=0, le=1, description="Минимальная близость для ranked"),
     skip: int = Query(0, ge=0, description="Пропустить N записей"),
     limit: int = Query(100, ge=1, le=1000, description="Лимит записей"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
+    """
+    Поиск по названию (русскому или оригинальному).
+    ranked=true — устойчивый к опечаткам поиск: результаты упорядочены по триграммной
+    близости к запросу, близость (0..1) возвращается в поле score.
+    """
     try:
         if len(q) > 100:
             raise HTTPException(status_code=400, detail="Слишком длинный запрос")
         
-        return crud.get_titles_by_name(db, q.strip(), exact=exact, skip=skip, limit=limit)
+        if ranked and not exact:
+            found = await crud.search_titles_ranked(db, q.strip(), min_score=min_score, skip=skip, limit=limit)
+            return [
+                schemas.TitleSearchResult.model_validate(title).model_copy(update={"score": round(score, 4)})
+                for title, score in found
+            ]
+        return await crud.get_titles_by_name(db, q.strip(), exact=exact, skip=skip, limit=limit)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка поиска: {str(e)}")
\ No newline at end of file
@@ -1,64 +1,119 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy import text
-from sqlalchemy.orm import Session
+from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
-from app import schemas, models
+from app import schemas, models, crud, leaderboard
 from app.database import get_db
-from app.auth_utils import get_password_hash, verify_password
+from app.auth_utils import hasher, PasswordHasherBusy
 
 router = APIRouter(prefix="/users", tags=["users"])
 
 @router.post("/", response_model=schemas.UserResponse, status_code=status.HTTP_201_CREATED)
-def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    exists = db.query(models.User).filter(
+async def create_user(user: schemas.UserCreate, db: AsyncSession = Depends(get_db)):
+    exists = (await db.scalars(select(models.User).where(
         (models.User.username == user.username) | (models.User.email == user.email)
-    ).first()
+    ))).first()
     
     if exists:
         raise HTTPException(status_code=409, detail="Пользователь с таким username или email уже существует")
     
-    hashed = get_password_hash(user.password)
+    # bcrypt нагружает CPU — считается в отдельном ограниченном пуле
+    try:
+        hashed = await hasher.hash(user.password)
+    except PasswordHasherBusy:
+        raise HTTPException(status_code=503, detail="Сервис перегружен, повторите попытку позже", headers={"Retry-After": "1"})
     new_user = models.User(username=user.username, email=user.email, password_hash=hashed, avatar_url="/default-avatar.png")
     
     try:
         db.add(new_user)
-        db.commit()
-        db.refresh(new_user)
+        await db.commit()
+        await db.refresh(new_user)
+        leaderboard.board.update(new_user.id, 0)
         return new_user
     except IntegrityError:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=400, detail="Ошибка создания пользователя (возможно дубликат)")
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/login", response_model=schemas.LoginResponse)
-def login(payload: schemas.LoginRequest, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.username == payload.username).first()
-    if not user or not verify_password(payload.password, user.password_hash):
+async def login(payload: schemas.LoginRequest, db: AsyncSession = Depends(get_db)):
+    user = (await db.scalars(select(models.User).where(models.User.username == payload.username))).first()
+    if not user:
+        raise HTTPException(status_code=401, detail="Неверное имя пользователя или пароль")
+    try:
+        valid, new_hash = await hasher.verify_and_update(payload.password, user.password_hash)
+    except PasswordHasherBusy:
+        raise HTTPException(status_code=503, detail="Сервис перегружен, повторите попытку позже", headers={"Retry-After": "1"})
+    if not valid:
         raise HTTPException(status_code=401, detail="Неверное имя пользователя или пароль")
+    if new_hash:
+        # Хэш с устаревшей стоимостью bcrypt — пересохраняем; неудача не мешает входу
+        try:
+            user.password_hash = new_hash
+            await db.commit()
+        except SQLAlchemyError:
+            await db.rollback()
     return schemas.LoginResponse(
         status="success", 
         message=f"Добро пожаловать, {user.username}!", 
         user_id=user.id
     )
 
+@router.get("/{user_id}/stats", response_model=schemas.UserLibraryStats)
+async def read_user_stats(user_id: int, db: AsyncSession = Depends(get_db)):
+    """
+    Статистика библиотеки пользователя: число тайтлов по статусам, средняя оценка,
+    время последней активности. Читается одной строкой из user_stats.
+    """
+    try:
+        stats = await crud.get_user_stats(db, user_id)
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500, detail=f"Ошибка базы данных: {str(e)}")
+    if stats is None:
+        raise HTTPException(status_code=404, detail="Пользователь не найден")
+    return stats
+
+@router.get("/{user_id}/recommendations", response_model=List[schemas.ScoredTitle])
+async def read_user_recommendations(
+    user_id: int,
+    limit: int = Query(20, ge=1, le=100, description="Лимит записей"),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Рекомендации по библиотеке пользователя: тайтлы, похожие на понравившиеся ему,
+    которых ещё нет в библиотеке. Считаются по предрасчитанной title_similarities.
+    """
+    try:
+        found = await crud.get_recommendations(db, user_id, limit)
+        if not found and not await db.get(models.User, user_id):
+            raise HTTPException(status_code=404, detail="Пользователь не найден")
+        return [
+            {**schemas.TitleResponse.model_validate(title).model_dump(), "score": round(score, 4)}
+            for title, score in found
+        ]
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500, detail=f"Ошибка базы данных: {str(e)}")
+
 @router.delete("/{user_id}/with-reviews", status_code=204)
-def delete_user_with_reviews(user_id: int, db: Session = Depends(get_db)):
+async def delete_user_with_reviews(user_id: int, db: AsyncSession = Depends(get_db)):
     """
     Транзакция: удалить пользователя и все его отзывы.
     Демонстрация работы с несколькими таблицами в одной транзакции.
     """
     try:
-        user = db.query(models.User).filter(models.User.id == user_id).first()
+        user = await db.get(models.User, user_id)
         if not user:
             raise HTTPException(status_code=404, detail="Пользователь не найден")
         
-        reviews = db.query(models.Review).filter(models.Review.user_id == user_id).all()
-        review_ids = [r.id for r in reviews]
+        review_ids = list((await db.scalars(
+            select(models.Review.id).where(models.Review.user_id == user_id)
+        )).all())
         review_count = len(review_ids)
         
-        db.delete(user)
+        await db.delete(user)
         
         audit_log = models.AuditLog(
             user_id=None, 
@@ -75,17 +130,18 @@ def delete_user_with_reviews(user_id: int, db: Session = Depends(get_db)):
             }
         )
         db.add(audit_log)
-        db.commit()
+        await db.commit()
+        leaderboard.board.remove(user_id)
         
         
     except HTTPException:
-        db.rollback()
+        await db.rollback()
         raise
     except SQLAlchemyError as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Ошибка базы данных: {str(e)}")
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Внутренняя ошибка: {str(e)}")
     
 
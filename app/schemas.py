@@ -44,6 +44,41 @@ class LibraryResponse(LibraryCreate):
     last_updated: Optional[datetime] = None
     model_config = ConfigDict(from_attributes=True)
 
+class LibraryTitle(BaseModel):
+    id: int
+    type: str
+    canonical_title: str
+    russian_title: Optional[str] = None
+    poster_url: Optional[str] = None
+    episodes_count: Optional[int] = None
+    chapters_count: Optional[int] = None
+    volumes_count: Optional[int] = None
+
+class LibraryEntryWithTitle(LibraryResponse):
+    title: LibraryTitle
+
+class LibraryBulkItem(BaseModel):
+    title_id: int
+    status: str = Field(..., pattern="^(planned|watching|completed|dropped|on_hold)$")
+    progress: int = Field(0, ge=0)
+    user_score: Optional[int] = Field(None, ge=1, le=10)
+
+class LibraryBulkRequest(BaseModel):
+    user_id: int
+    items: List[LibraryBulkItem] = Field(..., min_length=1, max_length=5000)
+
+class LibraryBulkResult(BaseModel):
+    title_id: int
+    result: str
+    detail: Optional[str] = None
+
+class LibraryBulkResponse(BaseModel):
+    inserted: int
+    updated: int
+    unchanged: int
+    failed: int
+    results: List[LibraryBulkResult]
+
 class ReviewCreate(BaseModel):
     user_id: int
     title_id: int
@@ -103,6 +138,35 @@ class TitleResponse(TitleBase):
     genres: List[GenreBase] = Field(default_factory=list)
     model_config = ConfigDict(from_attributes=True)
 
+class TitleSearchResult(TitleResponse):
+    score: Optional[float] = None
+
+class ScoredTitle(TitleResponse):
+    score: float
+
+class TitleFulltextResult(TitleResponse):
+    rank: float
+    snippet: Optional[str] = None
+
+class TitleFacets(BaseModel):
+    type: Dict[str, int] = Field(default_factory=dict)
+    status: Dict[str, int] = Field(default_factory=dict)
+    year: Dict[int, int] = Field(default_factory=dict)
+    genre: Dict[str, int] = Field(default_factory=dict)
+
+class TitleSearchPage(BaseModel):
+    items: List[TitleResponse]
+    total: int
+    facets: TitleFacets
+
+class TitleSuggestion(BaseModel):
+    id: int
+    type: str
+    canonical_title: str
+    russian_title: Optional[str] = None
+    vote_count: int
+    model_config = ConfigDict(from_attributes=True)
+
 class TopAnimeView(BaseModel):
     id: int
     title: str
@@ -120,6 +184,14 @@ class UserStatsResponse(BaseModel):
     last_active: Optional[datetime] = None
     model_config = ConfigDict(from_attributes=True)
 
+class UserLibraryStats(BaseModel):
+    user_id: int
+    total_titles: int
+    stats_by_status: Dict[str, int] = Field(default_factory=dict)
+    score_count: int
+    avg_score: Optional[float] = None
+    last_active: Optional[datetime] = None
+
 class GenrePopularityResponse(BaseModel):
     genre: str
     titles_count: int
@@ -142,4 +214,19 @@ class UserRankResponse(BaseModel):
     user_id: int
     rank: str
     completed_count: Optional[int] = None
-    model_config = ConfigDict(from_attributes=True)
\ No newline at end of file
+    position: Optional[int] = None
+    total_users: Optional[int] = None
+    top_percent: Optional[float] = None
+    model_config = ConfigDict(from_attributes=True)
+
+class LeaderboardEntry(BaseModel):
+    user_id: int
+    username: Optional[str] = None
+    completed_count: int
+    position: int
+    top_percent: float
+
+class LeaderboardAround(BaseModel):
+    total_users: int
+    user: LeaderboardEntry
+    entries: List[LeaderboardEntry]
\ No newline at end of file
@@ -0,0 +1,19 @@
+from typing import Any, Mapping, Optional
+
+import orjson
+from fastapi import Response
+
+
+def _default(value: Any):
+    # Decimal и прочее, чего orjson не знает, — строкой, как у pydantic
+    return str(value)
+
+
+def dump_json(content: Any) -> bytes:
+    # Ключи-числа (счётчики по годам) — строками, как у стандартного json
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+def orjson_response(content: Any, headers: Optional[Mapping[str, str]] = None, status_code: int = 200) -> Response:
+    """Готовый JSON-ответ в обход валидации response_model — для уже приведённых к форме данных"""
+    return Response(content=dump_json(content), status_code=status_code, headers=headers, media_type="application/json")
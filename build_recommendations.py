@@ -0,0 +1,200 @@
+import argparse
+import os
+import time
+from datetime import timedelta
+
+import numpy as np
+import psycopg2
+from dotenv import load_dotenv
+from psycopg2.extras import execute_values
+from scipy import sparse
+from sqlalchemy import Float, cast, select
+from sqlalchemy.dialects import postgresql
+
+from app import models, recommendations
+
+load_dotenv()
+
+DB_CONFIG = {
+    'dbname': os.getenv('DB_NAME', 'animedb'),
+    'user': os.getenv('DB_USER', 'admin'),
+    'password': os.getenv('DB_PASSWORD', 'admin123'),
+    'host': os.getenv('DB_HOST', 'db'),
+    'port': os.getenv('DB_PORT', '5432')
+}
+
+# Строк user_library на одну выборку серверного курсора
+FETCH_ROWS = 200000
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Сборка похожих тайтлов для рекомендаций")
+    parser.add_argument('--metric', choices=['cosine', 'jaccard'], default='cosine',
+                        help="cosine — по весам записей (оценка, статус), jaccard — по факту присутствия в библиотеке")
+    parser.add_argument('--top-k', type=int, default=recommendations.RECOMMENDATION_TOP_K,
+                        help="Похожих тайтлов на тайтл")
+    parser.add_argument('--min-common', type=int, default=3,
+                        help="Минимум пользователей, у которых есть оба тайтла")
+    parser.add_argument('--block', type=int, default=256,
+                        help="Тайтлов в одном блоке вычислений (память — число тайтлов x block x 16 байт)")
+    parser.add_argument('--overlap', type=int, default=int(os.getenv('RECOMMENDATION_BUILD_OVERLAP', '600')),
+                        help="Насколько секунд раньше прошлой сборки искать изменения: last_updated ставится "
+                             "при записи, а не при коммите, и долгая транзакция может закоммититься после сборки")
+    parser.add_argument('--full', action='store_true',
+                        help="Пересчитать все тайтлы, а не только затронутые после прошлой сборки")
+    return parser.parse_args()
+
+
+def compile_sql(query):
+    return str(query.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+
+
+def load_matrix(conn):
+    """Матрица пользователь x тайтл (scipy CSC) и id тайтлов по её столбцам"""
+    lib = models.UserLibrary
+    weight = recommendations.interaction_weight()
+    query = select(lib.user_id, lib.title_id, cast(weight, Float)).where(weight > 0)
+    chunks = []
+    with conn.cursor(name='library_interactions') as cur:
+        cur.itersize = FETCH_ROWS
+        cur.execute(compile_sql(query))
+        while True:
+            rows = cur.fetchmany(FETCH_ROWS)
+            if not rows:
+                break
+            chunks.append(np.array(rows, dtype=np.float64))
+    data = np.concatenate(chunks) if chunks else np.empty((0, 3))
+    users, user_index = np.unique(data[:, 0].astype(np.int64), return_inverse=True)
+    titles, title_index = np.unique(data[:, 1].astype(np.int64), return_inverse=True)
+    matrix = sparse.csr_matrix((data[:, 2], (user_index, title_index)), shape=(len(users), len(titles)))
+    return titles, matrix.tocsc()
+
+
+def last_build(cur):
+    cur.execute("SELECT started_at, metric FROM title_similarity_builds ORDER BY id DESC LIMIT 1")
+    return cur.fetchone()
+
+
+def changed_titles(cur, since):
+    """Тайтлы из библиотек пользователей, менявших библиотеку после since"""
+    cur.execute("""
+        SELECT DISTINCT title_id
+        FROM user_library
+        WHERE user_id IN (SELECT DISTINCT user_id FROM user_library WHERE last_updated > %s)
+    """, (since,))
+    return np.array([row[0] for row in cur.fetchall()], dtype=np.int64)
+
+
+def stale_neighbours(cur, title_ids):
+    """
+    Тайтлы, в чьих списках соседей есть title_ids: оценка пары зависит от обоих столбцов,
+    и после изменения title_ids сохранённые оценки этих списков устарели
+    """
+    cur.execute("""
+        SELECT DISTINCT title_id
+        FROM title_similarities
+        WHERE similar_title_id = ANY(%s)
+    """, (title_ids.tolist(),))
+    return np.array([row[0] for row in cur.fetchall()], dtype=np.int64)
+
+
+def neighbours(matrix, targets, metric, top_k, min_common, block):
+    """(столбец, столбцы соседей, оценки) для каждого столбца из targets, соседи по убыванию оценки"""
+    binary = matrix.copy()
+    binary.data[:] = 1.0
+    counts = np.asarray(binary.sum(axis=0)).ravel()
+    if metric == 'cosine':
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0)).ravel())
+        normalized = (matrix @ sparse.diags(1.0 / np.maximum(norms, 1e-12))).tocsc()
+    k = min(top_k, matrix.shape[1] - 1)
+
+    for start in range(0, len(targets), block):
+        cols = targets[start:start + block]
+        common = (binary.T @ binary[:, cols]).toarray()
+        if metric == 'cosine':
+            scores = (normalized.T @ normalized[:, cols]).toarray()
+        else:
+            scores = common / np.maximum(counts[:, None] + counts[cols][None, :] - common, 1.0)
+        scores[common < min_common] = 0.0
+        scores[cols, np.arange(len(cols))] = 0.0
+
+        if k <= 0:
+            for col in cols:
+                yield col, np.empty(0, dtype=np.int64), np.empty(0)
+            continue
+        top = np.argpartition(-scores, k - 1, axis=0)[:k]
+        for j, col in enumerate(cols):
+            idx = top[:, j]
+            idx = idx[scores[idx, j] > 0]
+            idx = idx[np.argsort(-scores[idx, j], kind='stable')]
+            yield col, idx, scores[idx, j]
+
+
+def store(cur, titles, results, targets, full):
+    """Записать соседей; при неполной сборке заменяются только списки targets"""
+    if full:
+        cur.execute("DELETE FROM title_similarities")
+    else:
+        cur.execute("DELETE FROM title_similarities WHERE title_id = ANY(%s)", (titles[targets].tolist(),))
+
+    rows = []
+    written = 0
+    for col, idx, scores in results:
+        title_id = int(titles[col])
+        rows.extend(
+            (title_id, rank, int(titles[n]), float(score))
+            for rank, (n, score) in enumerate(zip(idx, scores), start=1)
+        )
+        if len(rows) >= FETCH_ROWS:
+            execute_values(cur, "INSERT INTO title_similarities (title_id, rank, similar_title_id, score) VALUES %s", rows, page_size=5000)
+            written += len(rows)
+            rows = []
+    if rows:
+        execute_values(cur, "INSERT INTO title_similarities (title_id, rank, similar_title_id, score) VALUES %s", rows, page_size=5000)
+        written += len(rows)
+    return written
+
+
+def run_build(args):
+    conn = psycopg2.connect(**DB_CONFIG)
+    cur = conn.cursor()
+    started = time.monotonic()
+    try:
+        cur.execute("SELECT LOCALTIMESTAMP")
+        started_at = cur.fetchone()[0]
+        previous = last_build(cur)
+        cur.execute("SELECT EXISTS (SELECT 1 FROM title_similarities)")
+        # Пустая таблица (новая база, перезаливка данных) — инкрементальной сборке не от чего отталкиваться
+        full = args.full or previous is None or previous[1] != args.metric or not cur.fetchone()[0]
+
+        print("📥 Загрузка библиотек...")
+        titles, matrix = load_matrix(conn)
+        print(f"   Пользователей: {matrix.shape[0]:,}, тайтлов: {matrix.shape[1]:,}, записей: {matrix.nnz:,}")
+
+        if full:
+            targets = np.arange(len(titles))
+        else:
+            changed = changed_titles(cur, previous[0] - timedelta(seconds=args.overlap))
+            changed = np.union1d(changed, stale_neighbours(cur, changed))
+            positions = np.searchsorted(titles, changed)
+            targets = positions[(positions < len(titles)) & (titles[np.minimum(positions, len(titles) - 1)] == changed)]
+        print(f"🧮 {'Полная' if full else 'Инкрементальная'} сборка ({args.metric}): {len(targets):,} тайтлов")
+
+        results = neighbours(matrix, targets, args.metric, args.top_k, args.min_common, args.block)
+        written = store(cur, titles, results, targets, full)
+        cur.execute("""
+            INSERT INTO title_similarity_builds (metric, is_full, started_at, titles_updated)
+            VALUES (%s, %s, %s, %s)
+        """, (args.metric, full, started_at, len(targets)))
+        conn.commit()
+        print(f"✅ Записано {written:,} пар похожих тайтлов за {time.monotonic() - started:.1f} с")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    run_build(parse_args())
@@ -1,9 +1,14 @@
 import psycopg2
-import random
+import argparse
+import csv
+import io
 import json
-import traceback  
+import random
+import time
+import traceback
+from multiprocessing import Pool
 from faker import Faker
-from datetime import date, timedelta, datetime
+from datetime import timedelta, datetime
 import os
 from dotenv import load_dotenv
 load_dotenv()
@@ -12,458 +17,599 @@ DB_CONFIG = {
     'dbname': os.getenv('DB_NAME', 'animedb'),
     'user': os.getenv('DB_USER', 'admin'),
     'password': os.getenv('DB_PASSWORD', 'admin123'),
-    'host': os.getenv('DB_HOST', 'db'),  
+    'host': os.getenv('DB_HOST', 'db'),
     'port': os.getenv('DB_PORT', '5432')
 }
 
-fake = Faker('ru_RU')  
-fake_en = Faker()     
+# Базовый объём при scale = 1
 NUM_USERS = 10000
 NUM_TITLES = 30000
 
-def run_seed():
+# Размер раздела фиксирован, поэтому данные не зависят от числа воркеров
+USERS_PER_PARTITION = 2000
+TITLES_PER_PARTITION = 2000
+COPY_BATCH_ROWS = 20000
+
+PASSWORD_HASH = '$2b$12$EixZaYVK1fsbw1ZfbX3OXePaWxn96p36WQoeG6Lruj3vjPGga31lW'
+
+GENRES = [
+    ('Сёнен', 'Для юношей, экшен, приключения'),
+    ('Сёдзе', 'Для девушек, романтика, драма'),
+    ('Фэнтези', 'Магия, мифические существа'),
+    ('Исекай', 'Попаданцы в другой мир'),
+    ('Романтика', 'Любовные истории'),
+    ('Комедия', 'Юмористические произведения'),
+    ('Драма', 'Эмоциональные, серьезные сюжеты'),
+    ('Боевик', 'Экшен, сражения'),
+    ('Детектив', 'Расследования, загадки'),
+    ('Повседневность', 'Повседневная жизнь'),
+    ('Гарем', 'Один главный герой и несколько девушек'),
+    ('Хоррор', 'Ужасы, страшные сюжеты'),
+    ('Меха', 'Роботы, механизмы'),
+    ('Музыкальный', 'Музыка и выступления'),
+    ('Спорт', 'Спортивные соревнования'),
+    ('Триллер', 'Напряженные сюжеты'),
+    ('Научная фантастика', 'Фантастика, технологии будущего')
+]
+
+STUDIOS = [
+    ('MAPPA', 'studio'),
+    ('Wit Studio', 'studio'),
+    ('Kyoto Animation', 'studio'),
+    ('Bones', 'studio'),
+    ('Madhouse', 'studio'),
+    ('Toei Animation', 'studio'),
+    ('Studio Ghibli', 'studio'),
+    ('Ufotable', 'studio'),
+    ('A-1 Pictures', 'studio'),
+    ('Pierrot', 'studio'),
+    ('White Fox', 'studio'),
+    ('Shaft', 'studio'),
+    ('J.C.Staff', 'studio'),
+    ('Production I.G', 'studio'),
+    ('Trigger', 'studio')
+]
+
+AUTHORS = [
+    ('Хадзимэ Исаяма', 'mangaka'),
+    ('Эйитиро Ода', 'mangaka'),
+    ('Масаси Кисимото', 'mangaka'),
+    ('Хирохико Араки', 'mangaka'),
+    ('Наоко Такэути', 'mangaka'),
+    ('Румико Такахаси', 'mangaka'),
+    ('Тайто Кубо', 'mangaka'),
+    ('Кохэй Хорикоси', 'mangaka'),
+    ('Ёсихиро Тогаси', 'mangaka'),
+    ('Цутому Ниихэй', 'mangaka'),
+    ('Макото Синкай', 'director'),
+    ('Хаяо Миядзаки', 'director'),
+    ('Сатико Мицуми', 'screenwriter'),
+    ('Джэнъитиро Суито', 'screenwriter')
+]
+
+ANIME_TITLES = [
+    'Атака титанов', 'Наруто', 'Ван Пис', 'Тетрадь смерти', 'Стальной алхимик',
+    'Самурай Чамплу', 'Ковбой Бибоп', 'Евангелион', 'Токийский гуль', 'Берсерк',
+    'Ходячий замок', 'Унесённые призраками', 'Мой сосед Тоторо', 'Принцесса Мононоке',
+    'Форма голоса', 'Твоё имя', 'Дракон-горничная', 'Волейбол', 'Баскетбол Куроко',
+    'Чёрный клевер', 'Моб Психо 100', 'Ванпанчмен', 'Реинкарнация безработного',
+    'Восхождение в тени', 'Цепь смерти', 'Магическая битва', 'Демон-убийца'
+]
+
+# Триггеры, которые при массовой загрузке заменяются пересчётом одним запросом
+BULK_DISABLED_TRIGGERS = ['trg_calculate_rating', 'trg_audit_library_add', 'trg_sync_user_stats_insert']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Генерация тестовых данных")
+    parser.add_argument('--scale', type=float, default=float(os.getenv('SEED_SCALE', '1')),
+                        help="Множитель объёма пользователей и тайтлов")
+    parser.add_argument('--users', type=int, default=None, help="Число пользователей (перекрывает scale)")
+    parser.add_argument('--titles', type=int, default=None, help="Число тайтлов (перекрывает scale)")
+    parser.add_argument('--library-min', type=int, default=int(os.getenv('SEED_LIBRARY_MIN', '10')),
+                        help="Минимум тайтлов в библиотеке пользователя")
+    parser.add_argument('--library-max', type=int, default=int(os.getenv('SEED_LIBRARY_MAX', '50')),
+                        help="Максимум тайтлов в библиотеке пользователя")
+    parser.add_argument('--seed', type=int, default=int(os.getenv('SEED', '42')),
+                        help="Зерно генератора: одинаковое зерно — одинаковые данные")
+    parser.add_argument('--anchor', type=datetime.fromisoformat,
+                        default=datetime.fromisoformat(os.getenv('SEED_ANCHOR', '2025-01-01T00:00:00')),
+                        help="Момент, от которого отсчитываются все даты данных (ISO 8601); "
+                             "вместе с --seed определяет данные полностью")
+    parser.add_argument('--workers', type=int, default=int(os.getenv('SEED_WORKERS', '1')),
+                        help="Число параллельных процессов загрузки")
+    parser.add_argument('--skip-library-audit', action='store_true',
+                        help="Не писать в audit_log записи library_add для сгенерированных библиотек")
+    args = parser.parse_args()
+    if args.users is None:
+        args.users = max(1, int(NUM_USERS * args.scale))
+    if args.titles is None:
+        args.titles = max(1, int(NUM_TITLES * args.scale))
+    args.library_max = min(args.library_max, args.titles)
+    args.library_min = min(args.library_min, args.library_max)
+    return args
+
+
+def make_rng(seed, phase, partition=0):
+    """Независимые генераторы на (фазу, раздел) — результат не зависит от порядка воркеров"""
+    rng = random.Random(f"{seed}:{phase}:{partition}")
+    fake = Faker('ru_RU')
+    fake.seed_instance(rng.getrandbits(32))
+    fake_en = Faker()
+    fake_en.seed_instance(rng.getrandbits(32))
+    return rng, fake, fake_en
+
+
+def random_datetime(rng, anchor, days_back):
+    return anchor - timedelta(seconds=rng.randint(0, days_back * 86400))
+
+
+class CopyWriter:
+    """Буферизует строки в CSV и отправляет их через COPY FROM STDIN пачками"""
+
+    def __init__(self, cur, table, columns, batch_rows=COPY_BATCH_ROWS):
+        self.cur = cur
+        self.sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+        self.batch_rows = batch_rows
+        self.rows = 0
+        self.total = 0
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer, lineterminator='\n')
+
+    def write(self, row):
+        self.writer.writerow(row)
+        self.rows += 1
+        if self.rows >= self.batch_rows:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        self.buffer.seek(0)
+        self.cur.copy_expert(self.sql, self.buffer)
+        self.total += self.rows
+        self.rows = 0
+        self.buffer.seek(0)
+        self.buffer.truncate()
+
+
+def partitions(total, size):
+    return [(p, start, min(start + size, total)) for p, start in enumerate(range(0, total, size))]
+
+
+def run_partitioned(func, tasks, workers):
+    """Выполнить задачи раздела последовательно или в пуле процессов"""
+    if workers <= 1:
+        return [func(task) for task in tasks]
+    with Pool(workers) as pool:
+        return list(pool.imap_unordered(func, tasks))
+
+
+def seed_users_partition(task):
+    """Пользователи и профили с id в [start + 1, end]"""
+    seed, partition, start, end, anchor = task
+    rng, fake, _ = make_rng(seed, 'users', partition)
     conn = psycopg2.connect(**DB_CONFIG)
-    conn.autocommit = False
-    cur = conn.cursor()
-    
-    print("🚀 Начинаем заполнение базы данных...")
-    
     try:
-        print("🧹 Очистка старых данных...")
-        tables = [
-            'reports', 'audit_log', 'reviews', 'user_library',
-            'title_authors', 'title_genres', 'title_studios',
-            'titles', 'studios', 'genres', 'authors',
-            'user_profiles', 'users'
-        ]
-        
-        for table in tables:
-            try:
-                cur.execute(f"TRUNCATE TABLE {table} CASCADE")
-            except Exception as e:
-                print(f"   Не удалось очистить {table}: {e}")
-        
-        # 1. ЖАНРЫ
-        print("📚 Жанры...")
-        genres = [
-            ('Сёнен', 'Для юношей, экшен, приключения'),
-            ('Сёдзе', 'Для девушек, романтика, драма'),
-            ('Фэнтези', 'Магия, мифические существа'),
-            ('Исекай', 'Попаданцы в другой мир'),
-            ('Романтика', 'Любовные истории'),
-            ('Комедия', 'Юмористические произведения'),
-            ('Драма', 'Эмоциональные, серьезные сюжеты'),
-            ('Боевик', 'Экшен, сражения'),
-            ('Детектив', 'Расследования, загадки'),
-            ('Повседневность', 'Повседневная жизнь'),
-            ('Гарем', 'Один главный герой и несколько девушек'),
-            ('Хоррор', 'Ужасы, страшные сюжеты'),
-            ('Меха', 'Роботы, механизмы'),
-            ('Музыкальный', 'Музыка и выступления'),
-            ('Спорт', 'Спортивные соревнования'),
-            ('Триллер', 'Напряженные сюжеты'),
-            ('Научная фантастика', 'Фантастика, технологии будущего')
-        ]
-        for name, desc in genres:
-            cur.execute(
-                "INSERT INTO genres (name, description) VALUES (%s, %s)",
-                (name, desc)
-            )
-        
-        cur.execute("SELECT id FROM genres")
-        genre_ids = [r[0] for r in cur.fetchall()]
-        
-        # 2. СТУДИИ
-        print("🎬 Студии...")
-        studio_ids = []
-        studios = [
-            ('MAPPA', 'studio'),
-            ('Wit Studio', 'studio'),
-            ('Kyoto Animation', 'studio'),
-            ('Bones', 'studio'),
-            ('Madhouse', 'studio'),
-            ('Toei Animation', 'studio'),
-            ('Studio Ghibli', 'studio'),
-            ('Ufotable', 'studio'),
-            ('A-1 Pictures', 'studio'),
-            ('Pierrot', 'studio'),
-            ('White Fox', 'studio'),
-            ('Shaft', 'studio'),
-            ('J.C.Staff', 'studio'),
-            ('Production I.G', 'studio'),
-            ('Trigger', 'studio')
-        ]
-        for name, s_type in studios:
-            cur.execute("""
-                INSERT INTO studios (name, type, country, founded_date) 
-                VALUES (%s, %s, 'Japan', %s) RETURNING id
-            """, (name, s_type, fake.date_between(start_date='-40y', end_date='-5y')))
-            studio_ids.append(cur.fetchone()[0])
-        
-        # 3. АВТОРЫ
-        print("👨‍🎨 Авторы...")
-        author_ids = []
-        authors = [
-            ('Хадзимэ Исаяма', 'mangaka'),
-            ('Эйитиро Ода', 'mangaka'),
-            ('Масаси Кисимото', 'mangaka'),
-            ('Хирохико Араки', 'mangaka'),
-            ('Наоко Такэути', 'mangaka'),
-            ('Румико Такахаси', 'mangaka'),
-            ('Тайто Кубо', 'mangaka'),
-            ('Кохэй Хорикоси', 'mangaka'),
-            ('Ёсихиро Тогаси', 'mangaka'),
-            ('Цутому Ниихэй', 'mangaka'),
-            ('Макото Синкай', 'director'),
-            ('Хаяо Миядзаки', 'director'),
-            ('Сатико Мицуми', 'screenwriter'),
-            ('Джэнъитиро Суито', 'screenwriter')
-        ]
-        for name, role in authors:
-            cur.execute(
-                "INSERT INTO authors (full_name, role) VALUES (%s, %s) RETURNING id",
-                (name, role)
-            )
-            author_ids.append(cur.fetchone()[0])
-        
-        print(f"👥 Пользователи ({NUM_USERS})...")
-        user_ids = []
-        generated_emails = set()  
-
-        for i in range(NUM_USERS):
-            max_attempts = 10  
-            email = None
-            
-            for attempt in range(max_attempts):
+        with conn.cursor() as cur:
+            users = CopyWriter(cur, 'users', ['id', 'username', 'email', 'password_hash', 'avatar_url', 'created_at'])
+            profiles = CopyWriter(cur, 'user_profiles', ['user_id', 'birth_date', 'about_text'])
+            for i in range(start, end):
+                uid = i + 1
                 username_part = fake.user_name().replace('.', '').replace('-', '')
-                email = f"{username_part}{i}{random.randint(1000, 9999)}@example.com"
-                
-                if email not in generated_emails:
-                    generated_emails.add(email)
-                    break
-                email = None
-            
-            if email is None:
-                email = f"user{i}_{random.randint(10000, 99999)}@example.com"
-                generated_emails.add(email)
-            
-            username = f"{fake.user_name().replace(' ', '_').replace('.', '').lower()}{i}"
-            
-            cur.execute("""
-                INSERT INTO users (username, email, password_hash, avatar_url, created_at) 
-                VALUES (%s, %s, %s, %s, %s) RETURNING id
-            """, (
-                username,
-                email,
-                '$2b$12$EixZaYVK1fsbw1ZfbX3OXePaWxn96p36WQoeG6Lruj3vjPGga31lW',
-                f'https://i.pravatar.cc/300?img={random.randint(1, 70)}',
-                fake.date_time_between(start_date='-2y', end_date='now')
-            ))
-            uid = cur.fetchone()[0]
-            user_ids.append(uid)
-            
-            # Профиль
-            cur.execute("""
-                INSERT INTO user_profiles (user_id, birth_date, about_text) 
-                VALUES (%s, %s, %s)
-            """, (
-                uid,
-                fake.date_of_birth(minimum_age=14, maximum_age=45),
-                fake.text(max_nb_chars=150)
-            ))
-            
-            if i % 100 == 0:
-                print(f"   Создано {i} пользователей...")
-
-        print(f"   Всего создано {len(user_ids)} пользователей")
-        print(f"🎬 Тайтлы ({NUM_TITLES})...")
-        title_ids = []
-        
-        anime_titles = [
-            'Атака титанов', 'Наруто', 'Ван Пис', 'Тетрадь смерти', 'Стальной алхимик',
-            'Самурай Чамплу', 'Ковбой Бибоп', 'Евангелион', 'Токийский гуль', 'Берсерк',
-            'Ходячий замок', 'Унесённые призраками', 'Мой сосед Тоторо', 'Принцесса Мононоке',
-            'Форма голоса', 'Твоё имя', 'Дракон-горничная', 'Волейбол', 'Баскетбол Куроко',
-            'Чёрный клевер', 'Моб Психо 100', 'Ванпанчмен', 'Реинкарнация безработного',
-            'Восхождение в тени', 'Цепь смерти', 'Магическая битва', 'Демон-убийца'
-        ]
-        
-        for i in range(NUM_TITLES):
-            t_type = random.choice(['anime', 'manga'])
-            base_title = random.choice(anime_titles)
-            
-            canonical = f"{base_title} ({fake_en.word().title()}) #{i}"
-            russian = f"{fake.word().title()} {fake.word().title()} {i}"
-            
-            status = random.choice(['announced', 'ongoing', 'released', 'discontinued'])
-            start_date = fake.date_between(start_date='-15y', end_date='today')
-            
-            if status == 'released':
-                end_date = fake.date_between(start_date=start_date, end_date='today')
-            elif status == 'ongoing':
-                end_date = None
-            elif status == 'announced':
-                start_date = fake.date_between(start_date='today', end_date='+2y')
-                end_date = None
-            else:  
-                end_date = fake.date_between(start_date=start_date, end_date='today')
-            
-            if t_type == 'anime':
-                episodes = random.randint(12, 100)
-                volumes = chapters = None
-            else:
-                episodes = None
-                volumes = random.randint(5, 50)
-                chapters = random.randint(20, 300)
-            
-            cur.execute("""
-                INSERT INTO titles (
-                    type, canonical_title, russian_title, synopsis, poster_url, status,
-                    start_date, end_date, episodes_count, volumes_count, chapters_count,
-                    total_score, vote_count, average_rating
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING id
-            """, (
-                t_type,
-                canonical,
-                russian,
-                fake.paragraph(nb_sentences=3),
-                f'https://placehold.co/300x450/2A2A3A/FFF?text={canonical.replace(" ", "+")}',
-                status,
-                start_date,
-                end_date,
-                episodes,
-                volumes,
-                chapters,
-                0, 0, None 
-            ))
-            tid = cur.fetchone()[0]
-            title_ids.append(tid)
-            
-            selected_genres = random.sample(genre_ids, k=random.randint(2, 4))
-            for gid in selected_genres:
-                cur.execute(
-                    "INSERT INTO title_genres (title_id, genre_id) VALUES (%s, %s)",
-                    (tid, gid)
-                )
-            
-            selected_studios = random.sample(studio_ids, k=random.randint(1, 2))
-            for sid in selected_studios:
-                cur.execute("""
-                    INSERT INTO title_studios (title_id, studio_id, role) 
-                    VALUES (%s, %s, %s)
-                """, (tid, sid, random.choice(['Production', 'Animation', 'Licensing'])))
-            
-            selected_authors = random.sample(author_ids, k=random.randint(1, 3))
-            for aid in selected_authors:
-                cur.execute("""
-                    INSERT INTO title_authors (title_id, author_id, role) 
-                    VALUES (%s, %s, %s)
-                """, (
-                    tid,
-                    aid,
-                    random.choice(['Original Creator', 'Director', 'Character Design', 'Screenplay'])
-                ))
-            
-            if i % 200 == 0:
-                print(f"   Создано {i} тайтлов...")
-        
-        print(f"   Всего создано {len(title_ids)} тайтлов")
-        
-        print("📚 Заполняем библиотеки пользователей...")
-        library_count = 0
-        
-        for idx, uid in enumerate(user_ids):
-            num_titles = random.randint(10, 50)
-            user_titles = random.sample(title_ids, k=num_titles)
-            
-            for tid in user_titles:
-                status = random.choices(
-                    ['planned', 'watching', 'completed', 'dropped', 'on_hold'],
-                    weights=[15, 25, 40, 10, 10]
-                )[0]
-                
-                if status == 'completed':
-                    progress = 100
-                    score = random.randint(7, 10) 
-                elif status == 'watching':
-                    progress = random.randint(1, 80)
-                    score = random.randint(5, 9) if random.random() > 0.5 else None
-                elif status == 'dropped':
-                    progress = random.randint(1, 30)
-                    score = random.randint(1, 5) if random.random() > 0.3 else None
-                else: 
-                    progress = 0
-                    score = None
-                
-                cur.execute("""
-                    INSERT INTO user_library 
-                    (user_id, title_id, status, progress, user_score, last_updated)
-                    VALUES (%s, %s, %s, %s, %s, %s)
-                """, (
+                users.write([
                     uid,
-                    tid,
-                    status,
-                    progress,
-                    score,
-                    fake.date_time_between(start_date='-1y', end_date='now')
-                ))
-                
-                library_count += 1
-            
-            if idx % 100 == 0:
-                print(f"   Обработано {idx} пользователей, {library_count} записей...")
-        
-        print(f"   Всего загружено {library_count} записей в библиотеки")
-        
-        print("📝 Отзывы...")
+                    f"{fake.user_name().replace(' ', '_').replace('.', '').lower()}{i}",
+                    f"{username_part}{i}{rng.randint(1000, 9999)}@example.com",
+                    PASSWORD_HASH,
+                    f'https://i.pravatar.cc/300?img={rng.randint(1, 70)}',
+                    random_datetime(rng, anchor, 730),
+                ])
+                profiles.write([
+                    uid,
+                    (anchor - timedelta(days=rng.randint(14 * 365, 45 * 365))).date(),
+                    fake.text(max_nb_chars=150),
+                ])
+            users.flush()
+            # Профили ссылаются на пользователей — отправляем после них
+            profiles.flush()
+        conn.commit()
+        return end - start
+    finally:
+        conn.close()
+
+
+def seed_titles_partition(task):
+    """Тайтлы с id в [start + 1, end] и их связи с жанрами, студиями и авторами"""
+    seed, partition, start, end, anchor = task
+    rng, fake, fake_en = make_rng(seed, 'titles', partition)
+    today = anchor.date()
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        with conn.cursor() as cur:
+            titles = CopyWriter(cur, 'titles', [
+                'id', 'type', 'canonical_title', 'russian_title', 'synopsis', 'poster_url', 'status',
+                'start_date', 'end_date', 'episodes_count', 'volumes_count', 'chapters_count',
+                'total_score', 'vote_count', 'average_rating'
+            ])
+            genre_links, studio_links, author_links = [], [], []
+            for i in range(start, end):
+                tid = i + 1
+                t_type = rng.choice(['anime', 'manga'])
+                canonical = f"{rng.choice(ANIME_TITLES)} ({fake_en.word().title()}) #{i}"
+                russian = f"{fake.word().title()} {fake.word().title()} {i}"
+
+                status = rng.choice(['announced', 'ongoing', 'released', 'discontinued'])
+                if status == 'announced':
+                    start_date = today + timedelta(days=rng.randint(0, 730))
+                    end_date = None
+                else:
+                    start_date = today - timedelta(days=rng.randint(0, 15 * 365))
+                    if status == 'ongoing':
+                        end_date = None
+                    else:
+                        end_date = start_date + timedelta(days=rng.randint(0, (today - start_date).days))
+
+                if t_type == 'anime':
+                    episodes = rng.randint(12, 100)
+                    volumes = chapters = None
+                else:
+                    episodes = None
+                    volumes = rng.randint(5, 50)
+                    chapters = rng.randint(20, 300)
+
+                titles.write([
+                    tid, t_type, canonical, russian,
+                    fake.paragraph(nb_sentences=3),
+                    f'https://placehold.co/300x450/2A2A3A/FFF?text={canonical.replace(" ", "+")}',
+                    status, start_date, end_date, episodes, volumes, chapters,
+                    0, 0, None
+                ])
+                for gid in rng.sample(range(1, len(GENRES) + 1), k=rng.randint(2, 4)):
+                    genre_links.append([tid, gid])
+                for sid in rng.sample(range(1, len(STUDIOS) + 1), k=rng.randint(1, 2)):
+                    studio_links.append([tid, sid, rng.choice(['Production', 'Animation', 'Licensing'])])
+                for aid in rng.sample(range(1, len(AUTHORS) + 1), k=rng.randint(1, 3)):
+                    author_links.append([
+                        tid, aid,
+                        rng.choice(['Original Creator', 'Director', 'Character Design', 'Screenplay'])
+                    ])
+            titles.flush()
+
+            for table, columns, rows in [
+                ('title_genres', ['title_id', 'genre_id'], genre_links),
+                ('title_studios', ['title_id', 'studio_id', 'role'], studio_links),
+                ('title_authors', ['title_id', 'author_id', 'role'], author_links),
+            ]:
+                links = CopyWriter(cur, table, columns)
+                for row in rows:
+                    links.write(row)
+                links.flush()
+        conn.commit()
+        return end - start
+    finally:
+        conn.close()
+
+
+def seed_library_partition(task):
+    """Библиотеки пользователей с id в [start + 1, end]"""
+    seed, partition, start, end, anchor, num_titles, library_min, library_max = task
+    rng = random.Random(f"{seed}:library:{partition}")
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        with conn.cursor() as cur:
+            library = CopyWriter(cur, 'user_library', [
+                'user_id', 'title_id', 'status', 'progress', 'user_score', 'last_updated'
+            ])
+            for i in range(start, end):
+                uid = i + 1
+                for tid in rng.sample(range(1, num_titles + 1), k=rng.randint(library_min, library_max)):
+                    status = rng.choices(
+                        ['planned', 'watching', 'completed', 'dropped', 'on_hold'],
+                        weights=[15, 25, 40, 10, 10]
+                    )[0]
+
+                    if status == 'completed':
+                        progress = 100
+                        score = rng.randint(7, 10)
+                    elif status == 'watching':
+                        progress = rng.randint(1, 80)
+                        score = rng.randint(5, 9) if rng.random() > 0.5 else None
+                    elif status == 'dropped':
+                        progress = rng.randint(1, 30)
+                        score = rng.randint(1, 5) if rng.random() > 0.3 else None
+                    else:
+                        progress = 0
+                        score = None
+
+                    library.write([uid, tid, status, progress, score, random_datetime(rng, anchor, 365)])
+            library.flush()
+        conn.commit()
+        return library.total
+    finally:
+        conn.close()
+
+
+def set_library_triggers(cur, enabled):
+    action = 'ENABLE' if enabled else 'DISABLE'
+    for trigger in BULK_DISABLED_TRIGGERS:
+        cur.execute(f"ALTER TABLE user_library {action} TRIGGER {trigger}")
+
+
+def recompute_after_bulk_load(cur, write_audit):
+    """То, что при построчной вставке делали trg_calculate_rating, trg_audit_library_add и trg_sync_user_stats_insert"""
+    cur.execute("""
+        UPDATE titles t
+        SET
+            total_score = s.total_score,
+            vote_count = s.vote_count,
+            average_rating = ROUND(s.total_score::DECIMAL / s.vote_count, 2)
+        FROM (
+            SELECT title_id, SUM(user_score) AS total_score, COUNT(user_score) AS vote_count
+            FROM user_library
+            WHERE user_score IS NOT NULL
+            GROUP BY title_id
+        ) s
+        WHERE t.id = s.title_id
+    """)
+    cur.execute("SELECT rebuild_user_stats()")
+    if write_audit:
         cur.execute("""
-            SELECT ul.user_id, ul.title_id 
+            INSERT INTO audit_log (
+                user_id, user_role, action_type, entity_type, entity_id, description, changes, event_timestamp
+            )
+            SELECT
+                ul.user_id,
+                'user',
+                'library_add',
+                'user_library',
+                ul.id,
+                'Добавлен тайтл "' || COALESCE(t.canonical_title, 'Unknown') || '" в библиотеку',
+                jsonb_build_object(
+                    'title_id', ul.title_id,
+                    'status', ul.status,
+                    'score', ul.user_score,
+                    'added_at', ul.last_updated
+                ),
+                ul.last_updated
             FROM user_library ul
-            WHERE ul.status = 'completed' AND ul.user_score IS NOT NULL
-            ORDER BY RANDOM()
-            LIMIT 5000
+            LEFT JOIN titles t ON t.id = ul.title_id
+            ORDER BY ul.id
         """)
-        review_candidates = cur.fetchall()
-        
-        for idx, (uid, tid) in enumerate(review_candidates):
-            if random.random() > 0.6:
-                created_at = fake.date_time_between(start_date='-6m', end_date='now')
-                
-                cur.execute("""
-                    INSERT INTO reviews (user_id, title_id, content, created_at, updated_at)
-                    VALUES (%s, %s, %s, %s, %s)
-                """, (
-                    uid,
-                    tid,
-                    '\n\n'.join([fake.paragraph() for _ in range(2)]),
-                    created_at,
-                    created_at 
-                ))
-            
-            if idx % 1000 == 0:
-                print(f"   Создано {idx} отзывов...")
-        
-        print("⚠️  Жалобы...")
-        cur.execute("SELECT id FROM reviews LIMIT 500")
-        review_ids = [r[0] for r in cur.fetchall()]
-        
-        cur.execute("SELECT id FROM users WHERE is_active = TRUE LIMIT 300")
-        active_user_ids = [r[0] for r in cur.fetchall()]
-        
-        for i in range(300):
-            reporter_id = random.choice(active_user_ids)
-            entity_type = random.choice(['review', 'user_avatar'])
-            
-            if entity_type == 'review' and review_ids:
-                entity_id = random.choice(review_ids)
-                cur.execute("SELECT user_id FROM reviews WHERE id = %s", (entity_id,))
-                result = cur.fetchone()
-                reported_id = result[0] if result else random.choice(active_user_ids)
-            else: 
-                reported_id = random.choice([uid for uid in active_user_ids if uid != reporter_id])
-                entity_id = reported_id
-            
-            status = random.choice(['pending', 'investigating', 'resolved', 'rejected'])
-            
-            if status == 'resolved':
-                resolution = random.choice(['content_removed', 'user_warned', 'user_banned', 'no_violation'])
-                resolved_at = fake.date_time_between(start_date='-2m', end_date='now')
-                resolved_by = random.choice(active_user_ids[:50])  
-                moderator_comment = fake.text(max_nb_chars=100)
-            else:
-                resolution = None
-                resolved_at = None
-                resolved_by = None
-                moderator_comment = None
-            
-            cur.execute("""
-                INSERT INTO reports (
-                    reporter_user_id, entity_type, entity_id, reported_user_id, reason,
-                    description, evidence_url, status, resolution, moderator_comment,
-                    created_at, resolved_at, resolved_by
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, (
-                reporter_id,
-                entity_type,
-                entity_id,
-                reported_id,
-                random.choice(['spam', 'offensive_language', 'inappropriate_content', 'spoiler', 'other']),
-                fake.text(max_nb_chars=200),
-                f'https://example.com/evidence/{random.randint(1, 1000)}.png' if random.random() > 0.5 else None,
-                status,
-                resolution,
-                moderator_comment,
-                fake.date_time_between(start_date='-6m', end_date='now'),
-                resolved_at,
-                resolved_by
-            ))
-        
-        print("   Создано 300 жалоб")
-        
-        print("📊 Аудит-лог...")
-        admin_ids = user_ids[:10]
-        moderator_ids = user_ids[10:30]
-        
-        for i in range(500):
-            if random.random() < 0.2:
-                user_id = None
-                user_role = 'system'
+
+
+def seed_reference_data(cur, seed, anchor):
+    rng, fake, _ = make_rng(seed, 'reference')
+
+    genres = CopyWriter(cur, 'genres', ['id', 'name', 'description'])
+    for gid, (name, desc) in enumerate(GENRES, start=1):
+        genres.write([gid, name, desc])
+    genres.flush()
+
+    studios = CopyWriter(cur, 'studios', ['id', 'name', 'type', 'country', 'founded_date'])
+    for sid, (name, s_type) in enumerate(STUDIOS, start=1):
+        studios.write([sid, name, s_type, 'Japan', (anchor - timedelta(days=rng.randint(5 * 365, 40 * 365))).date()])
+    studios.flush()
+
+    authors = CopyWriter(cur, 'authors', ['id', 'full_name', 'role'])
+    for aid, (name, role) in enumerate(AUTHORS, start=1):
+        authors.write([aid, name, role])
+    authors.flush()
+
+
+def seed_reviews_reports_audit(cur, seed, num_users, anchor):
+    rng, fake, _ = make_rng(seed, 'extras')
+
+    # Детерминированная выборка вместо ORDER BY RANDOM()
+    cur.execute("""
+        SELECT ul.user_id, ul.title_id
+        FROM user_library ul
+        WHERE ul.status = 'completed' AND ul.user_score IS NOT NULL
+        ORDER BY md5(ul.user_id::text || ':' || ul.title_id::text || ':' || %s)
+        LIMIT 5000
+    """, (str(seed),))
+    review_candidates = cur.fetchall()
+
+    # trg_update_review_timestamp ставит updated_at при вставке — на время загрузки отключаем
+    cur.execute("ALTER TABLE reviews DISABLE TRIGGER trg_update_review_timestamp")
+    reviews = CopyWriter(cur, 'reviews', ['id', 'user_id', 'title_id', 'content', 'created_at', 'updated_at'])
+    review_authors = {}
+    for uid, tid in review_candidates:
+        if rng.random() > 0.6:
+            created_at = random_datetime(rng, anchor, 183)
+            rid = len(review_authors) + 1
+            review_authors[rid] = uid
+            reviews.write([
+                rid, uid, tid,
+                '\n\n'.join([fake.paragraph() for _ in range(2)]),
+                created_at, created_at
+            ])
+    reviews.flush()
+    cur.execute("ALTER TABLE reviews ENABLE TRIGGER trg_update_review_timestamp")
+    print(f"   Создано {reviews.total} отзывов")
+
+    print("⚠️  Жалобы...")
+    review_ids = list(review_authors)[:500]
+    active_user_ids = list(range(1, min(num_users, 300) + 1))
+
+    reports = CopyWriter(cur, 'reports', [
+        'reporter_user_id', 'entity_type', 'entity_id', 'reported_user_id', 'reason',
+        'description', 'evidence_url', 'status', 'resolution', 'moderator_comment',
+        'created_at', 'resolved_at', 'resolved_by'
+    ])
+    for _ in range(300 if len(active_user_ids) > 1 else 0):
+        reporter_id = rng.choice(active_user_ids)
+        entity_type = rng.choice(['review', 'user_avatar'])
+
+        if entity_type == 'review' and review_ids:
+            entity_id = rng.choice(review_ids)
+            reported_id = review_authors[entity_id]
+        else:
+            entity_type = 'user_avatar'
+            reported_id = rng.choice([uid for uid in active_user_ids if uid != reporter_id])
+            entity_id = reported_id
+
+        status = rng.choice(['pending', 'investigating', 'resolved', 'rejected'])
+
+        if status == 'resolved':
+            resolution = rng.choice(['content_removed', 'user_warned', 'user_banned', 'no_violation'])
+            resolved_at = random_datetime(rng, anchor, 61)
+            resolved_by = rng.choice(active_user_ids[:50])
+            moderator_comment = fake.text(max_nb_chars=100)
+        else:
+            resolution = None
+            resolved_at = None
+            resolved_by = None
+            moderator_comment = None
+
+        reports.write([
+            reporter_id, entity_type, entity_id, reported_id,
+            rng.choice(['spam', 'offensive_language', 'inappropriate_content', 'spoiler', 'other']),
+            fake.text(max_nb_chars=200),
+            f'https://example.com/evidence/{rng.randint(1, 1000)}.png' if rng.random() > 0.5 else None,
+            status, resolution, moderator_comment,
+            random_datetime(rng, anchor, 183),
+            resolved_at, resolved_by
+        ])
+    reports.flush()
+    print(f"   Создано {reports.total} жалоб")
+
+    print("📊 Аудит-лог...")
+    user_ids = list(range(1, num_users + 1))
+    admin_ids = user_ids[:10]
+    moderator_ids = user_ids[10:30] or admin_ids
+    regular_ids = user_ids[100:] or user_ids
+
+    audit = CopyWriter(cur, 'audit_log', [
+        'user_id', 'user_role', 'action_type', 'entity_type', 'entity_id', 'description', 'changes',
+        'event_timestamp'
+    ])
+    for _ in range(500):
+        if rng.random() < 0.2:
+            user_id = None
+            user_role = 'system'
+        else:
+            if rng.random() < 0.1:
+                user_id = rng.choice(admin_ids)
+                user_role = 'admin'
+            elif rng.random() < 0.3:
+                user_id = rng.choice(moderator_ids)
+                user_role = 'moderator'
             else:
-                if random.random() < 0.1: 
-                    user_id = random.choice(admin_ids)
-                    user_role = 'admin'
-                elif random.random() < 0.3: 
-                    user_id = random.choice(moderator_ids)
-                    user_role = 'moderator'
-                else:  
-                    user_id = random.choice(user_ids[100:]) 
-                    user_role = 'user'
-            
-            entity_type = random.choice(['title', 'review', 'user', 'studio', 'genre', 'author'])
-            entity_id = random.randint(1, 1000)
-            
-            changes = {
-                'old_value': fake.word(),
-                'new_value': fake.word(),
-                'changed_fields': random.sample(['title', 'status', 'description', 'rating'], 2),
-                'timestamp': datetime.now().isoformat()
-            }
-            
-            cur.execute("""
-                INSERT INTO audit_log (
-                    user_id, user_role, action_type, entity_type, entity_id, 
-                    description, changes
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s)
-            """, (
-                user_id,
-                user_role,
-                random.choice(['catalog_update', 'catalog_delete', 'review_create', 
-                              'review_update', 'user_block', 'system_event']),
-                entity_type,
-                entity_id,
-                fake.sentence(),
-                json.dumps(changes, ensure_ascii=False)  
-            ))
-        
-        print("   Создано 500 записей аудит-лога")
-        
-        
+                user_id = rng.choice(regular_ids)
+                user_role = 'user'
+
+        changes = {
+            'old_value': fake.word(),
+            'new_value': fake.word(),
+            'changed_fields': rng.sample(['title', 'status', 'description', 'rating'], 2),
+        }
+        event_timestamp = random_datetime(rng, anchor, 183)
+        changes['timestamp'] = event_timestamp.isoformat()
+
+        audit.write([
+            user_id,
+            user_role,
+            rng.choice(['catalog_update', 'catalog_delete', 'review_create',
+                        'review_update', 'user_block', 'system_event']),
+            rng.choice(['title', 'review', 'user', 'studio', 'genre', 'author']),
+            rng.randint(1, 1000),
+            fake.sentence(),
+            json.dumps(changes, ensure_ascii=False),
+            event_timestamp,
+        ])
+    audit.flush()
+    print(f"   Создано {audit.total} записей аудит-лога")
+
+
+def run_seed(args):
+    conn = psycopg2.connect(**DB_CONFIG)
+    conn.autocommit = False
+    cur = conn.cursor()
+    anchor = args.anchor
+    started = time.monotonic()
+    triggers_disabled = False
+
+    print("🚀 Начинаем заполнение базы данных...")
+    print(f"   Пользователей: {args.users}, тайтлов: {args.titles}, "
+          f"библиотека: {args.library_min}-{args.library_max}, seed: {args.seed}, воркеров: {args.workers}")
+
+    try:
+        print("🧹 Очистка старых данных...")
+        cur.execute("""
+            TRUNCATE TABLE
+                reports, audit_log, reviews, user_library,
+                title_authors, title_genres, title_studios,
+                titles, studios, genres, authors,
+                user_profiles, users, title_similarity_builds
+            RESTART IDENTITY CASCADE
+        """)
+
+        print("📚 Жанры, студии, авторы...")
+        seed_reference_data(cur, args.seed, anchor)
+        conn.commit()
+
+        print(f"👥 Пользователи ({args.users})...")
+        tasks = [(args.seed, p, start, end, anchor) for p, start, end in partitions(args.users, USERS_PER_PARTITION)]
+        print(f"   Всего создано {sum(run_partitioned(seed_users_partition, tasks, args.workers))} пользователей")
+
+        print(f"🎬 Тайтлы ({args.titles})...")
+        tasks = [(args.seed, p, start, end, anchor) for p, start, end in partitions(args.titles, TITLES_PER_PARTITION)]
+        print(f"   Всего создано {sum(run_partitioned(seed_titles_partition, tasks, args.workers))} тайтлов")
+
+        # Ключи заданы явно — подтягиваем последовательности
+        for table in ['users', 'titles', 'genres', 'studios', 'authors']:
+            cur.execute(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT MAX(id) FROM {table}))")
+
+        print("📚 Заполняем библиотеки пользователей...")
+        set_library_triggers(cur, enabled=False)
         conn.commit()
-        print("✅ База успешно заполнена!")
-        
+        triggers_disabled = True
+
+        tasks = [
+            (args.seed, p, start, end, anchor, args.titles, args.library_min, args.library_max)
+            for p, start, end in partitions(args.users, USERS_PER_PARTITION)
+        ]
+        print(f"   Всего загружено {sum(run_partitioned(seed_library_partition, tasks, args.workers))} записей в библиотеки")
+
+        print("🧮 Пересчёт рейтингов и аудита библиотек...")
+        recompute_after_bulk_load(cur, write_audit=not args.skip_library_audit)
+        # Жанры и рейтинги обновляли titles, и триггер проставил updated_at временем загрузки
+        cur.execute("ALTER TABLE titles DISABLE TRIGGER trg_update_title_timestamp")
+        cur.execute("UPDATE titles SET updated_at = %s", (anchor,))
+        cur.execute("ALTER TABLE titles ENABLE TRIGGER trg_update_title_timestamp")
+        set_library_triggers(cur, enabled=True)
+        conn.commit()
+        triggers_disabled = False
+
+        print("📝 Отзывы...")
+        seed_reviews_reports_audit(cur, args.seed, args.users, anchor)
+        cur.execute("SELECT setval(pg_get_serial_sequence('reviews', 'id'), GREATEST((SELECT MAX(id) FROM reviews), 1))")
+        conn.commit()
+
+        print("🔄 Материализованные представления...")
+        for view in ['view_genre_popularity']:
+            cur.execute(f"REFRESH MATERIALIZED VIEW {view}")
+        cur.execute("UPDATE matview_refresh_log SET refreshed_at = clock_timestamp()")
+        conn.commit()
+
+        conn.autocommit = True
+        cur.execute("ANALYZE")
+        print(f"✅ База успешно заполнена за {time.monotonic() - started:.1f} с!")
+
         print("\n📊 Статистика:")
         tables = ['users', 'titles', 'user_library', 'reviews', 'reports', 'audit_log']
         for table in tables:
             cur.execute(f"SELECT COUNT(*) FROM {table}")
             print(f"  {table}: {cur.fetchone()[0]:,} записей")
-        
+
         print("\n📈 Дополнительная статистика:")
         cur.execute("SELECT COUNT(*) FROM titles WHERE type = 'anime'")
         print(f"  Аниме: {cur.fetchone()[0]}")
-        
+
         cur.execute("SELECT COUNT(*) FROM titles WHERE type = 'manga'")
         print(f"  Манга: {cur.fetchone()[0]}")
-        
+
         cur.execute("SELECT AVG(average_rating) FROM titles WHERE vote_count > 0")
         avg_rating = cur.fetchone()[0]
         print(f"  Средний рейтинг всех тайтлов: {avg_rating if avg_rating else 'нет оценок'}")
@@ -471,15 +617,19 @@ def run_seed():
         cur.execute("SELECT AVG(user_score) FROM user_library WHERE user_score IS NOT NULL")
         avg_user_score = cur.fetchone()[0]
         print(f"  Средняя оценка пользователей: {avg_user_score if avg_user_score else 'нет оценок'}")
-        
+
     except Exception as e:
         print(f"❌ Ошибка: {e}")
         traceback.print_exc()
         conn.rollback()
         raise
     finally:
+        if triggers_disabled:
+            conn.rollback()
+            conn.autocommit = True
+            set_library_triggers(cur, enabled=True)
         cur.close()
         conn.close()
 
 if __name__ == "__main__":
-    run_seed()
\ No newline at end of file
+    run_seed(parse_args())
@@ -61,7 +61,20 @@ CREATE TABLE titles (
     
     total_score BIGINT DEFAULT 0,
     vote_count INTEGER DEFAULT 0,
-    average_rating DECIMAL(4,2)
+    average_rating DECIMAL(4,2),
+    
+    -- Копия title_genres для фильтрации по жанрам без JOIN; ведётся триггером trg_sync_title_genre_ids_*
+    genre_ids BIGINT[] NOT NULL DEFAULT '{}',
+    
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    
+    -- Полнотекстовый поиск: названия (вес A) и описание (вес B), русская морфология + simple
+    search_vector TSVECTOR GENERATED ALWAYS AS (
+        setweight(to_tsvector('russian'::regconfig, COALESCE(russian_title, '')), 'A') ||
+        setweight(to_tsvector('simple'::regconfig, canonical_title || ' ' || COALESCE(russian_title, '')), 'A') ||
+        setweight(to_tsvector('russian'::regconfig, COALESCE(synopsis, '')), 'B') ||
+        setweight(to_tsvector('simple'::regconfig, COALESCE(synopsis, '')), 'B')
+    ) STORED
 );
 
 ALTER TABLE titles ADD CONSTRAINT unique_title_type UNIQUE (canonical_title, type);
@@ -319,6 +332,91 @@ CREATE TABLE reports (
 COMMENT ON TABLE reports IS 'Жалобы пользователей на контент (система модерации)';
 
 
+-- =============================================
+-- ТАБЛИЦА: title_rating_deltas
+-- =============================================
+-- Режим отложенного рейтинга (RATING_AGGREGATION=deferred): изменения оценок
+-- только дописываются сюда, фоновый процесс приложения сворачивает их в titles
+CREATE TABLE title_rating_deltas (
+    id BIGSERIAL PRIMARY KEY,
+    title_id BIGINT NOT NULL,
+    score_delta BIGINT NOT NULL,
+    vote_delta INTEGER NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    
+    CONSTRAINT fk_title_rating_deltas_title 
+        FOREIGN KEY (title_id) 
+        REFERENCES titles(id) 
+        ON DELETE CASCADE
+);
+
+CREATE INDEX idx_title_rating_deltas_title ON title_rating_deltas(title_id);
+
+COMMENT ON TABLE title_rating_deltas IS 'Ещё не учтённые в titles изменения оценок (отложенный рейтинг)';
+
+-- =============================================
+-- ТАБЛИЦА: user_stats
+-- =============================================
+-- Сводка по библиотеке пользователя; ведётся триггерами trg_sync_user_stats_*
+CREATE TABLE user_stats (
+    user_id BIGINT PRIMARY KEY,
+    total_titles INTEGER NOT NULL DEFAULT 0,
+    planned_count INTEGER NOT NULL DEFAULT 0,
+    watching_count INTEGER NOT NULL DEFAULT 0,
+    completed_count INTEGER NOT NULL DEFAULT 0,
+    dropped_count INTEGER NOT NULL DEFAULT 0,
+    on_hold_count INTEGER NOT NULL DEFAULT 0,
+    score_sum BIGINT NOT NULL DEFAULT 0,
+    score_count INTEGER NOT NULL DEFAULT 0,
+    last_active TIMESTAMP,
+    
+    CONSTRAINT fk_user_stats_user 
+        FOREIGN KEY (user_id) 
+        REFERENCES users(id) 
+        ON DELETE CASCADE
+);
+
+-- Рейтинг пользователей по завершённым тайтлам
+CREATE INDEX idx_user_stats_completed ON user_stats(completed_count DESC, user_id);
+
+COMMENT ON TABLE user_stats IS 'Статистика библиотек пользователей (поддерживается триггерами)';
+
+-- =============================================
+-- ТАБЛИЦА: title_similarities
+-- =============================================
+-- Top-K похожих тайтлов по совместному присутствию в библиотеках.
+-- Заполняется офлайн-сборкой build_recommendations.py
+CREATE TABLE title_similarities (
+    title_id BIGINT NOT NULL,
+    rank SMALLINT NOT NULL,
+    similar_title_id BIGINT NOT NULL,
+    score REAL NOT NULL,
+    
+    PRIMARY KEY (title_id, rank),
+    CONSTRAINT fk_title_similarities_title 
+        FOREIGN KEY (title_id) 
+        REFERENCES titles(id) 
+        ON DELETE CASCADE,
+    CONSTRAINT fk_title_similarities_similar 
+        FOREIGN KEY (similar_title_id) 
+        REFERENCES titles(id) 
+        ON DELETE CASCADE
+);
+
+CREATE INDEX idx_title_similarities_similar ON title_similarities(similar_title_id);
+
+COMMENT ON TABLE title_similarities IS 'Похожие тайтлы (предрасчёт для рекомендаций)';
+
+-- Журнал сборок: от started_at последней сборки считается инкрементальная
+CREATE TABLE title_similarity_builds (
+    id BIGSERIAL PRIMARY KEY,
+    metric VARCHAR(10) NOT NULL CHECK (metric IN ('cosine', 'jaccard')),
+    is_full BOOLEAN NOT NULL,
+    started_at TIMESTAMP NOT NULL,
+    finished_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    titles_updated INTEGER NOT NULL
+);
+
 -- =============================================
 -- ИНДЕКСЫ ДЛЯ ПРОИЗВОДИТЕЛЬНОСТИ
 -- =============================================
@@ -331,9 +429,26 @@ CREATE INDEX IF NOT EXISTS idx_titles_canonical_btree ON titles (canonical_title
 CREATE INDEX IF NOT EXISTS idx_titles_canonical_lower_btree ON titles (lower(canonical_title));
 CREATE INDEX IF NOT EXISTS idx_titles_canonical_trgm_gin ON titles USING gin (canonical_title gin_trgm_ops);
 CREATE INDEX IF NOT EXISTS idx_titles_russian_trgm_gin ON titles USING gin (russian_title gin_trgm_ops);
+-- Выгрузка изменений: updated_since
+CREATE INDEX IF NOT EXISTS idx_titles_updated_at ON titles(updated_at);
+CREATE INDEX IF NOT EXISTS idx_user_library_last_updated ON user_library(last_updated);
+-- Библиотека пользователя: фильтр по статусу и сортировка по last_updated (id — ключ курсора)
+CREATE INDEX IF NOT EXISTS idx_user_library_user_status_updated ON user_library(user_id, status, last_updated, id);
+-- Фильтр по нескольким жанрам: genre_ids @> / && ARRAY[...]
+CREATE INDEX IF NOT EXISTS idx_titles_genre_ids_gin ON titles USING gin (genre_ids);
+-- Полнотекстовый поиск по названиям и описанию
+CREATE INDEX IF NOT EXISTS idx_titles_search_vector_gin ON titles USING gin (search_vector);
+-- Ранжированный поиск по названию: KNN (<<->) по обоим названиям одной строкой
+CREATE INDEX IF NOT EXISTS idx_titles_names_trgm_gist ON titles USING gist ((canonical_title || ' ' || COALESCE(russian_title, '')) gist_trgm_ops);
+-- Keyset-пагинация по рейтингу: ключ (COALESCE(average_rating, -1), vote_count, id)
+CREATE INDEX IF NOT EXISTS idx_titles_rating_keyset ON titles ((COALESCE(average_rating, -1)), vote_count, id);
 
 -- Индекс для audit_log
 CREATE INDEX idx_audit_log_timestamp ON audit_log(event_timestamp DESC);
+-- Keyset-пагинация журнала: ключ (event_timestamp, id), в т.ч. с фильтрами по типу
+CREATE INDEX IF NOT EXISTS idx_audit_log_timestamp_id ON audit_log(event_timestamp DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_audit_log_entity_timestamp ON audit_log(entity_type, event_timestamp DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_audit_log_action_timestamp ON audit_log(action_type, event_timestamp DESC, id DESC);
 
 -- =============================================
 -- ФУНКЦИИ
@@ -359,13 +474,37 @@ CREATE OR REPLACE FUNCTION fn_update_title_rating()
 RETURNS TRIGGER AS $$
 DECLARE
     v_title_id BIGINT;
+    v_score_delta BIGINT := 0;
+    v_vote_delta INTEGER := 0;
 BEGIN
+    -- Массовые операции (app/crud.py) пересчитывают рейтинг сами, одним запросом на пачку
+    IF current_setting('app.defer_rating', true) = 'on' THEN
+        RETURN COALESCE(NEW, OLD);
+    END IF;
+    
     IF TG_OP = 'DELETE' THEN
         v_title_id := OLD.title_id;
     ELSE
         v_title_id := NEW.title_id;
     END IF;
     
+    -- Отложенный режим: без блокировки строки тайтла, только запись дельты
+    IF current_setting('app.rating_aggregation', true) = 'deferred' THEN
+        IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.user_score IS NOT NULL THEN
+            v_score_delta := v_score_delta - OLD.user_score;
+            v_vote_delta := v_vote_delta - 1;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.user_score IS NOT NULL THEN
+            v_score_delta := v_score_delta + NEW.user_score;
+            v_vote_delta := v_vote_delta + 1;
+        END IF;
+        IF v_score_delta <> 0 OR v_vote_delta <> 0 THEN
+            INSERT INTO title_rating_deltas (title_id, score_delta, vote_delta)
+            VALUES (v_title_id, v_score_delta, v_vote_delta);
+        END IF;
+        RETURN COALESCE(NEW, OLD);
+    END IF;
+    
     IF TG_OP = 'INSERT' AND NEW.user_score IS NOT NULL THEN
         UPDATE titles 
         SET 
@@ -510,17 +649,15 @@ CREATE OR REPLACE FUNCTION get_user_rank(p_user_id BIGINT)
 RETURNS VARCHAR AS $$
 DECLARE
     v_completed_count INTEGER;
-    v_user_exists BOOLEAN;
 BEGIN
-    SELECT EXISTS(SELECT 1 FROM users WHERE id = p_user_id) INTO v_user_exists;
-    IF NOT v_user_exists THEN
+    SELECT COALESCE(s.completed_count, 0) INTO v_completed_count
+    FROM users u
+    LEFT JOIN user_stats s ON s.user_id = u.id
+    WHERE u.id = p_user_id;
+    IF NOT FOUND THEN
         RETURN 'Пользователь не найден';
     END IF;
     
-    SELECT COUNT(*) INTO v_completed_count
-    FROM user_library
-    WHERE user_id = p_user_id AND status = 'completed';
-    
     IF v_completed_count < 10 THEN
         RETURN 'Новичок';
     ELSIF v_completed_count < 50 THEN
@@ -533,6 +670,163 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql;
 
+-- Уведомление об изменении тайтла: payload "<type>:<id>" в канал title_changes.
+-- По нему приложение сбрасывает кэши (app/cache.py)
+CREATE OR REPLACE FUNCTION notify_title_change()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM pg_notify('title_changes', OLD.type || ':' || OLD.id);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM pg_notify('title_changes', NEW.type || ':' || NEW.id);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Жанры входят в ответ по тайтлу, поэтому изменение связи — тоже изменение тайтла
+CREATE OR REPLACE FUNCTION notify_title_genres_change()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_title_id BIGINT := COALESCE(NEW.title_id, OLD.title_id);
+    v_type VARCHAR;
+BEGIN
+    SELECT type INTO v_type FROM titles WHERE id = v_title_id;
+    IF v_type IS NOT NULL THEN
+        PERFORM pg_notify('title_changes', v_type || ':' || v_title_id);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Пересчёт titles.genre_ids по изменённым связям; на уровне оператора, чтобы
+-- массовая загрузка title_genres обновляла каждый тайтл один раз
+CREATE OR REPLACE FUNCTION refresh_title_genre_ids(p_title_ids BIGINT[])
+RETURNS VOID AS $$
+BEGIN
+    UPDATE titles t
+    SET genre_ids = COALESCE(
+        (SELECT array_agg(tg.genre_id ORDER BY tg.genre_id) FROM title_genres tg WHERE tg.title_id = t.id),
+        '{}'
+    )
+    WHERE t.id = ANY(p_title_ids);
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION sync_title_genre_ids()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM refresh_title_genre_ids(ARRAY(SELECT DISTINCT title_id FROM new_rows));
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM refresh_title_genre_ids(ARRAY(SELECT DISTINCT title_id FROM old_rows));
+    ELSE
+        PERFORM refresh_title_genre_ids(ARRAY(SELECT title_id FROM old_rows UNION SELECT title_id FROM new_rows));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION create_user_stats()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO user_stats (user_id)
+    SELECT id FROM new_rows
+    ON CONFLICT (user_id) DO NOTHING;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Изменение user_library переводится в приращения счётчиков: строки до изменения
+-- вычитаются, строки после — прибавляются, по одному UPSERT на пользователя за оператор.
+-- Таблицы переходов видны только в своих событиях, поэтому источник собирается динамически
+CREATE OR REPLACE FUNCTION sync_user_stats()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_changes TEXT;
+BEGIN
+    v_changes := CASE TG_OP
+        WHEN 'INSERT' THEN
+            'SELECT user_id, status, user_score, last_updated, 1 FROM new_rows'
+        WHEN 'DELETE' THEN
+            'SELECT user_id, status, user_score, NULL::TIMESTAMP, -1 FROM old_rows'
+        ELSE
+            'SELECT user_id, status, user_score, last_updated, 1 FROM new_rows
+             UNION ALL
+             SELECT user_id, status, user_score, NULL::TIMESTAMP, -1 FROM old_rows'
+    END;
+    
+    -- JOIN users: при каскадном удалении пользователя его строку не создаём заново
+    EXECUTE format($sql$
+        INSERT INTO user_stats AS s (
+            user_id, total_titles, planned_count, watching_count, completed_count,
+            dropped_count, on_hold_count, score_sum, score_count, last_active
+        )
+        SELECT
+            c.user_id,
+            SUM(c.sign),
+            COALESCE(SUM(c.sign) FILTER (WHERE c.status = 'planned'), 0),
+            COALESCE(SUM(c.sign) FILTER (WHERE c.status = 'watching'), 0),
+            COALESCE(SUM(c.sign) FILTER (WHERE c.status = 'completed'), 0),
+            COALESCE(SUM(c.sign) FILTER (WHERE c.status = 'dropped'), 0),
+            COALESCE(SUM(c.sign) FILTER (WHERE c.status = 'on_hold'), 0),
+            COALESCE(SUM(c.sign * c.user_score), 0),
+            COALESCE(SUM(c.sign) FILTER (WHERE c.user_score IS NOT NULL), 0),
+            MAX(c.last_updated)
+        FROM (%s) AS c(user_id, status, user_score, last_updated, sign)
+        JOIN users u ON u.id = c.user_id
+        GROUP BY c.user_id
+        ON CONFLICT (user_id) DO UPDATE SET
+            total_titles = s.total_titles + EXCLUDED.total_titles,
+            planned_count = s.planned_count + EXCLUDED.planned_count,
+            watching_count = s.watching_count + EXCLUDED.watching_count,
+            completed_count = s.completed_count + EXCLUDED.completed_count,
+            dropped_count = s.dropped_count + EXCLUDED.dropped_count,
+            on_hold_count = s.on_hold_count + EXCLUDED.on_hold_count,
+            score_sum = s.score_sum + EXCLUDED.score_sum,
+            score_count = s.score_count + EXCLUDED.score_count,
+            last_active = GREATEST(s.last_active, EXCLUDED.last_active)
+    $sql$, v_changes);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Полный пересчёт user_stats по user_library (начальное заполнение, массовая загрузка)
+CREATE OR REPLACE FUNCTION rebuild_user_stats()
+RETURNS VOID AS $$
+BEGIN
+    INSERT INTO user_stats AS s (
+        user_id, total_titles, planned_count, watching_count, completed_count,
+        dropped_count, on_hold_count, score_sum, score_count, last_active
+    )
+    SELECT
+        u.id,
+        COUNT(ul.id),
+        COUNT(*) FILTER (WHERE ul.status = 'planned'),
+        COUNT(*) FILTER (WHERE ul.status = 'watching'),
+        COUNT(*) FILTER (WHERE ul.status = 'completed'),
+        COUNT(*) FILTER (WHERE ul.status = 'dropped'),
+        COUNT(*) FILTER (WHERE ul.status = 'on_hold'),
+        COALESCE(SUM(ul.user_score), 0),
+        COUNT(ul.user_score),
+        MAX(ul.last_updated)
+    FROM users u
+    LEFT JOIN user_library ul ON ul.user_id = u.id
+    GROUP BY u.id
+    ON CONFLICT (user_id) DO UPDATE SET
+        total_titles = EXCLUDED.total_titles,
+        planned_count = EXCLUDED.planned_count,
+        watching_count = EXCLUDED.watching_count,
+        completed_count = EXCLUDED.completed_count,
+        dropped_count = EXCLUDED.dropped_count,
+        on_hold_count = EXCLUDED.on_hold_count,
+        score_sum = EXCLUDED.score_sum,
+        score_count = EXCLUDED.score_count,
+        last_active = EXCLUDED.last_active;
+END;
+$$ LANGUAGE plpgsql;
+
 -- =============================================
 -- ТРИГГЕРЫ 
 -- =============================================
@@ -547,6 +841,21 @@ BEFORE INSERT OR UPDATE ON reviews
 FOR EACH ROW
 EXECUTE FUNCTION fn_update_timestamp();
 
+-- Только при реальном изменении: пересчёт рейтинга часто пишет те же значения.
+-- Колонки перечислены явно: WHEN не может ссылаться на генерируемую search_vector (NEW.*),
+-- updated_at не сравнивается
+CREATE OR REPLACE TRIGGER trg_update_title_timestamp
+BEFORE UPDATE ON titles
+FOR EACH ROW
+WHEN ((OLD.type, OLD.canonical_title, OLD.russian_title, OLD.synopsis, OLD.poster_url, OLD.status,
+       OLD.start_date, OLD.end_date, OLD.episodes_count, OLD.volumes_count, OLD.chapters_count,
+       OLD.total_score, OLD.vote_count, OLD.average_rating, OLD.genre_ids)
+      IS DISTINCT FROM
+      (NEW.type, NEW.canonical_title, NEW.russian_title, NEW.synopsis, NEW.poster_url, NEW.status,
+       NEW.start_date, NEW.end_date, NEW.episodes_count, NEW.volumes_count, NEW.chapters_count,
+       NEW.total_score, NEW.vote_count, NEW.average_rating, NEW.genre_ids))
+EXECUTE FUNCTION fn_update_timestamp();
+
 CREATE OR REPLACE TRIGGER trg_calculate_rating
 AFTER INSERT OR UPDATE OF user_score OR DELETE ON user_library
 FOR EACH ROW
@@ -568,6 +877,70 @@ AFTER INSERT ON user_library
 FOR EACH ROW
 EXECUTE FUNCTION audit_library_add();
 
+CREATE OR REPLACE TRIGGER trg_notify_title_insert_delete
+AFTER INSERT OR DELETE ON titles
+FOR EACH ROW
+EXECUTE FUNCTION notify_title_change();
+
+-- fn_update_title_rating переписывает average_rating при каждом изменении оценки,
+-- уведомляем только если строка действительно поменялась
+CREATE OR REPLACE TRIGGER trg_notify_title_update
+AFTER UPDATE ON titles
+FOR EACH ROW
+WHEN (OLD.* IS DISTINCT FROM NEW.*)
+EXECUTE FUNCTION notify_title_change();
+
+CREATE OR REPLACE TRIGGER trg_notify_title_genres
+AFTER INSERT OR DELETE ON title_genres
+FOR EACH ROW
+EXECUTE FUNCTION notify_title_genres_change();
+
+-- Триггеры с таблицами переходов допускают только одно событие
+CREATE OR REPLACE TRIGGER trg_sync_title_genre_ids_insert
+AFTER INSERT ON title_genres
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION sync_title_genre_ids();
+
+CREATE OR REPLACE TRIGGER trg_sync_title_genre_ids_delete
+AFTER DELETE ON title_genres
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION sync_title_genre_ids();
+
+CREATE OR REPLACE TRIGGER trg_sync_title_genre_ids_update
+AFTER UPDATE ON title_genres
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION sync_title_genre_ids();
+
+CREATE OR REPLACE TRIGGER trg_create_user_stats
+AFTER INSERT ON users
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION create_user_stats();
+
+CREATE OR REPLACE TRIGGER trg_sync_user_stats_insert
+AFTER INSERT ON user_library
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION sync_user_stats();
+
+CREATE OR REPLACE TRIGGER trg_sync_user_stats_delete
+AFTER DELETE ON user_library
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION sync_user_stats();
+
+CREATE OR REPLACE TRIGGER trg_sync_user_stats_update
+AFTER UPDATE ON user_library
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION sync_user_stats();
+
+-- Для базы, где библиотеки заполнены до появления триггеров
+SELECT rebuild_user_stats();
+
 -- =============================================
 -- ПРЕДСТАВЛЕНИЯ (VIEW)
 -- =============================================
@@ -583,19 +956,10 @@ FROM titles
 WHERE type = 'anime' AND status = 'released'
 ORDER BY average_rating DESC NULLS LAST, vote_count DESC;
 
-CREATE OR REPLACE VIEW view_user_stats AS
-SELECT
-    u.id,
-    u.username,
-    COUNT(ul.id) AS total_titles,
-    COUNT(CASE WHEN ul.status = 'completed' THEN 1 END) AS completed_count,
-    COALESCE(ROUND(AVG(ul.user_score), 2), 0) AS avg_score,
-    MAX(ul.last_updated) AS last_active
-FROM users u
-LEFT JOIN user_library ul ON u.id = ul.user_id
-GROUP BY u.id, u.username;
-
-CREATE OR REPLACE VIEW view_genre_popularity AS
+-- Тяжёлые агрегаты — материализованные представления.
+-- Обновляются приложением через REFRESH MATERIALIZED VIEW CONCURRENTLY (app/matviews.py),
+-- для этого каждому нужен уникальный индекс.
+CREATE MATERIALIZED VIEW view_genre_popularity AS
 SELECT 
     g.name AS genre,
     COUNT(tg.title_id) AS titles_count,
@@ -604,4 +968,15 @@ FROM genres g
 JOIN title_genres tg ON g.id = tg.genre_id
 JOIN titles t ON tg.title_id = t.id
 GROUP BY g.id, g.name
-ORDER BY titles_count DESC;
\ No newline at end of file
+ORDER BY titles_count DESC;
+
+CREATE UNIQUE INDEX idx_view_genre_popularity_genre ON view_genre_popularity(genre);
+
+-- Время последнего обновления материализованных представлений (для возраста снимка)
+CREATE TABLE matview_refresh_log (
+    view_name VARCHAR(63) PRIMARY KEY,
+    refreshed_at TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp()
+);
+
+INSERT INTO matview_refresh_log (view_name)
+VALUES ('view_genre_popularity');
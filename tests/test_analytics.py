@@ -0,0 +1,60 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app import matviews
+from app.database import get_db
+from app.main import app
+
+
+class FakeResult:
+    def __init__(self, rows=None, value=None):
+        self.rows = rows or []
+        self.value = value
+
+    def mappings(self):
+        return self
+
+    def all(self):
+        return self.rows
+
+    def scalar(self):
+        return self.value
+
+
+class FakeSession:
+    def __init__(self, snapshot_age):
+        self.snapshot_age = snapshot_age
+        self.age_queries = 0
+
+    async def execute(self, query, params=None):
+        if "matview_refresh_log" in str(query):
+            self.age_queries += 1
+            return FakeResult(value=self.snapshot_age)
+        return FakeResult(rows=[{"genre": "Драма", "titles_count": 12, "genre_avg_rating": 7.5}])
+
+
+@pytest.fixture
+def session(monkeypatch):
+    # Фоновое обновление не запущено: возраст снимка известен только из matview_refresh_log
+    monkeypatch.setattr(matviews, "refresher", matviews.MatviewRefresher(None))
+    db = FakeSession(snapshot_age=42.7)
+
+    async def override_db():
+        yield db
+
+    app.dependency_overrides[get_db] = override_db
+    yield db
+    app.dependency_overrides.clear()
+
+
+def test_genre_popularity_snapshot_age_without_refresher(session):
+    client = TestClient(app)
+
+    first = client.get("/analytics/genre-popularity")
+    second = client.get("/analytics/genre-popularity")
+
+    assert first.status_code == 200
+    assert first.headers["X-Snapshot-Age"] == "42"
+    assert second.headers["X-Snapshot-Age"] in ("42", "43")
+    # Второй ответ — из кэша возраста, без повторного чтения журнала
+    assert session.age_queries == 1
@@ -0,0 +1,72 @@
+import threading
+
+from app.background import PeriodicWorker, SnapshotIndex
+
+
+class Session:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class DictIndex(SnapshotIndex):
+    """Снимок — словарь; _load отдаёт заранее заданные данные"""
+
+    def __init__(self, data, during_load=None):
+        super().__init__(Session, refresh_interval=60)
+        self.data = data
+        self.during_load = during_load
+        self.items = {}
+
+    def _load(self, db):
+        if self.during_load:
+            self.during_load()
+        return dict(self.data)
+
+    def _install_locked(self, snapshot):
+        self.items = snapshot
+
+    def _apply_locked(self, key, value):
+        if value is None:
+            self.items.pop(key, None)
+        else:
+            self.items[key] = value
+
+    def put(self, key, value):
+        with self._lock:
+            self._change_locked(key, value)
+
+
+def test_rebuild_replays_changes_made_during_load():
+    index = DictIndex({1: "a", 2: "b", 3: "c"})
+    # Пока читается БД, запись 2 удалена, а 4 добавлена — в прочитанном снимке этого ещё нет
+    index.during_load = lambda: (index.put(2, None), index.put(4, "d"))
+
+    index.rebuild()
+
+    assert index.ready
+    assert index.items == {1: "a", 3: "c", 4: "d"}
+    assert index._changes is None
+
+
+def test_changes_outside_rebuild_are_not_recorded():
+    index = DictIndex({})
+    index.rebuild()
+    index.put(1, "a")
+
+    assert index._changes is None
+    assert index.items == {1: "a"}
+
+
+def test_worker_wake_runs_task_before_interval():
+    calls = threading.Event()
+    worker = PeriodicWorker("test-worker", calls.set, interval=60, error_message="", wait_first=True)
+    worker.start()
+    try:
+        worker.wake()
+        assert calls.wait(2)
+    finally:
+        worker.stop()
+    assert not worker.running
@@ -0,0 +1,28 @@
+def titles(*names, status="released"):
+    return [{"canonical_title": name, "type": "anime", "status": status, "episodes_count": 12} for name in names]
+
+
+def test_batch_titles_counts_inserted_and_skipped(db_client):
+    first = db_client.post("/batch/titles", json=titles("A", "B", "C"))
+    # Дубликат внутри запроса и уже существующие тайтлы
+    second = db_client.post("/batch/titles", json=titles("B", "C", "D", "D"))
+
+    assert first.status_code == 200
+    assert (first.json()["inserted"], first.json()["updated"], first.json()["skipped"]) == (3, 0, 0)
+    assert (second.json()["inserted"], second.json()["updated"], second.json()["skipped"]) == (1, 0, 3)
+
+
+def test_batch_titles_update_counts_updated(db_client, fresh_db):
+    db_client.post("/batch/titles", json=titles("A", "B"))
+
+    response = db_client.post(
+        "/batch/titles", params={"on_conflict": "update", "chunk_size": 2},
+        json=titles("A", "B", "C", status="ongoing"),
+    )
+
+    body = response.json()
+    assert (body["inserted"], body["updated"], body["skipped"]) == (1, 2, 0)
+    assert [chunk["size"] for chunk in body["chunks"]] == [2, 1]
+    with fresh_db.cursor() as cur:
+        cur.execute("SELECT DISTINCT status FROM titles")
+        assert cur.fetchall() == [("ongoing",)]
@@ -0,0 +1,61 @@
+import random
+
+import pytest
+
+from app.leaderboard import FenwickTree, Leaderboard
+
+
+def test_fenwick_prefix_and_find_match_plain_sums():
+    rng = random.Random(1)
+    counts = [rng.randint(0, 5) for _ in range(37)]
+    tree = FenwickTree(counts)
+    tree.add(10, 3)
+    counts[10] += 3
+
+    for i in range(len(counts)):
+        assert tree.prefix(i) == sum(counts[:i + 1])
+    for k in range(1, sum(counts) + 1):
+        expected = next(i for i in range(len(counts)) if sum(counts[:i + 1]) >= k)
+        assert tree.find(k) == expected
+
+
+@pytest.fixture
+def board():
+    rng = random.Random(7)
+    board = Leaderboard(session_factory=None)
+    completed = {user_id: rng.randint(0, 40) for user_id in range(1, 201)}
+    for user_id, count in completed.items():
+        board.update(user_id, count)
+    # Пересчёт и удаление уже учтённых пользователей, рост дерева за пределы начального размера
+    for user_id in range(1, 21):
+        completed[user_id] = rng.randint(0, 120)
+        board.update(user_id, completed[user_id])
+    for user_id in range(21, 26):
+        del completed[user_id]
+        board.remove(user_id)
+    return board, completed
+
+
+def expected_order(completed):
+    return sorted(completed, key=lambda user_id: (-completed[user_id], user_id))
+
+
+def test_position_matches_sorted_ranking(board):
+    board, completed = board
+
+    for user_id, count in completed.items():
+        position = board.position(user_id)
+        assert position.rank == 1 + sum(1 for other in completed.values() if other > count)
+        assert position.total == len(completed)
+    assert board.position(21) is None
+
+
+@pytest.mark.parametrize("user_id", [1, 30, 100, 200])
+def test_around_returns_neighbours_in_ranking_order(board, user_id):
+    board, completed = board
+    order = expected_order(completed)
+    index = order.index(user_id)
+
+    window = board.around(user_id, 3)
+
+    assert [p.user_id for p in window] == order[max(0, index - 3):index + 4]
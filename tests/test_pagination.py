@@ -0,0 +1,110 @@
+from datetime import datetime
+
+import pytest
+
+from app import pagination
+
+
+def pages(client, url, params, cursor_param, limit):
+    """Пройти все страницы по X-Next-Cursor; вернуть список страниц"""
+    result, cursor = [], None
+    while True:
+        query = dict(params, limit=limit)
+        if cursor:
+            query[cursor_param] = cursor
+        response = client.get(url, params=query)
+        assert response.status_code == 200, response.text
+        result.append(response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            return result
+
+
+def ids(page_list):
+    return [item["id"] for page in page_list for item in page]
+
+
+def test_cursor_round_trip():
+    values = ["8.50", 12, 345]
+    assert pagination.decode_cursor(pagination.encode_cursor(values)) == values
+
+
+@pytest.mark.parametrize("cursor", ["not base64!", pagination.encode_cursor({"id": 1})[:-2], "e30"])
+def test_corrupted_cursor_is_rejected(cursor):
+    with pytest.raises(ValueError):
+        pagination.decode_cursor(cursor)
+
+
+@pytest.fixture
+def titles(fresh_db):
+    # Повторяющиеся рейтинги и число оценок и тайтлы без оценок — ключ различается только по id
+    ratings = [(8.5, 10), (8.5, 10), (8.5, 3), (7.0, 10), (None, 0), (None, 0), (9.1, 1), (7.0, 10)]
+    with fresh_db.cursor() as cur:
+        for i, (rating, votes) in enumerate(ratings):
+            cur.execute("""
+                INSERT INTO titles (type, canonical_title, status, average_rating, vote_count, total_score)
+                VALUES ('anime', %s, 'released', %s, %s, 0)
+            """, (f"Title {i}", rating, votes))
+
+
+@pytest.mark.parametrize("order", ["id", "rating"])
+@pytest.mark.parametrize("fields", [None, "id,average_rating"])
+def test_titles_keyset_pages_cover_list_once(db_client, titles, order, fields):
+    params = {"order": order}
+    if fields:
+        params["fields"] = fields
+    full = db_client.get("/titles/", params=dict(params, limit=100)).json()
+
+    paged = pages(db_client, "/titles/", params, "cursor", limit=3)
+
+    assert ids(paged) == [item["id"] for item in full]
+    assert len(full) == 8
+    assert all(len(page) <= 3 for page in paged)
+
+
+def test_titles_cursor_of_other_order_is_rejected(db_client, titles):
+    cursor = pagination.encode_cursor([5])
+    response = db_client.get("/titles/", params={"order": "rating", "cursor": cursor})
+    assert response.status_code == 400
+
+
+def test_audit_log_seek_pages_with_equal_timestamps(db_client, fresh_db):
+    with fresh_db.cursor() as cur:
+        # По три события на одну отметку времени — порядок внутри неё задаёт id
+        for i in range(9):
+            cur.execute("""
+                INSERT INTO audit_log (event_timestamp, user_role, action_type, entity_type, entity_id, description)
+                VALUES (%s, 'system', 'system_event', 'title', %s, 'test')
+            """, (datetime(2025, 1, 1 + i // 3), i))
+        cur.execute("SELECT id FROM audit_log ORDER BY event_timestamp DESC, id DESC")
+        expected = [row[0] for row in cur.fetchall()]
+
+    paged = pages(db_client, "/analytics/audit-log", {"entity_type": "title"}, "before", limit=2)
+
+    assert ids(paged) == expected
+
+
+@pytest.mark.parametrize("order", ["updated", "score", "title"])
+def test_user_library_keyset_pages_cover_library_once(db_client, fresh_db, order):
+    with fresh_db.cursor() as cur:
+        cur.execute("""
+            INSERT INTO users (username, email, password_hash) VALUES ('reader', 'reader@example.com', 'x')
+            RETURNING id
+        """)
+        user_id = cur.fetchone()[0]
+        for i, score in enumerate([7, 7, None, 9, 7, None, 3]):
+            # Аниме и манга с одним названием — равные ключи при сортировке по названию
+            cur.execute("""
+                INSERT INTO titles (type, canonical_title, status) VALUES (%s, %s, 'ongoing') RETURNING id
+            """, ("anime" if i % 2 else "manga", f"Title {i // 2}"))
+            title_id = cur.fetchone()[0]
+            cur.execute("""
+                INSERT INTO user_library (user_id, title_id, status, user_score, last_updated)
+                VALUES (%s, %s, 'watching', %s, %s)
+            """, (user_id, title_id, score, datetime(2025, 1, 1 + i % 2)))
+
+    full = db_client.get(f"/library/{user_id}", params={"order": order, "limit": 100}).json()
+    paged = pages(db_client, f"/library/{user_id}", {"order": order}, "cursor", limit=2)
+
+    assert ids(paged) == [item["id"] for item in full]
+    assert len(full) == 7
@@ -0,0 +1,52 @@
+import pytest
+from sqlalchemy import text
+
+from app.progress import ProgressBuffer
+
+
+@pytest.fixture
+def entry(fresh_db):
+    with fresh_db.cursor() as cur:
+        cur.execute("INSERT INTO users (username, email, password_hash) VALUES ('u', 'u@example.com', 'x') RETURNING id")
+        user_id = cur.fetchone()[0]
+        cur.execute("INSERT INTO titles (type, canonical_title, status) VALUES ('anime', 'Title', 'ongoing') RETURNING id")
+        title_id = cur.fetchone()[0]
+        cur.execute("INSERT INTO user_library (user_id, title_id, status, progress) VALUES (%s, %s, 'watching', 0)",
+                    (user_id, title_id))
+    return user_id, title_id
+
+
+def progress_of(fresh_db, user_id, title_id):
+    with fresh_db.cursor() as cur:
+        cur.execute("SELECT progress FROM user_library WHERE user_id = %s AND title_id = %s", (user_id, title_id))
+        return cur.fetchone()[0]
+
+
+def test_flush_writes_last_buffered_value(fresh_db, sync_sessions, entry):
+    buffer = ProgressBuffer(sync_sessions())
+    buffer.put(*entry, 3)
+    buffer.put(*entry, 5)
+
+    assert buffer.flush() == 1
+    assert progress_of(fresh_db, *entry) == 5
+    assert buffer.get(*entry) is None
+
+
+def test_flush_skips_rows_updated_after_batch_was_taken(fresh_db, sync_sessions, entry):
+    sessions = sync_sessions()
+    buffer = ProgressBuffer(sessions)
+    buffer.put(*entry, 5)
+    write = buffer._write
+
+    def write_after_full_update(rows):
+        # Обычное обновление записи между забором буфера и записью пачки
+        with sessions() as db:
+            db.execute(text("UPDATE user_library SET progress = 9, status = 'completed' WHERE user_id = :u AND title_id = :t"),
+                       {"u": entry[0], "t": entry[1]})
+            db.commit()
+        return write(rows)
+
+    buffer._write = write_after_full_update
+
+    assert buffer.flush() == 0
+    assert progress_of(fresh_db, *entry) == 9
@@ -0,0 +1,68 @@
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import text
+
+from app import ratings
+
+
+@pytest.fixture
+def title_with_votes(fresh_db, sync_sessions):
+    """Тайтл и оценки трёх пользователей, записанные в режиме deferred"""
+    with fresh_db.cursor() as cur:
+        cur.execute("INSERT INTO titles (type, canonical_title, status) VALUES ('anime', 'Title', 'released') RETURNING id")
+        title_id = cur.fetchone()[0]
+        cur.execute("""
+            INSERT INTO users (username, email, password_hash)
+            SELECT 'user' || i, 'user' || i || '@example.com', 'x' FROM generate_series(1, 3) i
+        """)
+    deferred = sync_sessions("deferred")
+    with deferred() as db:
+        db.execute(text("""
+            INSERT INTO user_library (user_id, title_id, status, user_score)
+            VALUES (1, :t, 'completed', 8), (2, :t, 'completed', 6), (3, :t, 'planned', NULL)
+        """), {"t": title_id})
+        db.execute(text("UPDATE user_library SET user_score = 10 WHERE user_id = 1"))
+        db.commit()
+    return title_id, deferred
+
+
+def rating(fresh_db, title_id):
+    with fresh_db.cursor() as cur:
+        cur.execute("SELECT total_score, vote_count, average_rating FROM titles WHERE id = %s", (title_id,))
+        return cur.fetchone()
+
+
+def test_deferred_votes_go_to_delta_table(fresh_db, title_with_votes):
+    title_id, _ = title_with_votes
+
+    assert rating(fresh_db, title_id) == (0, 0, None)
+    with fresh_db.cursor() as cur:
+        cur.execute("SELECT score_delta, vote_delta FROM title_rating_deltas ORDER BY id")
+        assert cur.fetchall() == [(8, 1), (6, 1), (2, 0)]
+
+
+def test_compactor_folds_deltas_in_batches(fresh_db, title_with_votes):
+    title_id, deferred = title_with_votes
+    compactor = ratings.RatingCompactor(deferred, batch=2)
+
+    assert compactor.compact() == 2
+    assert compactor.compact() == 1
+    assert compactor.compact() == 0
+    assert rating(fresh_db, title_id) == (16, 2, Decimal("8.00"))
+    with fresh_db.cursor() as cur:
+        cur.execute("SELECT count(*) FROM title_rating_deltas")
+        assert cur.fetchone()[0] == 0
+
+
+@pytest.mark.parametrize("compact_first", [False, True])
+def test_exact_read_counts_each_vote_once(db_client, monkeypatch, title_with_votes, compact_first):
+    title_id, deferred = title_with_votes
+    monkeypatch.setattr(ratings, "DEFERRED", True)
+    if compact_first:
+        ratings.RatingCompactor(deferred, batch=2).compact()
+
+    body = db_client.get(f"/titles/{title_id}", params={"exact": "true"}).json()
+
+    assert body["vote_count"] == 2
+    assert Decimal(str(body["average_rating"])) == Decimal("8.00")
@@ -0,0 +1,26 @@
+def test_init_sql_creates_schema(fresh_db):
+    with fresh_db.cursor() as cur:
+        cur.execute("""
+            SELECT count(*) FROM pg_trigger
+            WHERE tgname = 'trg_update_title_timestamp' AND tgrelid = 'titles'::regclass
+        """)
+        assert cur.fetchone()[0] == 1
+        # Последние объекты init.sql: схема применилась целиком
+        cur.execute("SELECT to_regclass('user_stats') IS NOT NULL, to_regclass('title_similarities') IS NOT NULL")
+        assert cur.fetchone() == (True, True)
+
+
+def test_title_updated_at_changes_only_on_real_update(fresh_db):
+    with fresh_db.cursor() as cur:
+        cur.execute("""
+            INSERT INTO titles (type, canonical_title, status, updated_at)
+            VALUES ('anime', 'Title', 'released', '2000-01-01')
+            RETURNING id
+        """)
+        title_id = cur.fetchone()[0]
+
+        cur.execute("UPDATE titles SET vote_count = vote_count WHERE id = %s RETURNING updated_at", (title_id,))
+        assert cur.fetchone()[0].year == 2000
+
+        cur.execute("UPDATE titles SET synopsis = 'Описание' WHERE id = %s RETURNING updated_at", (title_id,))
+        assert cur.fetchone()[0].year > 2000
@@ -0,0 +1,99 @@
+from datetime import date
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.exc import OperationalError
+
+from app import cache, ratings
+from app.database import get_db
+from app.genres import directory as genre_directory
+from app.main import app
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def all(self):
+        return self.rows
+
+
+class FakeSession:
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def execute(self, query):
+        return FakeResult(self.rows)
+
+    async def rollback(self):
+        pass
+
+
+@pytest.fixture
+def client(monkeypatch):
+    rows = [SimpleNamespace(id=1, canonical_title="Title", start_date=date(2020, 4, 1))]
+
+    async def override_db():
+        yield FakeSession(rows)
+
+    async def resolve(db, names):
+        return []
+
+    async def get_or_load(key, loader):
+        return {
+            "total": 1,
+            "type": {"anime": 1},
+            "status": {"released": 1},
+            "year": {2020: 1},
+            "genre_ids": {},
+        }
+
+    monkeypatch.setattr(genre_directory, "resolve", resolve)
+    monkeypatch.setattr(cache.facets, "get_or_load", get_or_load)
+    app.dependency_overrides[get_db] = override_db
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+
+def test_advanced_search_fields_with_facets(client):
+    response = client.get("/titles/search/advanced", params={"fields": "id,canonical_title", "facets": "true"})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["items"] == [{"id": 1, "canonical_title": "Title"}]
+    assert body["total"] == 1
+    assert body["facets"]["year"] == {"2020": 1}
+    assert body["facets"]["type"] == {"anime": 1}
+
+
+def test_read_title_exact_database_error(client, monkeypatch):
+    async def get_title_exact(db, title_id):
+        raise OperationalError("SELECT", {}, Exception("connection lost"))
+
+    monkeypatch.setattr(ratings, "DEFERRED", True)
+    monkeypatch.setattr(ratings, "get_title_exact", get_title_exact)
+    response = client.get("/titles/1", params={"exact": "true"})
+
+    assert response.status_code == 500
+    assert response.json()["detail"].startswith("Ошибка базы данных")
+
+
+def test_read_title_exact_adds_pending_deltas(client, monkeypatch):
+    title = SimpleNamespace(
+        id=1, type="anime", canonical_title="Title", russian_title=None, synopsis=None, poster_url=None,
+        status="released", start_date=None, end_date=None, episodes_count=12, volumes_count=None,
+        chapters_count=None, total_score=16, vote_count=2, average_rating=Decimal("8.00"), genres=[],
+    )
+
+    async def get_title_exact(db, title_id):
+        return title, 5, 1
+
+    monkeypatch.setattr(ratings, "DEFERRED", True)
+    monkeypatch.setattr(ratings, "get_title_exact", get_title_exact)
+    response = client.get("/titles/1", params={"exact": "true"})
+
+    assert response.status_code == 200
+    assert response.json()["vote_count"] == 3
+    assert Decimal(str(response.json()["average_rating"])) == Decimal("7.00")